@@ -1,5 +1,10 @@
 
 import os
+import asyncio
+import json
+import queue
+import threading
+import time
 import httpx # Required for asynchronous HTTP requests to the Gemini API
 from dotenv import load_dotenv # Required to load environment variables from a .env file
 from contextlib import asynccontextmanager
@@ -7,12 +12,29 @@ from contextlib import asynccontextmanager
 # --- ADD THIS IMPORT ---
 import uvicorn 
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from transformers import AutoTokenizer, AutoModel
-import torch
-import chromadb
+from typing import Optional
+
+from batcher import MicroBatcher
+from embedding_cache import EmbeddingCache
+from chunking import POOLING_STRATEGIES, sliding_windows, pool_chunks, merge_maxsim_results
+from engines import load_engine
+from inference_executor import InferenceExecutor, QueueFullError
+from response_cache import ResponseCache, SingleFlight, prompt_key
+from gemini_client import GeminiClient
+from vector_index import NumpyIndex
+from snapshot import read_manifest as read_snapshot_manifest
+from journal_store import JournalStore, MANIFEST_FILE as JOURNAL_STORE_MANIFEST
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+from search_cache import EPOCH_KEY, SearchResultCache
+from paper_sessions import PassageBuilder, SessionStore, split_passages
+from extraction import UnsupportedDocumentError, document_kind, open_document
+from upload_stream import StreamingUpload, UploadError
+from ivfpq import IVFPQIndex, journal_votes, META_FILE as PAPER_INDEX_MANIFEST
+from metrics import REGISTRY, SIZE_BUCKETS, span, start_request_timing, end_request_timing, server_timing_header
 # The CloudClient method in your original code doesn't typically need Settings
 # from chromadb.config import Settings 
 
@@ -25,6 +47,130 @@ load_dotenv()
 GEMINI_KEY = os.getenv("GEMINI_API_KEY")
 CHROMA_API_KEY = os.getenv("CHROMA_API_KEY") # This is not strictly used below, but kept for context
 
+# Gemini endpoint. Point GEMINI_API_BASE at a local stand-in (see mock_gemini.py) for offline testing.
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+
+# Gemini flow control: client-side rate limit (requests/s, adapts down on 429s), cap on
+# concurrent upstream requests, retries with jittered exponential backoff, and pool tuning.
+GEMINI_RATE_PER_S = float(os.getenv("GEMINI_RATE_PER_S", "5"))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "5"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "4"))
+GEMINI_BACKOFF_BASE_S = float(os.getenv("GEMINI_BACKOFF_BASE_S", "0.5"))
+GEMINI_BACKOFF_MAX_S = float(os.getenv("GEMINI_BACKOFF_MAX_S", "20"))
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "20"))
+GEMINI_KEEPALIVE_EXPIRY_S = float(os.getenv("GEMINI_KEEPALIVE_EXPIRY_S", "60"))
+
+# /generate response cache: identical prompts within the TTL are answered without calling
+# Gemini, and concurrent identical prompts share a single upstream request.
+GENERATE_CACHE_TTL_S = float(os.getenv("GENERATE_CACHE_TTL_S", "600"))
+GENERATE_CACHE_MAX_ENTRIES = int(os.getenv("GENERATE_CACHE_MAX_ENTRIES", "1000"))
+GENERATE_CACHE_MAX_CHARS = int(os.getenv("GENERATE_CACHE_MAX_CHARS", "5000000"))
+
+# Micro-batching of SciBERT inference across concurrent requests.
+# Requests arriving within EMBED_MAX_WAIT_MS of each other share one forward pass.
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "16"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+# Long-document mode: embed the whole text as overlapping 512-token windows instead of
+# truncating it, then combine windows with CHUNK_POOLING ("mean", "weighted" or "maxsim")
+EMBED_CHUNKING = os.getenv("EMBED_CHUNKING", "false").lower() in ("1", "true", "yes")
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "64"))
+CHUNK_POOLING = os.getenv("CHUNK_POOLING", "mean").lower()
+# Dedicated inference executor: search jobs run on INFERENCE_MAX_WORKERS threads (keep this
+# at least EMBED_MAX_BATCH_SIZE so batches can fill), with at most INFERENCE_MAX_QUEUE
+# more waiting. Beyond that requests are shed with 503 + Retry-After.
+INFERENCE_MAX_WORKERS = int(os.getenv("INFERENCE_MAX_WORKERS", "16"))
+INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", "64"))
+INFERENCE_RETRY_AFTER_S = int(os.getenv("INFERENCE_RETRY_AFTER_S", "2"))
+# Upper bound on the number of papers accepted by /search_journals/batch
+BATCH_SEARCH_MAX_ITEMS = int(os.getenv("BATCH_SEARCH_MAX_ITEMS", "1000"))
+
+# Inference engine: "torch" (eager PyTorch), "onnx" or "onnx-int8" (ONNX Runtime, exported
+# once with `python engines.py export --out ./onnx_model --quantize`)
+EMBED_ENGINE = os.getenv("EMBED_ENGINE", "torch").lower()
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "./onnx_model")
+
+# Vector search backend: "chroma" (ChromaDB Cloud), "numpy" (in-process index loaded from
+# VECTOR_INDEX_PATH, built with `python vector_index.py build` or a `python snapshot.py export`
+# snapshot) or "chroma-local" (a PersistentClient at CHROMA_PERSIST_PATH, filled with
+# `python snapshot.py import`). The last two need no network access.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "./vector_index")
+CHROMA_PERSIST_PATH = os.getenv("CHROMA_PERSIST_PATH", "./chroma_data")
+
+# Columnar journal metadata (built with `python journal_store.py build`). When present, search
+# results are enriched locally with journal stats; set to an empty string to disable.
+JOURNAL_STORE_PATH = os.getenv("JOURNAL_STORE_PATH", "./journal_store")
+
+# Search routing: "dense" (SciBERT), "lexical" (BM25 over names/concepts/publishers, no model call),
+# "hybrid" (both, fused by reciprocal rank) or "auto", which picks by query length: up to
+# LEXICAL_MAX_QUERY_TERMS terms go lexical, up to HYBRID_MAX_QUERY_TERMS hybrid, longer ones dense.
+# "papers" (nearest recent papers, aggregated per journal) is only used when asked for explicitly.
+SEARCH_MODES = ("auto", "lexical", "dense", "hybrid", "papers")
+SEARCH_MODE = os.getenv("SEARCH_MODE", "auto").lower()
+LEXICAL_MAX_QUERY_TERMS = int(os.getenv("LEXICAL_MAX_QUERY_TERMS", "6"))
+HYBRID_MAX_QUERY_TERMS = int(os.getenv("HYBRID_MAX_QUERY_TERMS", "64"))
+# Candidates taken from each side before fusion in hybrid mode
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+# Journal metadata the BM25 index is built from at startup; empty disables lexical search
+LEXICAL_INDEX_SOURCE = os.getenv("LEXICAL_INDEX_SOURCE", "../db/journals_metadata.json")
+
+# Paper-level IVF-PQ index (built with `python ivfpq.py build`), used by the "papers" search mode.
+# PAPER_NPROBE cells are scanned per query (requests may override it), PAPER_SEARCH_K nearest
+# papers are retrieved, PAPER_RERANK of them re-scored with int8 codes when the index has them,
+# and each journal is scored by its best PAPER_VOTES_PER_JOURNAL papers.
+PAPER_INDEX_PATH = os.getenv("PAPER_INDEX_PATH", "./paper_index")
+PAPER_NPROBE = int(os.getenv("PAPER_NPROBE", "16"))
+PAPER_SEARCH_K = int(os.getenv("PAPER_SEARCH_K", "200"))
+PAPER_RERANK = int(os.getenv("PAPER_RERANK", "0"))
+PAPER_VOTES_PER_JOURNAL = int(os.getenv("PAPER_VOTES_PER_JOURNAL", "5"))
+
+# Search-result cache: dense index results keyed by the query vector (components rounded to
+# 1/SEARCH_CACHE_LEVELS), top_n and filters. Entries are dropped when the collection epoch,
+# bumped by the ingestion scripts on every upsert, changes; it is polled every
+# SEARCH_CACHE_EPOCH_POLL_S seconds, which is how long results may stay stale after an
+# upsert (eventually consistent within that bound). SEARCH_CACHE_MAX_ENTRIES=0 disables the cache.
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "10000"))
+SEARCH_CACHE_LEVELS = int(os.getenv("SEARCH_CACHE_LEVELS", "256"))
+SEARCH_CACHE_EPOCH_POLL_S = float(os.getenv("SEARCH_CACHE_EPOCH_POLL_S", "5"))
+
+# Paper chat sessions: an uploaded paper is split into PAPER_PASSAGE_WORDS-word passages
+# (overlapping by PAPER_PASSAGE_OVERLAP_WORDS), embedded once and stored under a session ID in
+# PAPER_SESSION_DB_PATH (shared by workers; empty = this process only). Each chat turn sends
+# the PAPER_CHAT_PASSAGES passages closest to the question to Gemini instead of the whole paper.
+PAPER_SESSION_DB_PATH = os.getenv("PAPER_SESSION_DB_PATH", "./cache/paper_sessions.sqlite3")
+PAPER_SESSION_TTL_S = float(os.getenv("PAPER_SESSION_TTL_S", "86400"))
+PAPER_SESSION_MEMORY = int(os.getenv("PAPER_SESSION_MEMORY", "64"))
+PAPER_SESSION_MAX_CHARS = int(os.getenv("PAPER_SESSION_MAX_CHARS", "500000"))
+PAPER_PASSAGE_WORDS = int(os.getenv("PAPER_PASSAGE_WORDS", "120"))
+PAPER_PASSAGE_OVERLAP_WORDS = int(os.getenv("PAPER_PASSAGE_OVERLAP_WORDS", "20"))
+PAPER_CHAT_PASSAGES = int(os.getenv("PAPER_CHAT_PASSAGES", "4"))
+
+# File uploads (POST /search_journals/upload): PDF, DOCX or text files up to UPLOAD_MAX_BYTES are
+# written to a temp file as the request body arrives (the limit is enforced while reading) and
+# parsed page by page while earlier pages are being embedded. At most UPLOAD_QUEUE_BATCHES
+# passage batches wait between the two, and text past PAPER_SESSION_MAX_CHARS is ignored.
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_OVERHEAD_BYTES = 64 * 1024  # multipart framing and form fields on top of the file
+UPLOAD_QUEUE_BATCHES = int(os.getenv("UPLOAD_QUEUE_BATCHES", "4"))
+
+# Embedding cache: in-memory LRU (bounded in MB) backed by a SQLite file shared by all workers.
+# Set EMBED_CACHE_DISK_PATH to an empty string to keep the cache in memory only.
+MODEL_REVISION = os.getenv("MODEL_REVISION", "main")
+EMBED_CACHE_MAX_MB = float(os.getenv("EMBED_CACHE_MAX_MB", "64"))
+EMBED_CACHE_DISK_PATH = os.getenv("EMBED_CACHE_DISK_PATH", "./cache/embeddings.sqlite3")
+
+# Startup: the model and index are loaded in the lifespan hook, not at import time.
+# With STARTUP_BACKGROUND_WARMUP the server starts accepting connections immediately and
+# /readyz reports 503 until loading and warm-up have finished.
+STARTUP_BACKGROUND_WARMUP = os.getenv("STARTUP_BACKGROUND_WARMUP", "false").lower() in ("1", "true", "yes")
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() in ("1", "true", "yes")
+
+# Per-stage timings as a Server-Timing response header: on every response with SERVER_TIMING,
+# otherwise only for requests that send "X-Server-Timing: 1". /metrics is always available.
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+
 # --- App Lifespan and Initialization (Best Practice for httpx.AsyncClient) ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -34,11 +180,63 @@ async def lifespan(app: FastAPI):
     """
     # STARTUP: Create a single httpx.AsyncClient for the entire application lifetime
     # This enables connection pooling and is much more efficient.
-    app.state.gemini_client = httpx.AsyncClient(timeout=30.0)
+    # Keep-alive connections are kept warm for GEMINI_KEEPALIVE_EXPIRY_S so follow-up chat turns
+    # skip the TCP/TLS handshake; the pool is sized to the concurrency cap plus headroom.
+    app.state.gemini_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        limits=httpx.Limits(
+            max_connections=GEMINI_MAX_CONNECTIONS,
+            max_keepalive_connections=GEMINI_MAX_CONNECTIONS,
+            keepalive_expiry=GEMINI_KEEPALIVE_EXPIRY_S,
+        ),
+    )
+    app.state.gemini = GeminiClient(
+        app.state.gemini_client,
+        rate=GEMINI_RATE_PER_S,
+        burst=GEMINI_BURST,
+        max_concurrency=GEMINI_MAX_CONCURRENCY,
+        max_retries=GEMINI_MAX_RETRIES,
+        backoff_base_s=GEMINI_BACKOFF_BASE_S,
+        backoff_max_s=GEMINI_BACKOFF_MAX_S,
+    )
+    app.state.generate_cache = ResponseCache(
+        ttl_s=GENERATE_CACHE_TTL_S,
+        max_entries=GENERATE_CACHE_MAX_ENTRIES,
+        max_chars=GENERATE_CACHE_MAX_CHARS,
+    )
+    app.state.generate_flight = SingleFlight()
+    app.state.paper_sessions = SessionStore(
+        PAPER_SESSION_DB_PATH or None,
+        ttl_s=PAPER_SESSION_TTL_S,
+        max_memory_sessions=PAPER_SESSION_MEMORY,
+    )
     print("Application started. Gemini AsyncClient initialized.")
+
+    app.state.inference_executor = InferenceExecutor(
+        max_workers=INFERENCE_MAX_WORKERS,
+        max_queue=INFERENCE_MAX_QUEUE,
+        name="scibert-inference",
+    )
+
+    # Load the model and index off the event loop, either before serving or in the background
+    app.state.ready = False
+    app.state.startup_error = None
+    app.state.startup_timings = {}
+    if STARTUP_BACKGROUND_WARMUP:
+        app.state.init_task = asyncio.create_task(asyncio.to_thread(run_initialization, app))
+    else:
+        await asyncio.to_thread(run_initialization, app)
+    app.state.epoch_task = asyncio.create_task(poll_collection_epoch(app))
     yield
     # SHUTDOWN: Close the client gracefully
+    app.state.epoch_task.cancel()
     await app.state.gemini_client.aclose()
+    app.state.inference_executor.shutdown()
+    app.state.paper_sessions.close()
+    if getattr(app.state, "embed_batcher", None) is not None:
+        app.state.embed_batcher.close()
+    if getattr(app.state, "embedding_cache", None) is not None:
+        app.state.embedding_cache.close()
     print("Application shut down. Gemini AsyncClient closed.")
 
 # Initialize FastAPI app with the lifespan manager
@@ -51,127 +249,1065 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# --- Metrics ---
+HTTP_REQUESTS = REGISTRY.counter("hackcors_http_requests_total", "HTTP requests by route and status.", ("method", "path", "status"))
+HTTP_LATENCY = REGISTRY.histogram("hackcors_http_request_duration_seconds", "HTTP request latency by route.", labelnames=("path",))
+EMBED_BATCH_SIZE = REGISTRY.histogram("hackcors_embed_batch_size", "Texts per model forward pass.", buckets=SIZE_BUCKETS)
+SEARCH_ROUTES = REGISTRY.counter("hackcors_search_routes_total", "Searches by the route that answered them.", ("route",))
+
+def collect_component_stats():
+    """Reports the counters the caches, batcher, executor and Gemini client already keep."""
+    state = app.state
+    families = [("hackcors_ready", "gauge", "1 once the model and index are loaded.", [({}, int(bool(getattr(state, "ready", False))))])]
+
+    executor = state.inference_executor.stats()
+    families += [
+        ("hackcors_inference_in_flight", "gauge", "Search jobs admitted to the inference executor.", [({}, executor["in_flight"])]),
+        ("hackcors_inference_queue_depth", "gauge", "Admitted search jobs waiting for a worker.", [({}, executor["queue_depth"])]),
+        ("hackcors_inference_rejected_total", "counter", "Search jobs shed because the queue was full.", [({}, executor["rejected"])]),
+    ]
+
+    cache = state.generate_cache.stats()
+    flight = state.generate_flight.stats()
+    families += [
+        ("hackcors_generate_cache_lookups_total", "counter", "/generate cache lookups by result.", [
+            ({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"]), ({"result": "bypass"}, cache["bypassed"]),
+        ]),
+        ("hackcors_generate_coalesced_total", "counter", "/generate calls that joined an identical in-flight call.", [({}, flight["coalesced"])]),
+    ]
+
+    gemini = state.gemini.stats()
+    families += [
+        ("hackcors_gemini_upstream_responses_total", "counter", "Gemini responses by HTTP status.", [
+            ({"status": status}, count) for status, count in gemini["status_counts"].items()
+        ]),
+        ("hackcors_gemini_retries_total", "counter", "Gemini requests retried.", [({}, gemini["retries"])]),
+        ("hackcors_gemini_rate_per_second", "gauge", "Current adaptive Gemini send rate.", [({}, gemini["current_rate_per_s"])]),
+    ]
+
+    if getattr(state, "ready", False):
+        embedding = state.embedding_cache.stats()
+        batcher = state.embed_batcher.stats()
+        families += [
+            ("hackcors_embedding_cache_lookups_total", "counter", "Embedding cache lookups by result.", [
+                ({"result": "memory_hit"}, embedding["memory_hits"]),
+                ({"result": "disk_hit"}, embedding["disk_hits"]),
+                ({"result": "miss"}, embedding["misses"]),
+            ]),
+            ("hackcors_embedding_cache_bytes", "gauge", "Bytes held by the in-memory embedding cache.", [({}, embedding["memory_bytes"])]),
+            ("hackcors_embedding_cache_evictions_total", "counter", "Vectors evicted from the in-memory embedding cache.",
+             [({}, embedding["memory_evictions"])]),
+            ("hackcors_embed_batches_total", "counter", "Micro-batches run by the embedding batcher.", [({}, batcher["batches_run"])]),
+        ]
+        if state.search_cache is not None:
+            search = state.search_cache.stats()
+            families += [
+                ("hackcors_search_cache_lookups_total", "counter", "Search-result cache lookups by result.", [
+                    ({"result": "hit"}, search["hits"]), ({"result": "miss"}, search["misses"]),
+                ]),
+                ("hackcors_search_cache_invalidations_total", "counter", "Search-result cache drops on a collection epoch change.",
+                 [({}, search["invalidations"])]),
+            ]
+    return families
+
+REGISTRY.add_collector(collect_component_stats)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Counts and times every request; attaches Server-Timing when enabled.
+
+    The latency histogram is observed once the response body has been sent,
+    so streamed responses (/generate/stream, upload progress) count their
+    full duration. Server-Timing has to go out with the headers, so for event
+    streams it reports the time until then as "headers" instead of "total".
+    """
+    token = start_request_timing()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except BaseException:
+        end_request_timing(token)
+        path = route_path(request)
+        HTTP_REQUESTS.inc(method=request.method, path=path, status=500)
+        HTTP_LATENCY.observe(time.perf_counter() - start, path=path)
+        raise
+    timings = end_request_timing(token)
+    path = route_path(request)
+    HTTP_REQUESTS.inc(method=request.method, path=path, status=response.status_code)
+    if SERVER_TIMING or request.headers.get("x-server-timing") == "1":
+        streamed = response.headers.get("content-type", "").startswith("text/event-stream")
+        elapsed = time.perf_counter() - start
+        response.headers["Server-Timing"] = server_timing_header(timings + [("headers" if streamed else "total", elapsed)])
+
+    body = response.body_iterator
+
+    async def observed_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            HTTP_LATENCY.observe(time.perf_counter() - start, path=path)
+
+    response.body_iterator = observed_body()
+    return response
+
+def route_path(request: Request) -> str:
+    # The route template, not the raw URL, keeps label cardinality bounded
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
 # --- Pydantic Models ---
 class PaperRequest(BaseModel):
     text: str
     top_n: int = 5
+    # Override the server's EMBED_CHUNKING / CHUNK_POOLING defaults for this request
+    chunked: Optional[bool] = None
+    pooling: Optional[str] = None
+    # Optional metadata filters, evaluated against the journal store (JOURNAL_STORE_PATH)
+    open_access: Optional[bool] = None
+    in_doaj: Optional[bool] = None
+    min_h_index: Optional[int] = None
+    min_2yr_mean_citedness: Optional[float] = None
+    concept: Optional[str] = None
+    # One of SEARCH_MODES; defaults to SEARCH_MODE. /search_journals/batch always searches dense.
+    mode: Optional[str] = None
+    # IVF cells scanned in "papers" mode (recall vs latency); defaults to PAPER_NPROBE
+    nprobe: Optional[int] = None
+
+FILTER_FIELDS = ("open_access", "in_doaj", "min_h_index", "min_2yr_mean_citedness", "concept")
+
+class BatchPaperRequest(BaseModel):
+    papers: list[PaperRequest]
+
+class PaperSessionRequest(BaseModel):
+    text: str
+
+class PaperChatRequest(BaseModel):
+    question: str
+    # Passages retrieved for this turn; defaults to PAPER_CHAT_PASSAGES
+    passages: Optional[int] = None
+    bypass_cache: bool = False
 
 class GeminiRequest(BaseModel):
     prompt: str
+    # Skip the response cache and request coalescing; the fresh reply still refreshes the cache
+    bypass_cache: bool = False
 
 class GeminiResponse(BaseModel):
     generated_text: str
 
 # --- Model and DB Initialization ---
 model_name = "allenai/scibert_scivocab_uncased"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModel.from_pretrained(model_name)
-# Determine the device to run the model on
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model.to(device)
-model.eval()
-
-# NOTE: Using hardcoded credentials and CloudClient as per your input.
-# In a real-world app, API key should be from os.getenv("CHROMA_API_KEY").
-try:
-    client = chromadb.CloudClient(
-        api_key='ck-CHSy34MLNps3LhzWLZ4GR1qUdRp6cej5hsFGo3u8v5vc', 
-        tenant='546518b2-9bd8-4dea-b95e-315ebf0146a9', 
-        database='hackcora' 
+
+def connect_chroma_collection():
+    """Connects to the ChromaDB Cloud collection, falling back to a failing mock."""
+    import chromadb
+    # NOTE: Using hardcoded credentials and CloudClient as per your input.
+    # In a real-world app, API key should be from os.getenv("CHROMA_API_KEY").
+    try:
+        client = chromadb.CloudClient(
+            api_key='ck-CHSy34MLNps3LhzWLZ4GR1qUdRp6cej5hsFGo3u8v5vc', 
+            tenant='546518b2-9bd8-4dea-b95e-315ebf0146a9', 
+            database='hackcora' 
+        )
+        # Kept so the collection epoch can be re-read (see read_collection_epoch)
+        app.state.chroma_client = client
+        return client.get_or_create_collection(name="updated_journals")
+    except Exception as e:
+        print(f"Warning: Could not connect to ChromaDB Cloud. Search functionality may fail. Error: {e}")
+        # Create a mock client/collection to allow the app to run (for testing other endpoints)
+        class MockCollection:
+            def query(self, *args, **kwargs):
+                raise Exception("ChromaDB connection failed. Cannot query journals.")
+        return MockCollection()
+
+def connect_local_chroma_collection():
+    """Opens the collection imported from a snapshot into a local PersistentClient."""
+    import chromadb
+    client = chromadb.PersistentClient(path=CHROMA_PERSIST_PATH)
+    app.state.chroma_client = client
+    collection = client.get_collection(name="updated_journals")
+    print(f"Opened local Chroma collection with {collection.count()} journals at '{CHROMA_PERSIST_PATH}'")
+    return collection
+
+def load_collection():
+    """Returns the configured vector search backend."""
+    if VECTOR_BACKEND == "numpy":
+        # Local index: the embedding matrix is memory-mapped, so loading is near-instant
+        index = NumpyIndex.load(VECTOR_INDEX_PATH)
+        print(f"Loaded local vector index with {index.count()} journals ({index.space} space) from '{VECTOR_INDEX_PATH}'")
+        snapshot = read_snapshot_manifest(VECTOR_INDEX_PATH)
+        if snapshot is not None and snapshot["model"] != model_name:
+            print(f"Warning: snapshot '{VECTOR_INDEX_PATH}' was embedded with {snapshot['model']}, not {model_name}")
+        return index
+    if VECTOR_BACKEND == "chroma-local":
+        return connect_local_chroma_collection()
+    return connect_chroma_collection()
+
+def read_collection_epoch():
+    """The epoch the ingestion scripts bump on every upsert; a local NumpyIndex never changes once loaded."""
+    collection = app.state.collection
+    client = getattr(app.state, "chroma_client", None)
+    if isinstance(collection, NumpyIndex) or client is None:
+        return 0
+    # A fresh read: Collection.metadata is only what the server returned when the handle was created
+    metadata = client.get_collection(name=collection.name).metadata or {}
+    return int(metadata.get(EPOCH_KEY, 0))
+
+async def poll_collection_epoch(app: FastAPI):
+    """Keeps the search-result cache on the current collection epoch."""
+    while True:
+        await asyncio.sleep(SEARCH_CACHE_EPOCH_POLL_S)
+        cache = getattr(app.state, "search_cache", None)
+        if cache is None or not app.state.ready:
+            continue
+        try:
+            cache.set_epoch(await asyncio.to_thread(read_collection_epoch))
+        except Exception as e:
+            print(f"Warning: Could not read the collection epoch: {e}")
+
+def load_journal_store():
+    """Returns the memory-mapped journal metadata store, or None if it has not been built."""
+    if not JOURNAL_STORE_PATH or not os.path.exists(os.path.join(JOURNAL_STORE_PATH, JOURNAL_STORE_MANIFEST)):
+        return None
+    store = JournalStore.load(JOURNAL_STORE_PATH)
+    print(f"Loaded journal store with {len(store)} journals from '{JOURNAL_STORE_PATH}'")
+    if not store.has_concepts:
+        print("Warning: the journal store has no concept data; requests with a concept filter are rejected (422)")
+    return store
+
+def load_lexical_index():
+    """Builds the BM25 index from LEXICAL_INDEX_SOURCE, or returns None if it is not available."""
+    if not LEXICAL_INDEX_SOURCE or not os.path.exists(LEXICAL_INDEX_SOURCE):
+        return None
+    index = LexicalIndex.from_metadata(LEXICAL_INDEX_SOURCE)
+    print(f"Built lexical index over {index.count()} journals from '{LEXICAL_INDEX_SOURCE}'")
+    return index
+
+def check_lexical_ids(collection, lexical_index, sample: int = 200) -> float:
+    """
+    Share of sampled dense-index ids that the BM25 index also has.
+
+    Hybrid search fuses the two rankings by id, so with no overlap it would
+    only interleave two lists and show journals twice.
+    """
+    if isinstance(collection, NumpyIndex):
+        dense_ids = collection.ids[:sample]
+    else:
+        dense_ids = collection.get(limit=sample, include=[])["ids"]
+    if not dense_ids:
+        return 0.0
+    lexical_ids = set(lexical_index.ids)
+    overlap = sum(journal_id in lexical_ids for journal_id in dense_ids) / len(dense_ids)
+    if overlap == 0.0:
+        print(f"Warning: none of {len(dense_ids)} sampled index ids (e.g. '{dense_ids[0]}') are in the lexical index "
+              f"(e.g. '{lexical_index.ids[0]}'); hybrid results will not be merged")
+    return overlap
+
+def load_paper_index():
+    """Returns the memory-mapped paper IVF-PQ index, or None if it has not been built."""
+    if not PAPER_INDEX_PATH or not os.path.exists(os.path.join(PAPER_INDEX_PATH, PAPER_INDEX_MANIFEST)):
+        return None
+    index = IVFPQIndex.load(PAPER_INDEX_PATH)
+    print(f"Loaded paper index with {index.count()} papers of {len(index.journal_ids)} journals from '{PAPER_INDEX_PATH}'")
+    return index
+
+# Tokenizer and engine loaded by preload_inference() in a pre-fork parent (serve.py); forked
+# workers reuse them, so the model weights are shared copy-on-write instead of loaded per worker.
+PRELOADED = {}
+
+def preload_inference():
+    """Loads the tokenizer and embedding engine into this process, before workers are forked."""
+    from transformers import AutoTokenizer
+
+    PRELOADED["tokenizer"] = AutoTokenizer.from_pretrained(model_name, revision=MODEL_REVISION)
+    PRELOADED["engine"] = load_engine(EMBED_ENGINE, model_name, revision=MODEL_REVISION, onnx_dir=ONNX_MODEL_DIR)
+    print(f"Preloaded embedding engine {PRELOADED['engine'].name} for forked workers")
+
+def initialize_inference(app: FastAPI):
+    """
+    Loads the tokenizer, embedding engine, caches and vector index onto app.state.
+
+    Each step is timed into app.state.startup_timings (milliseconds) so slow
+    cold starts can be attributed to a specific stage.
+    """
+    timings = app.state.startup_timings
+
+    def timed(step, fn):
+        start = time.perf_counter()
+        result = fn()
+        timings[step] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    # Imported here so that importing app.py stays cheap (tests, reload, worker spawn)
+    from transformers import AutoTokenizer
+
+    if PRELOADED:
+        app.state.tokenizer = PRELOADED["tokenizer"]
+        app.state.engine = PRELOADED["engine"]
+        print(f"Worker {os.getpid()} reusing the preloaded tokenizer and engine")
+    else:
+        app.state.tokenizer = timed("tokenizer_ms", lambda: AutoTokenizer.from_pretrained(model_name, revision=MODEL_REVISION))
+        # The engine owns the model weights and runtime (torch picks CUDA when available)
+        app.state.engine = timed("engine_ms", lambda: load_engine(EMBED_ENGINE, model_name, revision=MODEL_REVISION, onnx_dir=ONNX_MODEL_DIR))
+    print(f"Embedding engine: {app.state.engine.name}")
+
+    app.state.embedding_cache = timed("embedding_cache_ms", lambda: EmbeddingCache(
+        model_name,
+        # Engines differ slightly numerically (int8 most of all), so they never share entries
+        revision=f"{MODEL_REVISION}:{app.state.engine.name}",
+        max_bytes=int(EMBED_CACHE_MAX_MB * 1024 * 1024),
+        disk_path=EMBED_CACHE_DISK_PATH or None,
+    ))
+    # Shared batcher: concurrent embed_text calls are coalesced into embed_texts batches
+    app.state.embed_batcher = MicroBatcher(
+        embed_texts,
+        max_batch_size=EMBED_MAX_BATCH_SIZE,
+        max_wait_ms=EMBED_MAX_WAIT_MS,
+        name="scibert-batcher",
+    )
+    app.state.collection = timed("vector_index_ms", load_collection)
+    app.state.search_cache = None
+    if SEARCH_CACHE_MAX_ENTRIES > 0:
+        app.state.search_cache = SearchResultCache(SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_LEVELS)
+        try:
+            app.state.search_cache.set_epoch(timed("collection_epoch_ms", read_collection_epoch))
+        except Exception as e:
+            # Polling retries; until then entries are dropped as soon as the first epoch is read
+            print(f"Warning: Could not read the collection epoch: {e}")
+    app.state.journal_store = timed("journal_store_ms", load_journal_store)
+    app.state.index_store_rows = None
+    if app.state.journal_store is not None and isinstance(app.state.collection, NumpyIndex):
+        # Align local index rows with store rows once, so filter masks map across directly
+        app.state.index_store_rows = app.state.journal_store.rows_for_ids(app.state.collection.ids)
+    app.state.lexical_index = timed("lexical_index_ms", load_lexical_index)
+    app.state.lexical_store_rows = None
+    if app.state.journal_store is not None and app.state.lexical_index is not None:
+        app.state.lexical_store_rows = app.state.journal_store.rows_for_ids(app.state.lexical_index.ids)
+    app.state.lexical_id_overlap = None
+    if app.state.lexical_index is not None:
+        try:
+            app.state.lexical_id_overlap = round(check_lexical_ids(app.state.collection, app.state.lexical_index), 3)
+        except Exception as e:
+            print(f"Warning: Could not compare lexical and index ids: {e}")
+    app.state.paper_index = timed("paper_index_ms", load_paper_index)
+    app.state.paper_store_rows = None
+    if app.state.journal_store is not None and app.state.paper_index is not None:
+        app.state.paper_store_rows = app.state.journal_store.rows_for_ids(app.state.paper_index.journal_ids)
+
+    if STARTUP_WARMUP:
+        # The first forward pass is much slower than the rest (allocator, kernel selection),
+        # so pay it here instead of on the first user request.
+        warmup_vector = timed("warmup_forward_ms", lambda: embed_texts(["warm-up request for scibert"]))
+        try:
+            timed("warmup_query_ms", lambda: app.state.collection.query(query_embeddings=warmup_vector, n_results=1))
+        except Exception as e:
+            print(f"Warning: Warm-up query failed: {e}")
+
+def run_initialization(app: FastAPI):
+    """Runs initialize_inference, recording readiness or the startup error."""
+    start = time.perf_counter()
+    try:
+        initialize_inference(app)
+        app.state.startup_timings["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        app.state.ready = True
+        print(f"Inference ready. Startup timings: {app.state.startup_timings}")
+    except Exception as e:
+        app.state.startup_error = str(e)
+        print(f"Error during startup initialization: {e}")
+
+def require_ready():
+    """Rejects requests that need the model or index before startup has finished."""
+    if not getattr(app.state, "ready", False):
+        detail = "Search is still starting up. Please retry shortly."
+        if getattr(app.state, "startup_error", None):
+            detail = "Search failed to initialize. Check server console for details."
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+
+def overloaded_error() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Search is overloaded right now. Please retry shortly.",
+        headers={"Retry-After": str(INFERENCE_RETRY_AFTER_S)},
     )
-    collection = client.get_or_create_collection(name="updated_journals")
-except Exception as e:
-    print(f"Warning: Could not connect to ChromaDB Cloud. Search functionality may fail. Error: {e}")
-    # Create a mock client/collection to allow the app to run (for testing other endpoints)
-    class MockCollection:
-        def query(self, *args, **kwargs):
-            raise Exception("ChromaDB connection failed. Cannot query journals.")
-    collection = MockCollection()
+
+async def run_inference(fn, *args, **kwargs):
+    """Runs a blocking search job on the dedicated inference executor, shedding load when full."""
+    try:
+        return await app.state.inference_executor.run(fn, *args, **kwargs)
+    except QueueFullError:
+        raise overloaded_error()
 
 
 # --- Utility Functions ---
+def forward_mean_pool(input_ids, attention_mask):
+    """Runs one padded forward pass and mean-pools each row over its real tokens."""
+    return app.state.engine.embed(input_ids, attention_mask)
+
+def embed_texts(texts: list):
+    """Generates SciBERT embeddings for a batch of texts in one padded forward pass."""
+    EMBED_BATCH_SIZE.observe(len(texts))
+    with span("tokenize"):
+        encoded_input = app.state.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=512,
+            return_tensors="np"
+        )
+    # Returns one embedding (list of floats) per input text
+    return forward_mean_pool(encoded_input["input_ids"], encoded_input["attention_mask"]).tolist()
+
+def embed_document_chunks(text: str):
+    """
+    Embeds the full text as overlapping windows, all in a single padded batch.
+
+    Returns (vectors, lengths): one vector per window and the number of text
+    tokens in each window.
+    """
+    tokenizer = app.state.tokenizer
+    with span("tokenize"):
+        token_ids = tokenizer(text, add_special_tokens=False, truncation=False, verbose=False)["input_ids"]
+        # Leave room for [CLS] and [SEP] in every window
+        window = tokenizer.model_max_length if tokenizer.model_max_length <= 512 else 512
+        windows = sliding_windows(token_ids, window - 2, CHUNK_OVERLAP)
+        encoded_input = tokenizer.pad(
+            {"input_ids": [tokenizer.build_inputs_with_special_tokens(w) for w in windows]},
+            padding=True,
+            return_tensors="np",
+        )
+    vectors = forward_mean_pool(encoded_input["input_ids"], encoded_input["attention_mask"])
+    return vectors, [len(w) for w in windows]
+
 def embed_text(text: str):
     """Generates an embedding for the input text using the SciBERT model."""
-    encoded_input = tokenizer(
-        text,
-        padding=True,
-        truncation=True,
-        return_tensors="pt"
-    )
-    input_ids = encoded_input["input_ids"].to(device)
-    attention_mask = encoded_input["attention_mask"].to(device)
-    
-    with torch.no_grad():
-        outputs = model(input_ids=input_ids, attention_mask=attention_mask)
-        last_hidden_state = outputs.last_hidden_state
-    
-    # Calculate Mean Pooling (average of token embeddings, masked by attention)
-    input_mask_expanded = attention_mask.unsqueeze(-1).expand(last_hidden_state.size()).float()
-    sum_embeddings = torch.sum(last_hidden_state * input_mask_expanded, dim=1)
-    sum_mask = torch.clamp(input_mask_expanded.sum(dim=1), min=1e-9)
-    embedding = sum_embeddings / sum_mask
-    
+    embedding_cache = app.state.embedding_cache
+    with span("embed_cache"):
+        cached = embedding_cache.get(text)
+    if cached is not None:
+        return [cached.tolist()]
+
+    # Includes the wait for the micro-batch; its tokenize/forward/pool spans run on the batcher thread
+    with span("embed_batch"):
+        embedding = app.state.embed_batcher(text)
+    embedding_cache.put(text, embedding)
     # Returns a 2D list: [[...embedding...]]
-    return embedding.cpu().numpy().tolist()
+    return [embedding]
+
+def embed_many(texts: list):
+    """
+    Embeds many texts at once, for bulk callers like /search_journals/batch.
+
+    Cache hits are served directly; the remaining texts are sorted by length and
+    embedded in batches of EMBED_MAX_BATCH_SIZE, so each padded forward pass
+    holds texts of similar length and wastes little compute on padding.
+    """
+    embedding_cache = app.state.embedding_cache
+    embeddings = [None] * len(texts)
+    missing = []
+    for i, text in enumerate(texts):
+        cached = embedding_cache.get(text)
+        if cached is not None:
+            embeddings[i] = cached.tolist()
+        else:
+            missing.append(i)
+
+    missing.sort(key=lambda i: len(texts[i]))
+    for start in range(0, len(missing), EMBED_MAX_BATCH_SIZE):
+        chunk = missing[start:start + EMBED_MAX_BATCH_SIZE]
+        for i, embedding in zip(chunk, embed_texts([texts[i] for i in chunk])):
+            embedding_cache.put(texts[i], embedding)
+            embeddings[i] = embedding
+    return embeddings
+
+def paper_filters(paper: PaperRequest) -> dict:
+    """The metadata filters set on a request (unset fields are left out)."""
+    return {name: getattr(paper, name) for name in FILTER_FIELDS if getattr(paper, name) is not None}
+
+def filter_support_error(filters: dict):
+    """(status code, message) if these filters can't be applied, else None."""
+    store = app.state.journal_store
+    if filters and store is None:
+        return 501, "Metadata filters need the journal store. Build it with `python journal_store.py build`."
+    if filters.get("concept") and not store.has_concepts:
+        # Every concept would match nothing; say so instead of returning an empty result
+        return 422, "The concept filter is unavailable: the journal store was built from metadata without concepts."
+    return None
+
+def require_filter_support(filters: dict):
+    error = filter_support_error(filters)
+    if error is not None:
+        raise HTTPException(status_code=error[0], detail=error[1])
+
+RESULT_FIELDS = ("ids", "documents", "metadatas", "distances")
+
+def query_index(collection, query_embeddings, n_results: int, filters: dict = None):
+    """
+    Queries the index, restricted to journals matching `filters` (see paper_filters).
+
+    Each query vector is first looked up in the search-result cache; only the
+    misses reach the index, in one call, and are cached under the collection
+    epoch that was current when the query started.
+    """
+    cache = app.state.search_cache
+    if cache is None:
+        return _query_index(collection, query_embeddings, n_results, filters)
+
+    epoch = cache.epoch
+    with span("search_cache"):
+        keys = [cache.key(embedding, n_results, filters) for embedding in query_embeddings]
+        entries = [cache.get(key) for key in keys]
+    missing = [q for q, entry in enumerate(entries) if entry is None]
+    if missing:
+        results = _query_index(collection, [query_embeddings[q] for q in missing], n_results, filters)
+        for position, q in enumerate(missing):
+            entries[q] = {field: results[field][position] for field in RESULT_FIELDS}
+            cache.put(keys[q], entries[q], epoch)
+    return {field: [entry[field] for entry in entries] for field in RESULT_FIELDS}
+
+def _query_index(collection, query_embeddings, n_results: int, filters: dict = None):
+    """
+    The uncached index query.
+
+    The filter mask is applied during top-n selection rather than afterwards:
+    the local index masks scores before argpartition, and Chroma receives the
+    matching IDs as an allow-list. A restrictive filter therefore still yields
+    a full top_n without over-fetching.
+    """
+    with span("filter"):
+        mask = app.state.journal_store.filter_mask(**filters) if filters else None
+        allowed = None
+        if mask is not None and not isinstance(collection, NumpyIndex):
+            allowed = app.state.journal_store.ids_where(mask)
+
+    with span("index_query"):
+        if mask is None:
+            return collection.query(query_embeddings=query_embeddings, n_results=n_results)
+        if isinstance(collection, NumpyIndex):
+            rows = app.state.index_store_rows
+            return collection.query(query_embeddings=query_embeddings, n_results=n_results, mask=(rows >= 0) & mask[rows])
+        if not allowed:
+            return {key: [[] for _ in query_embeddings] for key in RESULT_FIELDS}
+        return collection.query(query_embeddings=query_embeddings, n_results=min(n_results, len(allowed)), ids=allowed)
+
+def choose_route(input_text: str, mode: str = None) -> str:
+    """Resolves a search mode to "lexical", "dense", "hybrid" or "papers"; "auto" routes by query length."""
+    mode = (mode or SEARCH_MODE).lower()
+    lexical_available = getattr(app.state, "lexical_index", None) is not None
+    if mode == "papers" and getattr(app.state, "paper_index", None) is None:
+        raise HTTPException(
+            status_code=501,
+            detail="Paper search is not available. Build the index with `python ivfpq.py build`."
+        )
+    if mode != "auto":
+        if mode in ("lexical", "hybrid") and not lexical_available:
+            raise HTTPException(
+                status_code=501,
+                detail="Lexical search is not available (LEXICAL_INDEX_SOURCE not found)."
+            )
+        return mode
+    if not lexical_available:
+        return "dense"
+    terms = len(tokenize(input_text))
+    if terms <= LEXICAL_MAX_QUERY_TERMS:
+        return "lexical"
+    if terms <= HYBRID_MAX_QUERY_TERMS:
+        return "hybrid"
+    return "dense"
+
+def query_lexical(input_text: str, top_n: int, filters: dict = None):
+    """BM25 results for a query (nested chromadb shape with "scores"); never touches the model."""
+    with span("lexical"):
+        mask = app.state.journal_store.filter_mask(**filters) if filters else None
+        if mask is not None:
+            rows = app.state.lexical_store_rows
+            mask = (rows >= 0) & mask[rows]
+        return app.state.lexical_index.query(input_text, top_n, mask=mask)
+
+def query_chroma_journals(collection, input_text: str, top_n: int, chunked: bool = None, pooling: str = None,
+                          filters: dict = None, route: str = "dense"):
+    """
+    Queries the ChromaDB collection for similar journals based on input text.
+
+    With route="hybrid" the dense and BM25 rankings (HYBRID_CANDIDATES deep each)
+    are fused by reciprocal rank before the top_n are taken.
+    """
+    if route != "hybrid":
+        return format_journal_results(query_dense(collection, input_text, top_n, chunked, pooling, filters), 0)
+
+    depth = max(top_n, HYBRID_CANDIDATES)
+    dense = query_dense(collection, input_text, depth, chunked, pooling, filters)
+    lexical = query_lexical(input_text, depth, filters)
+    with span("fusion"):
+        fused = reciprocal_rank_fusion([dense, lexical], top_n)
+    return format_journal_results(fused, 0)
+
+def query_dense(collection, input_text: str, top_n: int, chunked: bool = None, pooling: str = None,
+                filters: dict = None):
+    """Embeds the text and returns the raw single-query index results."""
+    chunked = EMBED_CHUNKING if chunked is None else chunked
+    pooling = (pooling or CHUNK_POOLING).lower()
+
+    if chunked and pooling == "maxsim":
+        # Match every window separately; each journal is scored by its closest window
+        vectors, _ = embed_document_chunks(input_text)
+        results = query_index(collection, vectors.tolist(), top_n, filters)
+        return merge_maxsim_results(results, top_n)
 
-def query_chroma_journals(collection, input_text: str, top_n: int):
-    """Queries the ChromaDB collection for similar journals based on input text."""
-    input_embedding = embed_text(input_text)
-    
     # query_embeddings expects a list of embeddings
-    results = collection.query(
-        query_embeddings=input_embedding,
-        n_results=top_n
-    )
-    
+    return query_index(collection, embed_document(input_text, chunked, pooling), top_n, filters)
+
+def embed_document(input_text: str, chunked: bool, pooling: str):
+    """One query embedding ([[...]]) for the text: embedded whole, or as pooled chunk vectors."""
+    if not chunked:
+        return embed_text(input_text)
+    embedding_cache = app.state.embedding_cache
+    variant = f"chunked:{pooling}:{CHUNK_OVERLAP}"
+    cached = embedding_cache.get(input_text, variant)
+    if cached is not None:
+        return [cached.tolist()]
+    vectors, lengths = embed_document_chunks(input_text)
+    document_vector = pool_chunks(vectors, lengths, pooling)
+    embedding_cache.put(input_text, document_vector, variant)
+    return [document_vector.tolist()]
+
+def query_papers(input_text: str, top_n: int, chunked: bool = None, pooling: str = None, filters: dict = None,
+                 nprobe: int = None):
+    """
+    Journals ranked by their nearest recent papers (nested chromadb shape with "scores").
+
+    The PAPER_SEARCH_K approximate nearest papers are aggregated into journal
+    scores (see ivfpq.journal_votes). Filters drop the papers of non-matching
+    journals before aggregation, so a restrictive filter can leave fewer than
+    top_n journals. Each result's document lists the titles of its closest papers.
+    """
+    chunked = EMBED_CHUNKING if chunked is None else chunked
+    pooling = (pooling or CHUNK_POOLING).lower()
+    # One vector per query: maxsim has no per-chunk equivalent here, so chunks are mean-pooled instead
+    embedding = embed_document(input_text, chunked, "mean" if pooling == "maxsim" else pooling)[0]
+    index = app.state.paper_index
+
+    with span("filter"):
+        journal_mask = None
+        if filters:
+            mask = app.state.journal_store.filter_mask(**filters)
+            if mask is not None:
+                rows = app.state.paper_store_rows
+                journal_mask = (rows >= 0) & mask[rows]
+    with span("paper_search"):
+        rows, sims = index.search(embedding, PAPER_SEARCH_K, nprobe or PAPER_NPROBE, PAPER_RERANK)
+    with span("journal_votes"):
+        ranked = journal_votes(rows, sims, index.paper_journals, top_n, PAPER_VOTES_PER_JOURNAL, journal_mask)
+    return {
+        "ids": [[index.journal_ids[journal] for journal, _, _ in ranked]],
+        "documents": [["Closest papers: " + "; ".join(index.title(row) for row in hits) for _, _, hits in ranked]],
+        "metadatas": [[{"name": index.journal_names[journal]} for journal, _, _ in ranked]],
+        "scores": [[score for _, score, _ in ranked]],
+    }
+
+def format_journal_results(results, query_index: int, top_n: int = None):
+    """Shapes the results of one query from a (multi-)query response into journal dicts."""
+    with span("format"):
+        return _format_journal_results(results, query_index, top_n)
+
+def _format_journal_results(results, query_index: int, top_n: int = None):
     journals_list = []
-    # Process the results from the first (and only) query
-    for i in range(len(results['ids'][0])):
+    store = getattr(app.state, "journal_store", None)
+    # Dense results carry distances (lower is better); lexical and hybrid ones BM25 / RRF scores (higher is better)
+    scores = results['distances'] if 'distances' in results else results['scores']
+    count = len(results['ids'][query_index])
+    if top_n is not None:
+        count = min(count, top_n)
+    for i in range(count):
         journal_info = {
-            "name": results['metadatas'][0][i].get("name", ""),
-            "description": results['documents'][0][i],
-            # Distance is typically a measure of dissimilarity (lower score is better)
-            "score": results['distances'][0][i] 
+            "name": results['metadatas'][query_index][i].get("name", ""),
+            "description": results['documents'][query_index][i],
+            "score": scores[query_index][i]
         }
+        if store is not None:
+            # O(1) local lookup instead of pulling metadata back from Chroma
+            journal = store.get(results['ids'][query_index][i])
+            if journal is not None:
+                journal_info["name"] = journal_info["name"] or journal["display_name"]
+                journal_info["journal"] = journal
         journals_list.append(journal_info)
     return journals_list
 
+def search_error_detail(e: Exception) -> str:
+    """Maps a search failure to a message that is safe to return to the client."""
+    error_detail = "Internal Server Error during search (Check server console for ChromaDB connection issues)."
+    if "Cannot query journals" in str(e):
+        error_detail = "ChromaDB connection or query failed. Check credentials and database status."
+    return error_detail
+
 # --- Endpoints ---
 
 @app.get("/")
 def read_root():
     """Simple health check endpoint."""
-    return {"status": "ok", "message": "FastAPI is running"}
+    return {"status": "ok", "message": "FastAPI is running", "ready": app.state.ready}
+
+@app.get("/healthz")
+async def liveness():
+    """Liveness probe: the process is up and serving HTTP."""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness():
+    """Readiness probe: 200 only once the model and index are loaded and warmed up."""
+    body = {
+        "ready": app.state.ready,
+        "startup_timings": app.state.startup_timings,
+        "error": app.state.startup_error,
+        # Tells pre-forked workers (serve.py) apart behind the shared socket
+        "pid": os.getpid(),
+    }
+    return JSONResponse(status_code=200 if app.state.ready else 503, content=body)
+
+@app.get("/stats")
+def read_stats():
+    """Runtime counters for the inference path and the Gemini proxy."""
+    stats = {
+        "generate_cache": app.state.generate_cache.stats(),
+        "generate_coalescing": app.state.generate_flight.stats(),
+        "gemini_upstream": app.state.gemini.stats(),
+        "inference_executor": app.state.inference_executor.stats(),
+        "paper_sessions": app.state.paper_sessions.stats(),
+    }
+    if app.state.ready:
+        stats.update({
+            "embed_engine": app.state.engine.name,
+            "embed_batcher": app.state.embed_batcher.stats(),
+            "embedding_cache": app.state.embedding_cache.stats(),
+        })
+        if app.state.search_cache is not None:
+            stats["search_cache"] = dict(app.state.search_cache.stats(), max_staleness_s=SEARCH_CACHE_EPOCH_POLL_S)
+        if app.state.lexical_index is not None:
+            stats["lexical_id_overlap"] = app.state.lexical_id_overlap
+    return stats
+
+@app.get("/metrics")
+def read_metrics():
+    """Prometheus text-format metrics: per-stage latency histograms, request and component counters."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.post("/search_journals")
-def search_journals(request: PaperRequest):
+async def search_journals(request: PaperRequest):
     """
     Performs a semantic search for relevant journals using SciBERT and ChromaDB.
+
+    Short keyword queries are answered from the BM25 index without running the
+    model; the response's "route" says which path ("lexical", "dense",
+    "hybrid" or "papers") produced the results.
     """
     if not request.text:
         raise HTTPException(status_code=400, detail="Input text is required")
+    require_ready()
+    if request.pooling and request.pooling.lower() not in POOLING_STRATEGIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown pooling strategy '{request.pooling}'. Expected one of: {', '.join(POOLING_STRATEGIES)}"
+        )
+    if request.mode and request.mode.lower() not in SEARCH_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown search mode '{request.mode}'. Expected one of: {', '.join(SEARCH_MODES)}"
+        )
+    filters = paper_filters(request)
+    require_filter_support(filters)
+    route = choose_route(request.text, request.mode)
     
     try:
-        top_journals = query_chroma_journals(collection, request.text, request.top_n)
-        return {"results": top_journals}
+        if route == "lexical":
+            # A few array operations: cheap enough to answer directly on the event loop
+            results = query_lexical(request.text, request.top_n, filters)
+            if results["ids"][0] or (request.mode or SEARCH_MODE).lower() != "auto":
+                SEARCH_ROUTES.inc(route=route)
+                return {"results": format_journal_results(results, 0), "route": route}
+            # No query term is in the index; the model can still match paraphrases
+            route = "dense"
+
+        if route == "papers":
+            results = await run_inference(
+                query_papers, request.text, request.top_n, chunked=request.chunked, pooling=request.pooling,
+                filters=filters, nprobe=request.nprobe
+            )
+            SEARCH_ROUTES.inc(route=route)
+            return {"results": format_journal_results(results, 0), "route": route}
+
+        # Embedding and the index query block, so they run on the inference executor
+        # and the event loop stays free for /generate and health checks.
+        top_journals = await run_inference(
+            query_chroma_journals,
+            app.state.collection, request.text, request.top_n, chunked=request.chunked, pooling=request.pooling,
+            filters=filters, route=route
+        )
+        SEARCH_ROUTES.inc(route=route)
+        return {"results": top_journals, "route": route}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in search_journals: {e}")
         # The exception message should be safe for the client
-        error_detail = "Internal Server Error during search (Check server console for ChromaDB connection issues)."
-        if "Cannot query journals" in str(e):
-             error_detail = "ChromaDB connection or query failed. Check credentials and database status."
-        raise HTTPException(status_code=500, detail=error_detail)
+        raise HTTPException(status_code=500, detail=search_error_detail(e))
 
-# --- Gemini API Endpoint ---
+def run_batch_search(papers: list, valid: list) -> dict:
+    """Embeds and queries the valid papers of a batch; returns item index -> result entry."""
+    items = {}
+    try:
+        embeddings = dict(zip(valid, embed_many([papers[i].text for i in valid])))
+        # One index call per distinct filter set (usually just one); each item is trimmed to its own top_n below
+        groups = {}
+        for i in valid:
+            groups.setdefault(tuple(sorted(paper_filters(papers[i]).items())), []).append(i)
+        for filter_key, group in groups.items():
+            results = query_index(
+                app.state.collection,
+                [embeddings[i] for i in group],
+                max(papers[i].top_n for i in group),
+                dict(filter_key),
+            )
+            for q, i in enumerate(group):
+                items[i] = {"results": format_journal_results(results, q, papers[i].top_n)}
+    except Exception as e:
+        print(f"Error in search_journals_batch: {e}")
+        for i in valid:
+            items[i] = {"error": search_error_detail(e)}
+    return items
 
-@app.post("/generate", response_model=GeminiResponse)
-async def generate_text_from_gemini(request_body: GeminiRequest):
+@app.post("/search_journals/batch")
+async def search_journals_batch(request: BatchPaperRequest):
     """
-    Accepts a prompt and returns text generated by the Gemini model.
+    Scores many manuscripts in one call.
+
+    All valid papers are embedded in length-sorted batches and sent to the index
+    as a single multi-vector query. Each item in the response carries either its
+    own "results" list or an "error" message, in the same order as the request.
+    """
+    if not request.papers:
+        raise HTTPException(status_code=400, detail="At least one paper is required")
+    if len(request.papers) > BATCH_SEARCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many papers in one batch ({len(request.papers)} > {BATCH_SEARCH_MAX_ITEMS})."
+        )
+
+    require_ready()
+
+    items = [None] * len(request.papers)
+    valid = []
+    for i, paper in enumerate(request.papers):
+        if not paper.text:
+            items[i] = {"error": "Input text is required"}
+        elif paper.top_n < 1:
+            items[i] = {"error": "top_n must be at least 1"}
+        elif (error := filter_support_error(paper_filters(paper))) is not None:
+            items[i] = {"error": error[1]}
+        else:
+            valid.append(i)
+
+    if valid:
+        searched = await run_inference(run_batch_search, request.papers, valid)
+        for i, entry in searched.items():
+            items[i] = entry
+
+    return {"results": items}
+
+# --- File uploads ---
+
+UPLOAD_JOBS = set()  # strong references, so running upload jobs are not garbage-collected
+
+async def receive_upload(request: Request) -> StreamingUpload:
+    """
+    Reads the multipart body as it arrives, writing the file part straight to a temp file.
+
+    The size limit is checked on every chunk, and an unsupported file type is
+    rejected as soon as its part headers arrive, before its body is read.
+    """
+    try:
+        upload = StreamingUpload(request.headers.get("content-type"), UPLOAD_MAX_BYTES, on_file=document_kind)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    try:
+        async for chunk in request.stream():
+            # Parsing is cheap, but the file part is written to disk
+            await asyncio.to_thread(upload.feed, chunk)
+        upload.finish()
+    except UploadError as e:
+        upload.discard()
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except UnsupportedDocumentError as e:
+        upload.discard()
+        raise HTTPException(status_code=415, detail=str(e))
+    except BaseException:
+        upload.discard()
+        raise
+    return upload
+
+def process_upload(path: str, filename: str, content_type: str, top_n: int, progress, stop: threading.Event):
+    """
+    Extracts, embeds and searches an uploaded paper (blocking); returns the "results" event body.
+
+    A reader thread parses the file page by page and cuts the text into
+    passages; this thread embeds them in EMBED_MAX_BATCH_SIZE batches as they
+    arrive, so parsing and inference overlap. The queue between the two is
+    bounded, so a fast parser waits for the model instead of buffering the
+    whole document. The passage vectors are pooled with CHUNK_POOLING into the
+    query, and the passages are kept as a paper session for chat.
+    """
+    page_count, pages = open_document(path, filename, content_type)
+    batches = queue.Queue(maxsize=max(1, UPLOAD_QUEUE_BATCHES))
+    state = {"pages": 0, "chars": 0, "truncated": False, "error": None}
+
+    def extract():
+        builder = PassageBuilder(PAPER_PASSAGE_WORDS, PAPER_PASSAGE_OVERLAP_WORDS)
+        batch = []
+        try:
+            for text in pages:
+                if stop.is_set():
+                    break
+                remaining = PAPER_SESSION_MAX_CHARS - state["chars"]
+                if len(text) > remaining:
+                    text, state["truncated"] = text[:remaining], True
+                state["pages"] += 1
+                state["chars"] += len(text)
+                progress("extract", pages=state["pages"], total_pages=page_count, chars=state["chars"])
+                for passage in builder.feed(text):
+                    batch.append(passage)
+                    if len(batch) >= EMBED_MAX_BATCH_SIZE:
+                        batches.put(batch)
+                        batch = []
+                if state["truncated"]:
+                    break
+            batch.extend(builder.finish())
+            if batch:
+                batches.put(batch)
+        except Exception as e:
+            state["error"] = e
+        finally:
+            pages.close()
+            batches.put(None)
+
+    reader = threading.Thread(target=extract, name="upload-extract", daemon=True)
+    reader.start()
+    passages, vectors = [], []
+    while (batch := batches.get()) is not None:
+        if stop.is_set():
+            continue  # the client is gone; drain so the reader can finish
+        with span("embed_passages"):
+            vectors.extend(embed_many(batch))
+        passages.extend(batch)
+        progress("embed", passages_embedded=len(passages), pages=state["pages"], total_pages=page_count)
+    reader.join()
+    if state["error"] is not None:
+        raise state["error"]
+    if stop.is_set():
+        return None
+    if not passages:
+        raise HTTPException(status_code=422, detail="No text could be extracted from the file (scanned PDFs are not supported)")
+
+    pooling = CHUNK_POOLING
+    if pooling == "maxsim":
+        # Every passage is a query; each journal is scored by its closest passage
+        results = merge_maxsim_results(query_index(app.state.collection, vectors, top_n), top_n)
+    else:
+        document_vector = pool_chunks(vectors, [len(p.split()) for p in passages], pooling)
+        results = query_index(app.state.collection, [document_vector.tolist()], top_n)
+
+    store = app.state.paper_sessions
+    store.purge_expired()
+    session = store.create(passages, vectors)
+    return {
+        "results": format_journal_results(results, 0),
+        "route": "dense",
+        "session_id": session.session_id,
+        "pages": state["pages"],
+        "passages": len(passages),
+        "chars": state["chars"],
+        "truncated": state["truncated"],
+    }
+
+@app.post("/search_journals/upload")
+async def search_journals_upload(request: Request):
     """
-    # Validate API key exists and is not a placeholder
+    Recommends journals for an uploaded PDF, DOCX or text file, with progress as Server-Sent Events.
+
+    Multipart form fields: "file" and optionally "top_n" (default 5). The
+    body is parsed as it arrives (see receive_upload), so an oversized or
+    unsupported file is rejected without receiving all of it.
+    The file is parsed on the server page by page while earlier pages are
+    being embedded (see process_upload). The stream sends "event: progress"
+    messages ({"stage": "extract" | "embed", pages, total_pages, ...}), then
+    "event: results" with the journals and a paper session ID for
+    /papers/sessions/{session_id}/chat, then "event: done" (or "event: error").
+    """
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > UPLOAD_MAX_BYTES + UPLOAD_OVERHEAD_BYTES:
+        # Multipart framing and form fields add a little on top of the file itself
+        raise HTTPException(status_code=413, detail=f"Uploads are limited to {UPLOAD_MAX_BYTES} bytes")
+    require_ready()
+    # Once the stream has started the status code can't change, so shed load before it does
+    if not app.state.inference_executor.has_capacity():
+        raise overloaded_error()
+
+    upload = await receive_upload(request)
+    try:
+        top_n = int(upload.fields.get("top_n", "5"))
+    except ValueError:
+        upload.discard()
+        raise HTTPException(status_code=400, detail="top_n must be an integer")
+    if top_n < 1:
+        upload.discard()
+        raise HTTPException(status_code=400, detail="top_n must be at least 1")
+    path, filename, content_type = upload.path, upload.filename, upload.content_type
+    events = asyncio.Queue()
+    loop = asyncio.get_running_loop()
+    stop = threading.Event()
+
+    def progress(stage: str, **data):
+        loop.call_soon_threadsafe(events.put_nowait, sse_event({"stage": stage, **data}, event="progress"))
+
+    async def run_job():
+        try:
+            body = await run_inference(process_upload, path, filename, content_type, top_n, progress, stop)
+            if body is not None:
+                SEARCH_ROUTES.inc(route="dense")
+                events.put_nowait(sse_event(body, event="results"))
+                events.put_nowait(sse_event({"passages": body["passages"]}, event="done"))
+        except HTTPException as e:
+            events.put_nowait(sse_event({"status_code": e.status_code, "detail": e.detail}, event="error"))
+        except UnsupportedDocumentError as e:
+            events.put_nowait(sse_event({"status_code": 415, "detail": str(e)}, event="error"))
+        except Exception as e:
+            print(f"Error in search_journals_upload: {e}")
+            events.put_nowait(sse_event({"status_code": 500, "detail": search_error_detail(e)}, event="error"))
+        finally:
+            upload.discard()
+            events.put_nowait(None)
+
+    # The job is not tied to the response: if the client disconnects it is told
+    # to stop, and still removes the temp file when it winds down
+    job = asyncio.create_task(run_job())
+    UPLOAD_JOBS.add(job)
+    job.add_done_callback(UPLOAD_JOBS.discard)
+
+    async def event_stream():
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+        finally:
+            stop.set()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# --- Gemini API Endpoint ---
+
+def check_gemini_key():
+    """Validates that the API key exists and is not a placeholder."""
     if not GEMINI_KEY:
         raise HTTPException(
             status_code=500, 
@@ -184,44 +1320,71 @@ async def generate_text_from_gemini(request_body: GeminiRequest):
             detail="GEMINI_API_KEY is still set to placeholder value. Please replace it with your actual API key from https://makersuite.google.com/app/apikey"
         )
 
-    # 1. Format the request payload for the Gemini API
-    payload = {
+def gemini_payload(prompt: str) -> dict:
+    """Formats the request payload for the Gemini API."""
+    return {
         "contents": [
             {
                 "parts": [
                     {
-                        "text": request_body.prompt
+                        "text": prompt
                     }
                 ]
             }
         ]
     }
 
-    # 2. Construct the API URL with the key as a query parameter (Gemini API standard)
-    # Using gemini-1.5-flash for faster responses, or use gemini-pro for more advanced responses
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={GEMINI_KEY}"
+def gemini_url(method: str, **params) -> str:
+    """Constructs the API URL with the key as a query parameter (Gemini API standard)."""
+    # Using gemini-1.5-flash for faster responses, or set GEMINI_MODEL=gemini-pro for more advanced responses
+    query = "&".join(f"{k}={v}" for k, v in params.items())
+    url = f"{GEMINI_API_BASE}/models/{GEMINI_MODEL}:{method}?key={GEMINI_KEY}"
+    return f"{url}&{query}" if query else url
 
-    # 3. Make the asynchronous API call to Gemini
+def extract_gemini_text(gemini_data: dict) -> str:
+    """Safely extracts the generated text from the nested JSON structure."""
+    parts = (gemini_data.get("candidates") or [{}])[0].get("content", {}).get("parts") or [{}]
+    return "".join(part.get("text", "") for part in parts)
+
+def gemini_error_detail(status_code: int, error_text: str) -> str:
+    """Provides helpful error messages for common Gemini HTTP errors."""
+    if status_code == 400:
+        if "API_KEY_INVALID" in error_text or "invalid" in error_text.lower():
+            return "Invalid Gemini API key. Please check your API key at https://makersuite.google.com/app/apikey"
+        return f"Bad request to Gemini API: {error_text}"
+    if status_code == 403:
+        return "Access forbidden. Your API key may not have permission to use this model."
+    if status_code == 429:
+        return "Rate limit exceeded. Please wait a moment and try again."
+    return f"Gemini API error ({status_code}): {error_text}"
+
+async def call_gemini(prompt: str) -> str:
+    """Sends one generateContent request and returns the generated text, or raises HTTPException."""
+    # 1. Format the request payload and URL for the Gemini API
+    payload = gemini_payload(prompt)
+    api_url = gemini_url("generateContent")
+
+    # 2. Make the asynchronous API call to Gemini
     try:
-        # Use the single, persistent client instance from the app state
-        client = app.state.gemini_client 
+        # Use the single, persistent client from the app state (rate limited, retried on 429/5xx)
+        client = app.state.gemini
         
         print(f"[Gemini] Sending request to Gemini API...")
-        response = await client.post(
-            api_url,
-            json=payload,
-            headers={"Content-Type": "application/json"}, 
-        )
+        with span("gemini"):
+            response = await client.post(
+                api_url,
+                json=payload,
+                headers={"Content-Type": "application/json"}, 
+            )
         
         # Raise an exception for HTTP error status codes (4xx or 5xx)
         response.raise_for_status()
             
-        # 4. Process the response from Gemini
+        # 3. Process the response from Gemini
         gemini_data = response.json()
         print(f"[Gemini] Received response from Gemini API")
             
-        # Safely extract the generated text from the nested JSON structure
-        generated_text = gemini_data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+        generated_text = extract_gemini_text(gemini_data)
 
         if not generated_text:
             block_reason = gemini_data.get("promptFeedback", {}).get("blockReason", "Unknown")
@@ -231,27 +1394,15 @@ async def generate_text_from_gemini(request_body: GeminiRequest):
             raise HTTPException(status_code=500, detail=error_detail)
 
         print(f"[Gemini] Successfully generated {len(generated_text)} characters")
-        # 5. Return the formatted response
-        return GeminiResponse(generated_text=generated_text)
+        return generated_text
+
+    except HTTPException:
+        raise
 
     except httpx.HTTPStatusError as e:
         error_text = e.response.text
         print(f"[Gemini] API HTTP Status Error: {e.response.status_code} - {error_text}")
-        
-        # Provide helpful error messages for common issues
-        if e.response.status_code == 400:
-            if "API_KEY_INVALID" in error_text or "invalid" in error_text.lower():
-                detail = "Invalid Gemini API key. Please check your API key at https://makersuite.google.com/app/apikey"
-            else:
-                detail = f"Bad request to Gemini API: {error_text}"
-        elif e.response.status_code == 403:
-            detail = "Access forbidden. Your API key may not have permission to use this model."
-        elif e.response.status_code == 429:
-            detail = "Rate limit exceeded. Please wait a moment and try again."
-        else:
-            detail = f"Gemini API error ({e.response.status_code}): {error_text}"
-        
-        raise HTTPException(status_code=e.response.status_code, detail=detail)
+        raise HTTPException(status_code=e.response.status_code, detail=gemini_error_detail(e.response.status_code, error_text))
     
     except httpx.RequestError as e:
         print(f"[Gemini] Network error: {str(e)}")
@@ -261,6 +1412,216 @@ async def generate_text_from_gemini(request_body: GeminiRequest):
         print(f"[Gemini] Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
+@app.post("/generate", response_model=GeminiResponse)
+async def generate_text_from_gemini(request_body: GeminiRequest):
+    """
+    Accepts a prompt and returns text generated by the Gemini model.
+
+    Replies are cached by prompt hash for GENERATE_CACHE_TTL_S seconds, and
+    concurrent identical prompts share one upstream call. Set bypass_cache to
+    always call Gemini.
+    """
+    check_gemini_key()
+
+    cache = app.state.generate_cache
+    key = prompt_key(GEMINI_MODEL, request_body.prompt)
+
+    if request_body.bypass_cache:
+        cache.bypassed += 1
+        generated_text = await call_gemini(request_body.prompt)
+        cache.put(key, generated_text)
+        return GeminiResponse(generated_text=generated_text)
+
+    cached = cache.get(key)
+    if cached is not None:
+        print(f"[Gemini] Served {len(cached)} characters from the response cache")
+        return GeminiResponse(generated_text=cached)
+
+    generated_text, shared = await app.state.generate_flight.do(key, lambda: call_gemini(request_body.prompt))
+    if not shared:
+        cache.put(key, generated_text)
+    # 4. Return the formatted response
+    return GeminiResponse(generated_text=generated_text)
+
+def sse_event(data: dict, event: str = None) -> str:
+    """Formats one Server-Sent Events message."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/generate/stream")
+async def stream_text_from_gemini(request_body: GeminiRequest):
+    """
+    Streams text generated by the Gemini model as Server-Sent Events.
+
+    Each "data:" message carries {"text": "..."} with the next piece of output.
+    The stream ends with an "event: done" message, or an "event: error" message
+    carrying {"status_code", "detail"} if Gemini fails after streaming started.
+    Errors before the first byte map to HTTP status codes exactly like /generate.
+    Cached replies (shared with /generate) are sent as a single message.
+    """
+    return await stream_gemini(request_body.prompt, request_body.bypass_cache)
+
+async def stream_gemini(prompt: str, bypass_cache: bool = False, prelude: tuple = ()):
+    """
+    The SSE response for a prompt (see /generate/stream).
+
+    `prelude` holds ready-made SSE events sent before the generated text,
+    e.g. the passages a paper chat turn used.
+    """
+    check_gemini_key()
+
+    cache = app.state.generate_cache
+    key = prompt_key(GEMINI_MODEL, prompt)
+    cached = None if bypass_cache else cache.get(key)
+    if bypass_cache:
+        cache.bypassed += 1
+    if cached is not None:
+        async def cached_stream():
+            for event in prelude:
+                yield event
+            yield sse_event({"text": cached})
+            yield sse_event({"generated_chars": len(cached), "cached": True}, event="done")
+        return StreamingResponse(cached_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    try:
+        print("[Gemini] Opening streaming request to Gemini API...")
+        with span("gemini_open_stream"):
+            upstream, release = await app.state.gemini.open_stream(
+                gemini_url("streamGenerateContent", alt="sse"),
+                json=gemini_payload(prompt),
+                headers={"Content-Type": "application/json"},
+            )
+    except httpx.RequestError as e:
+        print(f"[Gemini] Network error: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Network error connecting to Gemini API: {str(e)}")
+
+    if upstream.status_code >= 400:
+        error_text = (await upstream.aread()).decode("utf-8", errors="replace")
+        await upstream.aclose()
+        release()
+        print(f"[Gemini] API HTTP Status Error: {upstream.status_code} - {error_text}")
+        raise HTTPException(status_code=upstream.status_code, detail=gemini_error_detail(upstream.status_code, error_text))
+
+    async def event_stream():
+        generated_chars = 0
+        generated_parts = []
+        block_reason = None
+        try:
+            for event in prelude:
+                yield event
+            async for line in upstream.aiter_lines():
+                # Gemini sends one JSON chunk per "data:" line; blank lines separate events
+                if not line.startswith("data:"):
+                    continue
+                chunk = json.loads(line[len("data:"):].strip())
+                block_reason = chunk.get("promptFeedback", {}).get("blockReason", block_reason)
+                text = extract_gemini_text(chunk)
+                if text:
+                    generated_chars += len(text)
+                    generated_parts.append(text)
+                    yield sse_event({"text": text})
+
+            if not generated_chars:
+                detail = f"Could not extract generated text. Blocked/Error Reason: {block_reason or 'Unknown'}."
+                print(f"[Gemini] Streaming generation produced no text. {detail}")
+                yield sse_event({"status_code": 500, "detail": detail}, event="error")
+            else:
+                print(f"[Gemini] Successfully streamed {generated_chars} characters")
+                # Only complete generations are cached, so a later /generate can reuse them
+                cache.put(key, "".join(generated_parts))
+                yield sse_event({"generated_chars": generated_chars}, event="done")
+        except httpx.RequestError as e:
+            print(f"[Gemini] Network error mid-stream: {str(e)}")
+            yield sse_event({"status_code": 503, "detail": f"Network error connecting to Gemini API: {str(e)}"}, event="error")
+        except Exception as e:
+            print(f"[Gemini] Unexpected streaming error: {str(e)}")
+            yield sse_event({"status_code": 500, "detail": f"An unexpected error occurred: {str(e)}"}, event="error")
+        finally:
+            await upstream.aclose()
+            release()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Disable proxy buffering so tokens reach the browser as soon as they are generated
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --- Paper chat sessions ---
+
+PAPER_CHAT_PROMPT = """You are an AI research assistant specialized in academic publishing, journal recommendations, paper formatting, and submission guidelines. You ONLY provide information related to research work, academic publishing, and scholarly communication.
+
+The user has uploaded a research paper. These excerpts from it are the ones most relevant to the question (in paper order; the first one is the opening of the paper):
+
+{excerpts}
+
+User question: {question}
+
+Provide a helpful, accurate response focused on research and academic publishing, based on the excerpts where they are relevant. If the question is not related to research work, politely redirect the user to ask about journal recommendations, paper formatting, submission guidelines, or other academic publishing topics."""
+
+def create_paper_session(text: str) -> dict:
+    """Splits and embeds a paper (blocking); returns the new session's summary."""
+    passages = split_passages(text, PAPER_PASSAGE_WORDS, PAPER_PASSAGE_OVERLAP_WORDS)
+    # Batched and length-sorted like /search_journals/batch; passages seen before come from the cache
+    vectors = embed_many(passages)
+    store = app.state.paper_sessions
+    store.purge_expired()
+    session = store.create(passages, vectors)
+    return {"session_id": session.session_id, "passages": len(passages), "chars": len(text), "ttl_s": store.ttl_s}
+
+def retrieve_passages(session_id: str, question: str, k: int):
+    """Indexes and texts of the session's passages closest to the question, or None for an unknown session."""
+    session = app.state.paper_sessions.get(session_id)
+    if session is None:
+        return None
+    query = embed_text(question)[0]
+    with span("passage_retrieval"):
+        indexes = session.closest(query, k)
+    return indexes, [session.passages[i] for i in indexes]
+
+@app.post("/papers/sessions")
+async def create_paper_session_endpoint(request: PaperSessionRequest):
+    """
+    Stores a paper for chat: split into passages, embedded once, kept under a session ID.
+
+    Later turns (POST /papers/sessions/{session_id}/chat) only send the question.
+    """
+    text = request.text.strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="Paper text is required")
+    if len(text) > PAPER_SESSION_MAX_CHARS:
+        raise HTTPException(status_code=413, detail=f"Paper text is limited to {PAPER_SESSION_MAX_CHARS} characters")
+    require_ready()
+    return await run_inference(create_paper_session, text)
+
+@app.delete("/papers/sessions/{session_id}")
+async def delete_paper_session(session_id: str):
+    if not await asyncio.to_thread(app.state.paper_sessions.delete, session_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired paper session")
+    return {"deleted": session_id}
+
+@app.post("/papers/sessions/{session_id}/chat")
+async def chat_with_paper(session_id: str, request: PaperChatRequest):
+    """
+    Answers a question about a stored paper, streamed like /generate/stream.
+
+    The prompt carries only the passages closest to the question. An initial
+    "event: context" message reports which passages were used and the prompt size.
+    """
+    question = request.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question is required")
+    require_ready()
+    k = max(1, request.passages or PAPER_CHAT_PASSAGES)
+    retrieved = await run_inference(retrieve_passages, session_id, question, k)
+    if retrieved is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired paper session")
+    indexes, passages = retrieved
+    excerpts = "\n\n".join(f"[Excerpt {n}]\n{passage}" for n, passage in enumerate(passages, 1))
+    prompt = PAPER_CHAT_PROMPT.format(excerpts=excerpts, question=question)
+    context = sse_event({"passages": indexes, "prompt_chars": len(prompt)}, event="context")
+    return await stream_gemini(prompt, request.bypass_cache, prelude=(context,))
+
 # --- RUNNING THE APPLICATION ---
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Coalesces single-item requests from many threads into batched calls.
+
+    Callers submit one item and get a Future back. A background worker collects
+    pending items until either `max_batch_size` items are waiting or the oldest
+    one has waited `max_wait_ms`, then calls `batch_fn(items)` once and hands
+    row i of the result back to the i-th caller.
+    """
+
+    def __init__(self, batch_fn, max_batch_size: int = 16, max_wait_ms: float = 5.0, name: str = "batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._pending = []  # list of (item, future)
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # Simple counters so we can see how well requests are being coalesced
+        self.batches_run = 0
+        self.items_processed = 0
+
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item) -> Future:
+        """Queues a single item and returns a Future resolving to its result row."""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed")
+            self._pending.append((item, future))
+            self._cond.notify()
+        return future
+
+    def __call__(self, item, timeout: float = None):
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(item).result(timeout=timeout)
+
+    def close(self):
+        """Stops the worker after flushing anything already queued."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._worker.join()
+
+    def stats(self) -> dict:
+        avg = self.items_processed / self.batches_run if self.batches_run else 0.0
+        return {
+            "batches_run": self.batches_run,
+            "items_processed": self.items_processed,
+            "avg_batch_size": round(avg, 2),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
+
+    # --- Worker ---
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return None  # closed and drained
+
+            # Wait for the batch to fill up, but never longer than max_wait
+            # measured from the moment the first item arrived at the worker.
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            # Drop items whose callers have already given up
+            batch = [(item, fut) for item, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+
+            self.batches_run += 1
+            self.items_processed += len(batch)
+            for (_, fut), row in zip(batch, results):
+                fut.set_result(row)
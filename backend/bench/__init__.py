@@ -0,0 +1 @@
+"""Offline benchmarks for the backend. Run the modules from backend/, e.g. `python -m bench.micro`."""
@@ -0,0 +1,92 @@
+"""
+Shared helpers for the benchmark scripts: latency percentiles, peak RSS and
+result files.
+
+Every run is written to bench/results/<kind>-<timestamp>.json with the git
+commit and relevant configuration, so runs can be compared over time with
+`python -m bench.compare old.json new.json`.
+"""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# Server settings that change performance; recorded with every run
+CONFIG_ENV_VARS = (
+    "EMBED_ENGINE", "EMBED_MAX_BATCH_SIZE", "EMBED_MAX_WAIT_MS", "EMBED_CHUNKING", "CHUNK_POOLING",
+    "INFERENCE_MAX_WORKERS", "INFERENCE_MAX_QUEUE", "VECTOR_BACKEND", "SEARCH_MODE", "SEARCH_CACHE_MAX_ENTRIES",
+    "OMP_NUM_THREADS", "MKL_NUM_THREADS",
+)
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Linearly interpolated percentile (q in 0..100) of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def latency_summary(latencies_s: list) -> dict:
+    """mean / p50 / p95 / p99 / max in milliseconds."""
+    values = sorted(latencies_s)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3),
+    }
+
+
+def peak_rss_mb(pid: int = None):
+    """Peak resident set size of this process, or of another process via /proc (Linux)."""
+    if pid is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def run_metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {name: os.environ[name] for name in CONFIG_ENV_VARS if name in os.environ},
+    }
+
+
+def save_results(kind: str, payload: dict, out: str = None) -> str:
+    """Writes a result file and returns its path."""
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"kind": kind, "meta": run_metadata(), **payload}, f, indent=4)
+    print(f"Saved results to '{out}'")
+    return out
@@ -0,0 +1,47 @@
+"""
+Compares two benchmark result files case by case.
+
+Usage (from backend/):
+    python -m bench.compare bench/results/load-old.json bench/results/load-new.json
+"""
+import argparse
+import json
+
+
+def change(old, new) -> str:
+    if not old or new is None:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare(old: dict, new: dict):
+    new_cases = {case["name"]: case for case in new["cases"]}
+    print(f"old: {old['meta'].get('git_commit')} @ {old['meta'].get('timestamp')}")
+    print(f"new: {new['meta'].get('git_commit')} @ {new['meta'].get('timestamp')}\n")
+    print(f"{'case':<32} {'throughput':>12} {'p50':>10} {'p95':>10} {'p99':>10}")
+    for case in old["cases"]:
+        other = new_cases.get(case["name"])
+        if other is None:
+            continue
+        print(
+            f"{case['name']:<32} {change(case.get('throughput_per_s'), other.get('throughput_per_s')):>12} "
+            + " ".join(
+                f"{change(case['latency'].get(key), other['latency'].get(key)):>10}"
+                for key in ("p50_ms", "p95_ms", "p99_ms")
+            )
+        )
+    for role, value in old.get("peak_rss_mb", {}).items():
+        print(f"peak RSS ({role}): {value} MB -> {new.get('peak_rss_mb', {}).get(role)} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    args = parser.parse_args()
+
+    with open(args.old, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, "r", encoding="utf-8") as f:
+        new = json.load(f)
+    compare(old, new)
@@ -0,0 +1,168 @@
+"""
+HTTP load generator for /search_journals and /generate.
+
+Each scenario is driven at fixed concurrency levels: N workers send requests
+back to back (closed loop) until the request budget for that level is spent.
+With --spawn the app is started against local stand-ins (synthetic vector
+index, mock Gemini; see standins.py), so the whole run is offline.
+
+Usage (from backend/):
+    python -m bench.load --spawn --concurrency 1 4 16 --requests 200
+    python -m bench.load --base-url http://localhost:8000 --scenarios generate
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from bench.common import latency_summary, peak_rss_mb, save_results
+from bench.standins import StandIns
+
+
+def word_pool(metadata_path: str) -> list:
+    """Vocabulary for synthetic queries: words from the journal names."""
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        journals = json.load(f)
+    words = {w.lower() for j in journals.values() for w in (j.get("display_name") or "").split() if w.isalpha()}
+    return sorted(words)
+
+
+class RequestFactory:
+    """Deterministic request bodies; unique per request unless repeat_pool is set."""
+
+    def __init__(self, words: list, text_words: int, repeat_pool: int, seed: int, search_mode: str = None):
+        self.words = words
+        self.text_words = text_words
+        self.repeat_pool = repeat_pool
+        self.seed = seed
+        self.search_mode = search_mode
+
+    def _text(self, i: int) -> str:
+        key = i % self.repeat_pool if self.repeat_pool else i
+        rng = random.Random(self.seed * 1_000_003 + key)
+        return " ".join(rng.choice(self.words) for _ in range(self.text_words))
+
+    def search(self, i: int) -> dict:
+        body = {"text": self._text(i), "top_n": 5}
+        if self.search_mode:
+            body["mode"] = self.search_mode
+        return body
+
+    def generate(self, i: int) -> dict:
+        return {"prompt": f"Which journals publish work on {self._text(i)}?"}
+
+
+SCENARIOS = {
+    "search": ("/search_journals", "search"),
+    "generate": ("/generate", "generate"),
+}
+
+
+async def drive(client: httpx.AsyncClient, path: str, make_body, concurrency: int, total: int) -> dict:
+    """Closed-loop load at a fixed concurrency; returns throughput, latency and status counts."""
+    latencies = []
+    statuses = {}
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < total:
+            i = next_index
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=make_body(i))
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(latencies) / elapsed, 3) if elapsed > 0 else None,
+        "errors": errors,
+        "status_counts": {str(k): v for k, v in sorted(statuses.items())},
+        "latency": latency_summary(latencies),
+    }
+
+
+async def run_load(base_url: str, args, factory: RequestFactory) -> list:
+    cases = []
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        for scenario in args.scenarios:
+            path, method = SCENARIOS[scenario]
+            make_body = getattr(factory, method)
+            for concurrency in args.concurrency:
+                # A short untimed warm-up so connection setup is not measured
+                await drive(client, path, lambda i: make_body(-1 - i), concurrency, concurrency)
+                result = await drive(client, path, make_body, concurrency, args.requests)
+                case = {"name": f"{scenario}/c={concurrency}", "params": {"scenario": scenario, "concurrency": concurrency}, **result}
+                cases.append(case)
+                latency = result["latency"]
+                print(f"{case['name']:<18} {result['throughput_per_s'] or 0:>8.1f} req/s | p50 {latency.get('p50_ms', 0):>9.1f} ms | "
+                      f"p95 {latency.get('p95_ms', 0):>9.1f} ms | p99 {latency.get('p99_ms', 0):>9.1f} ms | errors {result['errors']}")
+    return cases
+
+
+def server_memory(standins: StandIns) -> dict:
+    """Peak RSS for a single uvicorn process; RSS/PSS/USS per worker for pre-forked serve.py."""
+    if standins.workers > 1:
+        from serve import memory_report
+        return memory_report(standins.app_process.pid)
+    return {"peak_rss_mb": peak_rss_mb(standins.app_process.pid)}
+
+
+def main(args):
+    factory = RequestFactory(word_pool(args.metadata), args.text_words, args.repeat_pool, args.seed, args.search_mode)
+    if not args.spawn:
+        cases = asyncio.run(run_load(args.base_url, args, factory))
+        return {"target": args.base_url, "cases": cases, "peak_rss_mb": {"load_generator": peak_rss_mb()}}
+
+    with StandIns(args.app_port, args.gemini_port, args.metadata, args.first_token_ms, args.chunk_delay_ms,
+                  workers=args.workers) as standins:
+        cases = asyncio.run(run_load(standins.base_url, args, factory))
+        stats = httpx.get(f"{standins.base_url}/stats", timeout=10.0).json()
+        memory = server_memory(standins)
+    return {
+        "target": "stand-ins",
+        "workers": args.workers,
+        "cases": cases,
+        "server_stats": stats,
+        "server_memory": memory,
+        "peak_rss_mb": {"server": memory.get("peak_rss_mb", memory.get("total_rss_mb")), "load_generator": peak_rss_mb()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test /search_journals and /generate.")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--spawn", action="store_true", help="Start the app against local stand-ins for Chroma and Gemini")
+    parser.add_argument("--app-port", type=int, default=8765)
+    parser.add_argument("--gemini-port", type=int, default=8766)
+    parser.add_argument("--workers", type=int, default=1, help="With --spawn: >1 serves from pre-forked workers (serve.py)")
+    parser.add_argument("--first-token-ms", type=float, default=300.0, help="Mock Gemini time to first token")
+    parser.add_argument("--chunk-delay-ms", type=float, default=80.0, help="Mock Gemini delay between chunks")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario and concurrency level")
+    parser.add_argument("--text-words", type=int, default=120, help="Words per synthetic query")
+    parser.add_argument("--repeat-pool", type=int, default=0, help="Cycle through this many distinct texts (0 = all unique)")
+    parser.add_argument("--search-mode", default=None, help="Send this search mode (e.g. dense) with every search")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--metadata", default="../db/journals_metadata.json")
+    parser.add_argument("--out", default=None, help="Result file (default: bench/results/load-<timestamp>.json)")
+    args = parser.parse_args()
+
+    save_results("load", main(args), args.out)
@@ -0,0 +1,119 @@
+"""
+Micro-benchmarks for the embedding path at several input lengths and batch
+sizes. Each stage is timed on its own:
+
+    tokenize  the tokenizer on the decoded synthetic texts
+    forward   the model up to its last hidden state, without pooling
+    pool      mean pooling of a hidden state of the same shape (numpy)
+    embed     engine.embed, forward and pooling together, as in production
+
+Runs fully offline once the model is in the local Hugging Face cache
+(HF_HUB_OFFLINE=1 is set unless --online is given). Inputs are synthetic
+token sequences of exactly the requested length, so runs are reproducible.
+
+Usage (from backend/):
+    python -m bench.micro [--engine onnx] [--lengths 32 128 512] [--batch-sizes 1 8 32]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from bench.common import latency_summary, peak_rss_mb, save_results
+
+MODEL_NAME = "allenai/scibert_scivocab_uncased"
+
+
+def synthetic_batch(tokenizer, length: int, batch_size: int, rng: np.random.Generator):
+    """(input_ids, attention_mask, texts) for `batch_size` sequences of exactly `length` tokens."""
+    special = set(tokenizer.all_special_ids)
+    vocab = np.array([i for i in range(tokenizer.vocab_size) if i not in special])
+    body = rng.choice(vocab, size=(batch_size, length - 2))
+    input_ids = np.concatenate([
+        np.full((batch_size, 1), tokenizer.cls_token_id),
+        body,
+        np.full((batch_size, 1), tokenizer.sep_token_id),
+    ], axis=1).astype(np.int64)
+    attention_mask = np.ones_like(input_ids)
+    texts = tokenizer.batch_decode(body.tolist())
+    return input_ids, attention_mask, texts
+
+
+def time_case(fn, repeats: int, warmup: int) -> list:
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def case_result(stage: str, length: int, batch_size: int, latencies: list) -> dict:
+    total = sum(latencies)
+    return {
+        "name": f"{stage}/len={length}/batch={batch_size}",
+        "params": {"stage": stage, "length": length, "batch_size": batch_size},
+        "throughput_per_s": round(len(latencies) * batch_size / total, 3) if total > 0 else None,
+        "latency": latency_summary(latencies),
+    }
+
+
+def run(args) -> dict:
+    from transformers import AutoTokenizer
+    from engines import load_engine, mean_pool
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model, revision=args.revision)
+    engine = load_engine(args.engine, args.model, revision=args.revision, onnx_dir=args.onnx_dir)
+    print(f"Engine: {engine.name}")
+    rng = np.random.default_rng(args.seed)
+
+    cases = []
+    for length in args.lengths:
+        for batch_size in args.batch_sizes:
+            input_ids, attention_mask, texts = synthetic_batch(tokenizer, length, batch_size, rng)
+            hidden = rng.standard_normal((batch_size, length, 768)).astype(np.float32)
+
+            stages = {
+                "tokenize": lambda: tokenizer(texts, padding=True, truncation=True, max_length=512, return_tensors="np"),
+                "forward": lambda: engine.last_hidden_state(input_ids, attention_mask),
+                "pool": lambda: mean_pool(hidden, attention_mask),
+                "embed": lambda: engine.embed(input_ids, attention_mask),
+            }
+            for stage in args.stages:
+                result = case_result(stage, length, batch_size, time_case(stages[stage], args.repeats, args.warmup))
+                cases.append(result)
+                print(f"{result['name']:<32} p50 {result['latency']['p50_ms']:>9.3f} ms | "
+                      f"p95 {result['latency']['p95_ms']:>9.3f} ms | {result['throughput_per_s']:>9.1f} items/s")
+
+    return {
+        "engine": engine.name,
+        "model": args.model,
+        "cases": cases,
+        "peak_rss_mb": {"benchmark": peak_rss_mb()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark tokenisation, forward pass, pooling and the full embed.")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--revision", default=os.getenv("MODEL_REVISION", "main"))
+    parser.add_argument("--engine", default=os.getenv("EMBED_ENGINE", "torch"))
+    parser.add_argument("--onnx-dir", default=os.getenv("ONNX_MODEL_DIR", "./onnx_model"))
+    parser.add_argument("--lengths", type=int, nargs="+", default=[32, 128, 512])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--stages", nargs="+", default=["tokenize", "forward", "pool", "embed"],
+                        choices=["tokenize", "forward", "pool", "embed"])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--online", action="store_true", help="Allow downloading the model from the Hub")
+    parser.add_argument("--out", default=None, help="Result file (default: bench/results/micro-<timestamp>.json)")
+    args = parser.parse_args()
+
+    if not args.online:
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    save_results("micro", run(args), args.out)
@@ -0,0 +1,138 @@
+"""
+Recall-vs-latency harness for the IVF-PQ paper index (ivfpq.py).
+
+Ground truth is an exact scan of the consolidated corpus (embeddings.npy,
+chunked matmul over the float16 matrix). Every nprobe / rerank combination
+is scored on the same queries:
+
+  - recall@k: share of the exact top-k papers the index returns
+  - journal overlap: share of the exact top journals (after vote
+    aggregation, as /search_journals does it) that the index also ranks
+    in its top journals
+  - per-query latency and throughput
+
+Queries are real query embeddings from --queries (an .npy of shape (q, d)),
+or corpus papers perturbed with Gaussian noise so the query is not the
+paper itself. The exact scan is timed too, as the baseline.
+
+Usage (from backend/):
+    python -m bench.recall --index ./paper_index --corpus ../notebooks/paper_corpus --nprobe 4 8 16 32 64
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from bench.common import latency_summary, peak_rss_mb, save_results
+from ivfpq import IVFPQIndex, journal_votes, normalize_rows
+
+
+def exact_search(corpus: np.ndarray, queries: np.ndarray, k: int, block_rows: int = 262144):
+    """Exact top-k (rows, similarities) per query by a blocked scan; returns per-query latencies too."""
+    rows, sims, latencies = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        best_rows, best_sims = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        for block_start in range(0, len(corpus), block_rows):
+            block = normalize_rows(corpus[block_start:block_start + block_rows])
+            scores = block @ query
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            best_rows = np.concatenate([best_rows, top + block_start])
+            best_sims = np.concatenate([best_sims, scores[top]])
+        order = np.argsort(-best_sims, kind="stable")[:k]
+        latencies.append(time.perf_counter() - start)
+        rows.append(best_rows[order])
+        sims.append(best_sims[order])
+    return rows, sims, latencies
+
+
+def make_queries(corpus: np.ndarray, count: int, noise: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picked = np.sort(rng.choice(len(corpus), size=min(count, len(corpus)), replace=False))
+    queries = normalize_rows(corpus[picked])
+    # noise is relative to a unit vector's per-dimension scale
+    queries = queries + rng.standard_normal(queries.shape).astype(np.float32) * noise / np.sqrt(queries.shape[1])
+    return normalize_rows(queries)
+
+
+def top_journals(rows, sims, paper_journals, top_n: int, votes: int) -> set:
+    return {journal for journal, _, _ in journal_votes(rows, sims, paper_journals, top_n, votes)}
+
+
+def run(args):
+    index = IVFPQIndex.load(args.index)
+    corpus = np.load(os.path.join(args.corpus, "embeddings.npy"), mmap_mode="r")
+    if len(corpus) != index.count():
+        raise SystemExit(f"Corpus has {len(corpus)} vectors but the index {index.count()}; rebuild one of them.")
+    if args.queries:
+        queries = normalize_rows(np.load(args.queries))
+    else:
+        queries = make_queries(corpus, args.num_queries, args.noise, args.seed)
+
+    print(f"Exact scan of {len(corpus)} papers for {len(queries)} queries...")
+    truth_rows, truth_sims, exact_latencies = exact_search(corpus, queries, args.k)
+    truth_journals = [top_journals(r, s, index.paper_journals, args.top_n, args.votes) for r, s in zip(truth_rows, truth_sims)]
+
+    cases = [{
+        "name": "exact",
+        "params": {"k": args.k},
+        "recall": 1.0,
+        "journal_overlap": 1.0,
+        "throughput_per_s": round(len(queries) / sum(exact_latencies), 3),
+        "latency": latency_summary(exact_latencies),
+    }]
+    for rerank in args.rerank:
+        if rerank and index.refine is None:
+            print(f"Skipping rerank={rerank}: the index was built without --refine int8")
+            continue
+        for nprobe in args.nprobe:
+            for query in queries[:args.warmup]:
+                index.search(query, args.k, nprobe, rerank)
+            latencies, hits, overlap = [], 0, 0
+            for query, exact_rows, exact_journals in zip(queries, truth_rows, truth_journals):
+                start = time.perf_counter()
+                rows, sims = index.search(query, args.k, nprobe, rerank)
+                latencies.append(time.perf_counter() - start)
+                hits += len(np.intersect1d(rows, exact_rows))
+                overlap += len(top_journals(rows, sims, index.paper_journals, args.top_n, args.votes) & exact_journals)
+            case = {
+                "name": f"nprobe={nprobe}/rerank={rerank}",
+                "params": {"nprobe": nprobe, "rerank": rerank, "k": args.k},
+                "recall": round(hits / (len(queries) * args.k), 4),
+                "journal_overlap": round(overlap / max(1, sum(len(j) for j in truth_journals)), 4),
+                "throughput_per_s": round(len(queries) / sum(latencies), 3),
+                "latency": latency_summary(latencies),
+            }
+            cases.append(case)
+
+    print(f"{'case':<24} {'recall@' + str(args.k):>10} {'journals':>9} {'p50':>10} {'p95':>10}")
+    for case in cases:
+        print(f"{case['name']:<24} {case['recall']:>10.3f} {case['journal_overlap']:>9.3f} "
+              f"{case['latency']['p50_ms']:>8.2f}ms {case['latency']['p95_ms']:>8.2f}ms")
+    return {
+        "index": {**index.meta, "path": args.index},
+        "queries": {"count": len(queries), "source": args.queries or f"corpus+noise({args.noise})"},
+        "cases": cases,
+        "peak_rss_mb": {"benchmark": peak_rss_mb()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure IVF-PQ recall and latency against an exact scan.")
+    parser.add_argument("--index", default="./paper_index")
+    parser.add_argument("--corpus", default="../notebooks/paper_corpus")
+    parser.add_argument("--queries", default=None, help="Optional .npy of query embeddings (default: noisy corpus papers)")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.5, help="Gaussian noise added to corpus queries (relative norm)")
+    parser.add_argument("--k", type=int, default=100, help="Papers retrieved per query (PAPER_SEARCH_K in the app)")
+    parser.add_argument("--top-n", type=int, default=10, help="Journals compared after vote aggregation")
+    parser.add_argument("--votes", type=int, default=5, help="Votes per journal (PAPER_VOTES_PER_JOURNAL in the app)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0], help="Candidates re-scored with int8 codes (0 = off)")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="Result file (default: bench/results/recall-<timestamp>.json)")
+    args = parser.parse_args()
+
+    save_results("recall", run(args), args.out)
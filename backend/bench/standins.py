@@ -0,0 +1,144 @@
+"""
+Local stand-ins so the load test never leaves the machine.
+
+  - Chroma: a synthetic NumpyIndex (random unit vectors, real journal names
+    and ids from db/journals_metadata.json), served with VECTOR_BACKEND=numpy.
+  - Gemini: mock_gemini.py with configurable generation latency.
+
+`StandIns` starts both plus the app itself (under uvicorn, or under the
+pre-fork serve.py with workers > 1), waits for /readyz and tears everything
+down on exit.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STANDINS_DIR = os.path.join(BACKEND_DIR, "bench", ".standins")
+
+
+def build_synthetic_index(out_dir: str, metadata_path: str, dim: int = 768, seed: int = 0):
+    """Writes a NumpyIndex with one random unit vector per journal."""
+    from vector_index import NumpyIndex, normalize_rows
+
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        journals = json.load(f)
+    ids = list(journals)
+    names = [journals[i].get("display_name") or "" for i in ids]
+    rng = np.random.default_rng(seed)
+    embeddings = normalize_rows(rng.standard_normal((len(ids), dim)).astype(np.float32))
+    index = NumpyIndex(
+        embeddings,
+        ids,
+        documents=[f"{name}. Concepts: " for name in names],
+        metadatas=[{"title": name} for name in names],
+    )
+    index.save(out_dir)
+    return index.count()
+
+
+def wait_for(url: str, timeout_s: float, process: subprocess.Popen = None):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Process for {url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=2.0).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} did not become ready within {timeout_s:.0f}s")
+
+
+class StandIns:
+    """Context manager running mock Gemini + the app against a synthetic local index."""
+
+    def __init__(self, app_port: int = 8765, gemini_port: int = 8766, metadata_path: str = "../db/journals_metadata.json",
+                 first_token_ms: float = 300.0, chunk_delay_ms: float = 80.0, extra_env: dict = None,
+                 ready_timeout_s: float = 600.0, workers: int = 1):
+        self.app_port = app_port
+        self.gemini_port = gemini_port
+        self.metadata_path = metadata_path
+        self.first_token_ms = first_token_ms
+        self.chunk_delay_ms = chunk_delay_ms
+        self.extra_env = extra_env or {}
+        self.ready_timeout_s = ready_timeout_s
+        self.workers = workers
+        self.processes = []
+        self.app_process = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.app_port}"
+
+    def __enter__(self):
+        index_dir = os.path.join(STANDINS_DIR, "vector_index")
+        if not os.path.exists(os.path.join(index_dir, "embeddings.npy")):
+            count = build_synthetic_index(index_dir, self.metadata_path)
+            print(f"Built synthetic index with {count} journals in '{index_dir}'")
+
+        gemini = subprocess.Popen(
+            [sys.executable, "mock_gemini.py", "--host", "127.0.0.1", "--port", str(self.gemini_port),
+             "--first-token-ms", str(self.first_token_ms), "--chunk-delay-ms", str(self.chunk_delay_ms)],
+            cwd=BACKEND_DIR,
+        )
+        self.processes.append(gemini)
+        wait_for(f"http://127.0.0.1:{self.gemini_port}/quota", 60.0, gemini)
+
+        env = dict(os.environ)
+        env.update({
+            "VECTOR_BACKEND": "numpy",
+            "VECTOR_INDEX_PATH": index_dir,
+            "GEMINI_API_BASE": f"http://127.0.0.1:{self.gemini_port}/v1beta",
+            "GEMINI_API_KEY": "bench-key",
+            # Memory-only cache so every run starts cold and runs do not affect each other
+            "EMBED_CACHE_DISK_PATH": "",
+            "HF_HUB_OFFLINE": env.get("HF_HUB_OFFLINE", "1"),
+            "TRANSFORMERS_OFFLINE": env.get("TRANSFORMERS_OFFLINE", "1"),
+        })
+        env.update(self.extra_env)
+        if self.workers > 1:
+            command = [sys.executable, "serve.py", "--workers", str(self.workers)]
+        else:
+            command = [sys.executable, "-m", "uvicorn", "app:app"]
+        self.app_process = subprocess.Popen(
+            command + ["--host", "127.0.0.1", "--port", str(self.app_port)],
+            cwd=BACKEND_DIR,
+            env=env,
+        )
+        self.processes.append(self.app_process)
+        try:
+            wait_for(f"{self.base_url}/readyz", self.ready_timeout_s, self.app_process)
+            if self.workers > 1:
+                # /readyz answered by one worker; give the others the same startup budget
+                self.wait_for_workers()
+        except Exception:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def wait_for_workers(self):
+        deadline = time.monotonic() + self.ready_timeout_s
+        pids = set()
+        while time.monotonic() < deadline and len(pids) < self.workers:
+            try:
+                pids.add(httpx.get(f"{self.base_url}/readyz", timeout=2.0).json().get("pid"))
+            except (httpx.TransportError, ValueError):
+                pass
+            time.sleep(0.1)
+
+    def __exit__(self, exc_type, exc, tb):
+        for process in reversed(self.processes):
+            if process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+        self.processes = []
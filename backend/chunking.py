@@ -0,0 +1,73 @@
+"""
+Helpers for embedding documents longer than SciBERT's 512-token window.
+
+A document is split into overlapping token windows, every window is embedded
+in one padded batch, and the per-window vectors are combined into a single
+document vector (or, for "maxsim", kept separate and matched individually).
+"""
+import numpy as np
+
+POOLING_STRATEGIES = ("mean", "weighted", "maxsim")
+
+
+def sliding_windows(token_ids: list, window: int, overlap: int) -> list:
+    """
+    Splits token ids into windows of at most `window` tokens.
+
+    Consecutive windows share `overlap` tokens so sentences cut at a boundary
+    still appear whole in one of them. Cost stays linear in document length:
+    a document of L tokens yields about L / (window - overlap) windows.
+    """
+    if window <= 0:
+        raise ValueError("window must be positive")
+    overlap = max(0, min(int(overlap), window - 1))
+    if len(token_ids) <= window:
+        return [list(token_ids)]
+
+    stride = window - overlap
+    windows = []
+    for start in range(0, len(token_ids), stride):
+        windows.append(list(token_ids[start:start + window]))
+        if start + window >= len(token_ids):
+            break
+    return windows
+
+
+def pool_chunks(vectors, lengths, strategy: str = "mean") -> np.ndarray:
+    """
+    Combines per-window vectors of shape (n_chunks, dim) into one document vector.
+
+    "mean" averages windows equally; "weighted" weights each window by its token
+    count so a short trailing window does not count as much as a full one.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if strategy == "mean":
+        return vectors.mean(axis=0)
+    if strategy == "weighted":
+        weights = np.asarray(lengths, dtype=np.float32)
+        return (vectors * weights[:, None]).sum(axis=0) / max(float(weights.sum()), 1e-9)
+    raise ValueError(f"Unknown pooling strategy '{strategy}'. Expected one of: mean, weighted")
+
+
+def merge_maxsim_results(results, top_n: int):
+    """
+    Merges a multi-query (one query per chunk) index response into one ranking.
+
+    Each journal keeps its best (lowest) distance over all chunks, i.e. the
+    journal is scored by the chunk of the paper it matches most closely. The
+    return value has the same nested shape as a single-query response.
+    """
+    best = {}
+    for q in range(len(results["ids"])):
+        for i, journal_id in enumerate(results["ids"][q]):
+            distance = results["distances"][q][i]
+            if journal_id not in best or distance < best[journal_id][0]:
+                best[journal_id] = (distance, results["metadatas"][q][i], results["documents"][q][i])
+
+    ranked = sorted(best.items(), key=lambda item: item[1][0])[:top_n]
+    return {
+        "ids": [[journal_id for journal_id, _ in ranked]],
+        "distances": [[entry[0] for _, entry in ranked]],
+        "metadatas": [[entry[1] for _, entry in ranked]],
+        "documents": [[entry[2] for _, entry in ranked]],
+    }
@@ -0,0 +1,180 @@
+"""
+Two-tier, content-addressed cache for text embeddings.
+
+Tier 1 is a bounded in-memory LRU (evicts by total vector bytes). Tier 2 is a
+SQLite file that survives restarts and is shared between uvicorn workers on the
+same host (WAL mode allows concurrent readers alongside a writer).
+
+Keys are a SHA-256 of the model name, model revision and the normalised text,
+so switching models never serves stale vectors.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC, lower-cased, whitespace collapsed."""
+    # SciBERT scivocab_uncased lower-cases input anyway, so case never changes the vector
+    return " ".join(unicodedata.normalize("NFC", text).lower().split())
+
+
+def cache_key(text: str, model_name: str, revision: str, variant: str = "") -> str:
+    h = hashlib.sha256()
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update(revision.encode("utf-8"))
+    h.update(b"\0")
+    # Distinguishes different embeddings of the same text (e.g. chunked vs. truncated)
+    h.update(variant.encode("utf-8"))
+    h.update(b"\0")
+    h.update(normalize_text(text).encode("utf-8"))
+    return h.hexdigest()
+
+
+class LRUCache:
+    """Thread-safe LRU holding float32 vectors, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, int(max_bytes))
+        self.current_bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Updated under the lock: lookups come from the batcher and executor threads at once
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def put(self, key, value: np.ndarray):
+        size = value.nbytes
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+            self._data[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+
+
+class DiskStore:
+    """SQLite-backed key -> float32 vector store, safe to share between processes."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self.hits = 0
+        self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.hits += 1
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def put(self, key, value: np.ndarray):
+        blob = np.ascontiguousarray(value, dtype=np.float32).tobytes()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", (key, blob))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingCache:
+    """
+    Memory LRU in front of an optional on-disk store, with hit/miss counters.
+
+    The counters live in the LRU and the disk store and are updated under
+    their locks; a lookup that misses memory and then hits disk is a disk hit.
+    """
+
+    def __init__(self, model_name: str, revision: str = "main", max_bytes: int = 64 * 1024 * 1024, disk_path: str = None):
+        self.model_name = model_name
+        self.revision = revision
+        self.memory = LRUCache(max_bytes)
+        self.disk = DiskStore(disk_path) if disk_path else None
+
+    def key(self, text: str, variant: str = "") -> str:
+        return cache_key(text, self.model_name, self.revision, variant)
+
+    def get(self, text: str, variant: str = ""):
+        """Returns the cached vector for `text` as a float32 array, or None."""
+        key = self.key(text, variant)
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        if self.disk is not None:
+            try:
+                value = self.disk.get(key)
+            except sqlite3.Error as e:
+                print(f"[EmbeddingCache] Disk read failed: {e}")
+                value = None
+            if value is not None:
+                self.memory.put(key, value)
+                return value
+        return None
+
+    def put(self, text: str, vector, variant: str = ""):
+        key = self.key(text, variant)
+        value = np.asarray(vector, dtype=np.float32)
+        self.memory.put(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, value)
+            except sqlite3.Error as e:
+                print(f"[EmbeddingCache] Disk write failed: {e}")
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+    def stats(self) -> dict:
+        memory_hits = self.memory.hits
+        disk_hits = self.disk.hits if self.disk is not None else 0
+        misses = max(0, self.memory.misses - disk_hits)
+        lookups = memory_hits + disk_hits + misses
+        return {
+            "memory_hits": memory_hits,
+            "disk_hits": disk_hits,
+            "misses": misses,
+            "hit_rate": round((memory_hits + disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_evictions": self.memory.evictions,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.current_bytes,
+            "memory_max_bytes": self.memory.max_bytes,
+            "disk_path": self.disk.path if self.disk is not None else None,
+        }
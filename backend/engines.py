@@ -0,0 +1,251 @@
+"""
+Pluggable SciBERT inference engines.
+
+Every engine takes tokenized numpy arrays (input_ids, attention_mask) and
+returns mean-pooled float32 embeddings of shape (batch, 768), so the rest of
+the app does not care which runtime produced them:
+
+    torch      eager PyTorch AutoModel (reference)
+    onnx       ONNX Runtime, fp32 graph exported from the torch model
+    onnx-int8  ONNX Runtime, dynamically int8-quantized weights
+
+One-time export and quantization:
+    python engines.py export --out ./onnx_model [--quantize]
+
+Parity check of each engine against the torch reference:
+    python engines.py parity --engines onnx onnx-int8 --top-n 5
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from metrics import span
+
+ENGINE_CHOICES = ("torch", "onnx", "onnx-int8")
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model-int8.onnx"
+
+
+def mean_pool(last_hidden_state: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """Averages token embeddings per row, ignoring padding positions."""
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (last_hidden_state * mask).sum(axis=1)
+    return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+class TorchEngine:
+    """Reference engine: eager PyTorch forward pass."""
+
+    name = "torch"
+
+    def __init__(self, model_name: str, revision: str = "main", model=None):
+        import torch
+        from transformers import AutoModel
+
+        self.torch = torch
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.model = model if model is not None else AutoModel.from_pretrained(model_name, revision=revision)
+        self.model.to(self.device)
+        self.model.eval()
+
+    def _forward(self, input_ids: np.ndarray, attention_mask: np.ndarray):
+        torch = self.torch
+        input_ids = torch.from_numpy(np.asarray(input_ids, dtype=np.int64)).to(self.device)
+        attention_mask = torch.from_numpy(np.asarray(attention_mask, dtype=np.int64)).to(self.device)
+        with torch.no_grad():
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state, attention_mask
+
+    def last_hidden_state(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """The unpooled model output, (batch, sequence, 768); on CUDA this includes the copy to the CPU."""
+        return self._forward(input_ids, attention_mask)[0].cpu().numpy()
+
+    def embed(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        torch = self.torch
+        with span("forward"):
+            last_hidden_state, attention_mask = self._forward(input_ids, attention_mask)
+
+        # Pool on-device so only (batch, 768) is copied back to the CPU.
+        # On CUDA the forward span only covers the kernel launches; the sync lands in "pool".
+        with span("pool"):
+            mask = attention_mask.unsqueeze(-1).expand(last_hidden_state.size()).float()
+            summed = torch.sum(last_hidden_state * mask, dim=1)
+            counts = torch.clamp(mask.sum(dim=1), min=1e-9)
+            return (summed / counts).cpu().numpy()
+
+
+class OnnxEngine:
+    """ONNX Runtime engine for an exported (optionally int8-quantized) SciBERT graph."""
+
+    def __init__(self, model_path: str, name: str = "onnx", intra_op_threads: int = 0):
+        import onnxruntime as ort
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"ONNX model not found at '{model_path}'. Run `python engines.py export` first."
+            )
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.name = name
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def last_hidden_state(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """The unpooled model output, (batch, sequence, 768)."""
+        input_ids = np.asarray(input_ids, dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": np.asarray(attention_mask, dtype=np.int64)}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        return self.session.run(["last_hidden_state"], feeds)[0]
+
+    def embed(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        with span("forward"):
+            last_hidden_state = self.last_hidden_state(input_ids, attention_mask)
+        with span("pool"):
+            return mean_pool(last_hidden_state, attention_mask)
+
+
+def load_engine(kind: str, model_name: str, revision: str = "main", onnx_dir: str = "./onnx_model", intra_op_threads: int = 0):
+    """Creates the engine selected by `kind` (one of ENGINE_CHOICES)."""
+    kind = kind.lower()
+    if kind == "torch":
+        return TorchEngine(model_name, revision)
+    if kind == "onnx":
+        return OnnxEngine(os.path.join(onnx_dir, ONNX_FP32_FILE), "onnx", intra_op_threads)
+    if kind == "onnx-int8":
+        return OnnxEngine(os.path.join(onnx_dir, ONNX_INT8_FILE), "onnx-int8", intra_op_threads)
+    raise ValueError(f"Unknown embedding engine '{kind}'. Expected one of: {', '.join(ENGINE_CHOICES)}")
+
+
+# --- Export ---
+
+def export_onnx(model_name: str, out_dir: str, revision: str = "main", quantize: bool = False, opset: int = 17):
+    """Exports the torch model to ONNX with dynamic batch/sequence axes, optionally quantizing it."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    class LastHiddenState(torch.nn.Module):
+        # Wraps the model so the graph has a single, named tensor output
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name, revision=revision)
+    model = AutoModel.from_pretrained(model_name, revision=revision).eval()
+    sample = tokenizer(["a sample input", "another, slightly longer sample input"], padding=True, return_tensors="pt")
+
+    fp32_path = os.path.join(out_dir, ONNX_FP32_FILE)
+    print(f"Exporting '{model_name}' to {fp32_path} (opset {opset})...")
+    with torch.no_grad():
+        torch.onnx.export(
+            LastHiddenState(model),
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=opset,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(out_dir, ONNX_INT8_FILE)
+        print(f"Quantizing weights to int8 -> {int8_path}...")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    with open(os.path.join(out_dir, "export.json"), "w", encoding="utf-8") as f:
+        json.dump({"model_name": model_name, "revision": revision, "opset": opset, "quantized": quantize}, f, indent=4)
+    print("Export complete.")
+
+
+# --- Parity check ---
+
+def _embed_all(engine, tokenizer, texts, batch_size=16):
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        encoded = tokenizer(texts[start:start + batch_size], padding=True, truncation=True, max_length=512, return_tensors="np")
+        vectors.append(engine.embed(encoded["input_ids"], encoded["attention_mask"]))
+    return np.concatenate(vectors, axis=0)
+
+
+def _unit(matrix):
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+
+def parity_report(engines: list, model_name: str, revision: str, onnx_dir: str, metadata_path: str, top_n: int = 5, n_corpus: int = 500):
+    """
+    Compares each engine's embeddings with the torch reference.
+
+    Reports the cosine similarity between engine and reference vectors for the
+    same text, and the overlap of top-n neighbours when both sets of query
+    vectors are searched against a corpus embedded by the reference engine
+    (the situation in production, where the index was built with torch).
+    """
+    from transformers import AutoTokenizer
+
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        journals = json.load(f)
+    names = [j["display_name"] for j in journals.values() if j.get("display_name")]
+    corpus_texts = names[:n_corpus]
+    query_texts = names[n_corpus:n_corpus + 100] or names[:100]
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name, revision=revision)
+    reference = load_engine("torch", model_name, revision)
+    corpus = _unit(_embed_all(reference, tokenizer, corpus_texts))
+    ref_queries = _unit(_embed_all(reference, tokenizer, query_texts))
+    ref_top = np.argsort(-(ref_queries @ corpus.T), axis=1)[:, :top_n]
+
+    report = {}
+    for kind in engines:
+        engine = load_engine(kind, model_name, revision, onnx_dir)
+        start = time.perf_counter()
+        queries = _unit(_embed_all(engine, tokenizer, query_texts))
+        elapsed = time.perf_counter() - start
+
+        cosines = (queries * ref_queries).sum(axis=1)
+        top = np.argsort(-(queries @ corpus.T), axis=1)[:, :top_n]
+        overlap = [len(set(a) & set(b)) / top_n for a, b in zip(top, ref_top)]
+        report[kind] = {
+            "cosine_mean": float(cosines.mean()),
+            "cosine_min": float(cosines.min()),
+            f"top{top_n}_overlap_mean": float(np.mean(overlap)),
+            f"top{top_n}_overlap_min": float(np.min(overlap)),
+            "queries_per_sec": len(query_texts) / elapsed,
+        }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export SciBERT to ONNX and check engine parity.")
+    parser.add_argument("--model", default="allenai/scibert_scivocab_uncased")
+    parser.add_argument("--revision", default="main")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Export the torch model to ONNX")
+    export.add_argument("--out", default="./onnx_model")
+    export.add_argument("--quantize", action="store_true", help="Also write a dynamic int8 quantized model")
+
+    parity = sub.add_parser("parity", help="Compare engines against the torch reference")
+    parity.add_argument("--engines", nargs="+", default=["onnx", "onnx-int8"], choices=ENGINE_CHOICES)
+    parity.add_argument("--onnx-dir", default="./onnx_model")
+    parity.add_argument("--metadata", default="../db/journals_metadata.json")
+    parity.add_argument("--top-n", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(args.model, args.out, args.revision, args.quantize)
+    else:
+        print(json.dumps(parity_report(args.engines, args.model, args.revision, args.onnx_dir, args.metadata, args.top_n), indent=4))
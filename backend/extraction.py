@@ -0,0 +1,137 @@
+"""
+Page-by-page text extraction from uploaded papers.
+
+`open_document` returns the page count (when the format knows it) and a
+generator of page texts, so callers can start embedding the first pages
+while later ones are still being parsed. Memory is bounded (one page or
+block of text per step) only for DOCX and plain text:
+
+  - PDF: pypdf, one page at a time, reading objects from the open file as
+    they are needed, so the raw file is never held. Memory is NOT bounded:
+    pypdf keeps every object it has parsed for the life of the reader, so it
+    grows with the pages read so far; only the caller's character cap
+    limits it.
+  - DOCX: word/document.xml streamed with iterparse; paragraphs are grouped
+    into blocks of about DOCX_BLOCK_CHARS characters, which stand in for
+    pages since the format has no fixed pagination.
+  - Plain text: read in blocks of the same size.
+"""
+import codecs
+import os
+import zipfile
+import xml.etree.ElementTree as ET
+
+DOCX_BLOCK_CHARS = 4000
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt", ".md")
+
+
+class UnsupportedDocumentError(ValueError):
+    """The upload is not a format this module can read."""
+
+
+def document_kind(filename: str, content_type: str = None) -> str:
+    extension = os.path.splitext(filename or "")[1].lower()
+    content_type = (content_type or "").lower()
+    if extension == ".pdf" or content_type == "application/pdf":
+        return "pdf"
+    if extension == ".docx" or "wordprocessingml" in content_type:
+        return "docx"
+    if extension in (".txt", ".md") or content_type.startswith("text/"):
+        return "text"
+    raise UnsupportedDocumentError(
+        f"Unsupported file type '{extension or content_type}'. Expected one of: {', '.join(SUPPORTED_EXTENSIONS)}"
+    )
+
+
+def pdf_pages(path: str):
+    # Imported here so the app starts without pypdf; only uploads need it
+    from pypdf import PdfReader
+    from pypdf.errors import PdfReadError
+
+    # PdfReader(path) would read the whole file into memory; given an open file
+    # it seeks and reads objects on demand instead
+    f = open(path, "rb")
+    try:
+        reader = PdfReader(f)
+        page_count = len(reader.pages)
+    except PdfReadError as e:
+        f.close()
+        raise UnsupportedDocumentError(f"Not a valid PDF file: {e}")
+    except BaseException:
+        f.close()
+        raise
+
+    def pages():
+        with f:
+            for page in reader.pages:
+                yield page.extract_text() or ""
+
+    return page_count, pages()
+
+
+def docx_blocks(path: str, block_chars: int = DOCX_BLOCK_CHARS):
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile as e:
+        raise UnsupportedDocumentError(f"Not a valid DOCX file: {e}")
+    if "word/document.xml" not in archive.namelist():
+        archive.close()
+        raise UnsupportedDocumentError("Not a valid DOCX file: word/document.xml is missing")
+
+    def blocks():
+        with archive, archive.open("word/document.xml") as xml:
+            paragraphs, size = [], 0
+            for _, element in ET.iterparse(xml, events=("end",)):
+                if element.tag != f"{_W}p":
+                    continue
+                text = "".join(node.text or "" for node in element.iter(f"{_W}t"))
+                # Parsed paragraphs are dropped right away, so memory does not grow with the document
+                element.clear()
+                if not text:
+                    continue
+                paragraphs.append(text)
+                size += len(text)
+                if size >= block_chars:
+                    yield "\n".join(paragraphs)
+                    paragraphs, size = [], 0
+            if paragraphs:
+                yield "\n".join(paragraphs)
+
+    return None, blocks()
+
+
+def text_blocks(path: str, block_chars: int = DOCX_BLOCK_CHARS):
+    def blocks():
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        carry = ""
+        with open(path, "rb") as f:
+            while True:
+                raw = f.read(block_chars)
+                text = carry + decoder.decode(raw, final=not raw)
+                if not raw:
+                    if text:
+                        yield text
+                    return
+                # Blocks end at whitespace so no word is split between two of them
+                cut = max(text.rfind(" "), text.rfind("\n"))
+                if cut <= 0 and len(text) < 4 * block_chars:
+                    carry = text
+                    continue
+                if cut <= 0:
+                    cut = len(text)  # no whitespace at all; split anyway to keep memory bounded
+                carry = text[cut:]
+                yield text[:cut]
+
+    return None, blocks()
+
+
+def open_document(path: str, filename: str, content_type: str = None):
+    """(page count or None, generator of page texts) for an uploaded file."""
+    kind = document_kind(filename, content_type)
+    if kind == "pdf":
+        return pdf_pages(path)
+    if kind == "docx":
+        return docx_blocks(path)
+    return text_blocks(path)
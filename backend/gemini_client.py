@@ -0,0 +1,190 @@
+"""
+Client-side flow control for calls to the Gemini API.
+
+GeminiClient wraps the shared httpx.AsyncClient with:
+  - an adaptive token bucket: the send rate halves on every 429 and creeps back
+    up on successes (AIMD), so we settle just under the quota instead of
+    bursting into it;
+  - a concurrency cap on requests in flight (backoff sleeps do not hold a slot);
+  - retries with exponential backoff and full jitter for 429 / 5xx / network
+    errors, honouring Retry-After headers and Gemini RetryInfo.retryDelay hints.
+"""
+import asyncio
+import random
+import re
+import time
+
+import httpx
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class AdaptiveTokenBucket:
+    """Token bucket whose refill rate adapts to upstream 429 responses."""
+
+    def __init__(self, rate: float, burst: int, min_rate: float = 0.2, increase_step: float = 0.05):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.increase_step = float(increase_step)
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Waits until a token is available (and any upstream pause has passed)."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttled(self, retry_after: float = None):
+        self.rate = max(self.min_rate, self.rate / 2.0)
+        self.tokens = min(self.tokens, 0.0)
+        if retry_after:
+            # Everyone waits out the upstream's hint, not just the request that got it
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+
+def parse_retry_hint(response: httpx.Response):
+    """Returns the server-suggested delay in seconds, if the response carries one."""
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            pass
+    # Gemini puts google.rpc.RetryInfo in error.details, e.g. {"retryDelay": "12s"}
+    try:
+        details = response.json().get("error", {}).get("details", [])
+    except Exception:
+        return None
+    for detail in details:
+        match = re.fullmatch(r"([0-9.]+)s", str(detail.get("retryDelay", "")))
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class GeminiClient:
+    """Rate-limited, concurrency-capped, retrying wrapper around an httpx.AsyncClient."""
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        rate: float = 5.0,
+        burst: int = 5,
+        max_concurrency: int = 8,
+        max_retries: int = 4,
+        backoff_base_s: float = 0.5,
+        backoff_max_s: float = 20.0,
+    ):
+        self.client = client
+        self.bucket = AdaptiveTokenBucket(rate, burst)
+        self.semaphore = asyncio.Semaphore(max(1, int(max_concurrency)))
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+
+        self.requests_sent = 0
+        self.retries = 0
+        self.throttled = 0
+        self.status_counts = {}
+
+    def backoff_delay(self, attempt: int, hint: float = None) -> float:
+        """Exponential backoff with full jitter, never shorter than the server's hint."""
+        delay = random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * (2 ** attempt)))
+        return max(delay, hint or 0.0)
+
+    def _record(self, response: httpx.Response):
+        self.status_counts[response.status_code] = self.status_counts.get(response.status_code, 0) + 1
+        if response.status_code == 429:
+            self.throttled += 1
+            self.bucket.on_throttled(parse_retry_hint(response))
+        elif response.status_code < 400:
+            self.bucket.on_success()
+
+    async def _send_with_retries(self, build_request, stream: bool) -> httpx.Response:
+        """
+        Sends until a final response, retrying retryable failures.
+
+        The concurrency slot is taken per attempt, around the send, and freed
+        before any backoff sleep, so a request waiting out a Retry-After does
+        not block others. For streams the slot of the returned response stays
+        held; the caller releases it when the stream is closed.
+        """
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            await self.semaphore.acquire()
+            keep_slot = False
+            try:
+                self.requests_sent += 1
+                try:
+                    response = await self.client.send(build_request(), stream=stream)
+                except httpx.TransportError:
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self.backoff_delay(attempt)
+                else:
+                    if stream and response.status_code in RETRYABLE_STATUS:
+                        # Error bodies are small; read them so retry hints can be parsed
+                        await response.aread()
+                    self._record(response)
+                    if response.status_code not in RETRYABLE_STATUS or attempt >= self.max_retries:
+                        keep_slot = stream
+                        return response
+                    hint = parse_retry_hint(response)
+                    await response.aclose()
+                    delay = self.backoff_delay(attempt, hint)
+            finally:
+                if not keep_slot:
+                    self.semaphore.release()
+
+            attempt += 1
+            self.retries += 1
+            print(f"[Gemini] Retrying in {delay:.2f}s (attempt {attempt}/{self.max_retries})")
+            await asyncio.sleep(delay)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        """POSTs with flow control and retries; returns the final (possibly error) response."""
+        return await self._send_with_retries(lambda: self.client.build_request("POST", url, **kwargs), stream=False)
+
+    async def open_stream(self, url: str, **kwargs):
+        """
+        Opens a streaming POST with the same flow control.
+
+        Retries only happen before any body has been relayed. Returns
+        (response, release): call `release()` after closing the response to
+        free the concurrency slot held for the stream's lifetime.
+        """
+        response = await self._send_with_retries(lambda: self.client.build_request("POST", url, **kwargs), stream=True)
+        return response, self.semaphore.release
+
+    def stats(self) -> dict:
+        return {
+            "requests_sent": self.requests_sent,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "current_rate_per_s": round(self.bucket.rate, 3),
+            "max_rate_per_s": self.bucket.max_rate,
+            "max_concurrency": self.max_concurrency,
+            "status_counts": {str(k): v for k, v in sorted(self.status_counts.items())},
+        }
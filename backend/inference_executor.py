@@ -0,0 +1,87 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    """Raised when the executor's admission queue is full and a job is shed."""
+
+
+class InferenceExecutor:
+    """
+    Dedicated thread pool for CPU-heavy inference jobs with bounded admission.
+
+    At most `max_workers` jobs run at once and at most `max_queue` more may wait.
+    Anything beyond that is rejected immediately with QueueFullError instead of
+    queueing without limit, so overload turns into fast 503s rather than
+    client timeouts. Jobs never touch Starlette's shared anyio threadpool.
+
+    `run()` must be awaited from the event loop thread; the admission counters
+    are only modified there (completions are handed back with
+    call_soon_threadsafe), so they need no lock.
+    """
+
+    def __init__(self, max_workers: int = 16, max_queue: int = 64, name: str = "inference"):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self.in_flight = 0
+
+        self.completed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Admitted jobs that are still waiting for a worker thread."""
+        return max(0, self.in_flight - self.max_workers)
+
+    def has_capacity(self) -> bool:
+        """Whether run() would admit a job right now (for callers that must reject before streaming)."""
+        return self.in_flight < self.max_workers + self.max_queue
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) on the pool, or raises QueueFullError if saturated."""
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(f"Inference queue is full ({self.max_queue} waiting)")
+
+        loop = asyncio.get_running_loop()
+        # Carry the caller's contextvars (e.g. the request's timing spans) into the worker thread
+        context = contextvars.copy_context()
+        future = self._pool.submit(functools.partial(context.run, fn, *args, **kwargs))
+        self.in_flight += 1
+        # A job holds its slot until the pool is done with it, not until the caller stops
+        # waiting: a disconnected client's job keeps running (or stays queued) and still counts.
+        future.add_done_callback(lambda f: self._call_in_loop(loop, self._release, f))
+        # Cancelling the caller cancels a job that has not started yet, which frees its slot
+        return await asyncio.wrap_future(future, loop=loop)
+
+    @staticmethod
+    def _call_in_loop(loop, callback, *args):
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            pass  # the loop has been closed during shutdown
+
+    def _release(self, future):
+        self.in_flight -= 1
+        if future.cancelled():
+            self.cancelled += 1
+        else:
+            self.completed += 1
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,300 @@
+"""
+IVF-PQ approximate nearest-neighbour index over paper embeddings (numpy only).
+
+The paper-level corpus (recent papers of every journal, embedded with the
+same SciBERT mean pooling; see notebooks/paper_corpus.py) runs to millions of
+768-d vectors, too many for a flat scan per request. The index:
+
+  - IVF: k-means splits the corpus into `nlist` cells; a query only scans
+    the `nprobe` cells whose centroids are closest to it.
+  - PQ: each vector's residual from its centroid is split into `m`
+    sub-vectors, each stored as one byte (the nearest of 256 sub-centroids),
+    so a 768-d vector takes `m` bytes instead of 3 KB. Distances are computed
+    from a per-query lookup table (asymmetric distance computation).
+  - Optional int8 refine codes (one scaled byte per dimension) re-rank the
+    best PQ candidates with near-exact similarities.
+
+Codes are stored grouped by cell, so every probed cell is one contiguous
+slice of a memory-mapped file.
+
+On-disk layout (one directory):
+    meta.json            dims, nlist, m, refine, counts
+    centroids.npy        (nlist, d) float32 coarse centroids
+    codebooks.npy        (m, 256, d / m) float32 PQ sub-centroids
+    list_offsets.npy     (nlist + 1,) int64 start of each cell in the code arrays
+    codes.npy            (n, m) uint8 PQ codes, grouped by cell
+    vector_rows.npy      (n,) int64 corpus row of each code
+    refine.npy           (n, d) int8 refine codes (optional), same order as codes
+    refine_scale.npy     (d,) float32 per-dimension int8 scale
+    paper_journals.npy   (n_corpus,) int32 journal row of each corpus paper
+    journals.json        {"ids": [...], "names": [...]}
+    titles.bin / title_offsets.npy   paper titles as a UTF-8 blob + offsets
+
+Build it from a consolidated corpus with:
+    python ivfpq.py build --corpus ../notebooks/paper_corpus --out ./paper_index --nlist 1024 --m 48
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+META_FILE = "meta.json"
+PQ_CENTROIDS = 256
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+
+def nearest_centroids(x: np.ndarray, centroids: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+    """Index of the nearest centroid (squared L2) for every row of x."""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), batch_size):
+        block = np.asarray(x[start:start + batch_size], dtype=np.float32)
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2; ||x||^2 does not change the argmin
+        labels[start:start + len(block)] = np.argmin(centroid_norms - 2.0 * block @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(x: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means; empty clusters are re-seeded from random points."""
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float32)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = nearest_centroids(x, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, x)
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+        empty = np.flatnonzero(~nonempty)
+        if len(empty):
+            centroids[empty] = x[rng.choice(len(x), size=len(empty), replace=False)]
+    return centroids
+
+
+def train(sample: np.ndarray, nlist: int, m: int, iterations: int = 20, seed: int = 0):
+    """Trains coarse centroids and PQ codebooks on a sample of unit vectors."""
+    dim = sample.shape[1]
+    if dim % m:
+        raise ValueError(f"Dimension {dim} is not divisible by m={m}")
+    if len(sample) < PQ_CENTROIDS:
+        raise ValueError(f"Need at least {PQ_CENTROIDS} training vectors, got {len(sample)}")
+    print(f"[IVF-PQ] Training {nlist} coarse centroids on {len(sample)} vectors...")
+    centroids = kmeans(sample, nlist, iterations, seed)
+    residuals = sample - centroids[nearest_centroids(sample, centroids)]
+
+    sub = dim // m
+    codebooks = np.empty((m, PQ_CENTROIDS, sub), dtype=np.float32)
+    print(f"[IVF-PQ] Training {m} PQ codebooks of {PQ_CENTROIDS} x {sub}-d...")
+    for j in range(m):
+        codebooks[j] = kmeans(residuals[:, j * sub:(j + 1) * sub], PQ_CENTROIDS, iterations, seed + j + 1)
+    return centroids, codebooks
+
+
+def pq_encode(residuals: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+    m, _, sub = codebooks.shape
+    codes = np.empty((len(residuals), m), dtype=np.uint8)
+    for j in range(m):
+        codes[:, j] = nearest_centroids(residuals[:, j * sub:(j + 1) * sub], codebooks[j])
+    return codes
+
+
+class IVFPQIndex:
+    """Memory-mapped IVF-PQ index; see the module docstring for the layout."""
+
+    def __init__(self, path: str, mmap: bool = True):
+        mode = "r" if mmap else None
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode=mode)
+
+        self.centroids = np.load(os.path.join(path, "centroids.npy"))
+        self.codebooks = np.load(os.path.join(path, "codebooks.npy"))
+        self.list_offsets = np.load(os.path.join(path, "list_offsets.npy"))
+        self.codes = load("codes.npy")
+        self.vector_rows = load("vector_rows.npy")
+        self.paper_journals = load("paper_journals.npy")
+        self.refine = load("refine.npy") if self.meta.get("refine") == "int8" else None
+        self.refine_scale = np.load(os.path.join(path, "refine_scale.npy")) if self.refine is not None else None
+        self.title_offsets = load("title_offsets.npy")
+        self.titles = np.memmap(os.path.join(path, "titles.bin"), dtype=np.uint8, mode="r") \
+            if os.path.getsize(os.path.join(path, "titles.bin")) else np.empty(0, dtype=np.uint8)
+        with open(os.path.join(path, "journals.json"), "r", encoding="utf-8") as f:
+            journals = json.load(f)
+        self.journal_ids = journals["ids"]
+        self.journal_names = journals["names"]
+        self.m, _, self.sub = self.codebooks.shape
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        return cls(path, mmap)
+
+    def count(self) -> int:
+        return len(self.codes)
+
+    def title(self, corpus_row: int) -> str:
+        start, end = self.title_offsets[corpus_row], self.title_offsets[corpus_row + 1]
+        return bytes(self.titles[start:end]).decode("utf-8")
+
+    def search(self, query: np.ndarray, k: int, nprobe: int = 16, rerank: int = 0):
+        """
+        Returns (corpus_rows, cosine similarities) of the approximate top-k papers, best first.
+
+        Only the `nprobe` closest cells are scanned. With refine codes and
+        rerank > k, the best `rerank` PQ candidates are re-scored with the
+        int8 codes before the top-k are taken.
+        """
+        query = normalize_rows(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+        nprobe = max(1, min(int(nprobe), len(self.centroids)))
+        coarse = ((self.centroids - query) ** 2).sum(axis=1)
+        probe = np.argpartition(coarse, nprobe - 1)[:nprobe] if nprobe < len(coarse) else np.arange(len(coarse))
+
+        arange_m = np.arange(self.m)[None, :]
+        positions, distances = [], []
+        for cell in probe:
+            start, end = self.list_offsets[cell], self.list_offsets[cell + 1]
+            if start == end:
+                continue
+            residual = (query - self.centroids[cell]).reshape(self.m, 1, self.sub)
+            # (m, 256) table of squared distances from each query sub-vector to each sub-centroid
+            table = ((self.codebooks - residual) ** 2).sum(axis=2)
+            distances.append(table[arange_m, np.asarray(self.codes[start:end])].sum(axis=1))
+            positions.append(np.arange(start, end))
+        if not positions:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        positions = np.concatenate(positions)
+        distances = np.concatenate(distances)
+
+        keep = max(k, rerank) if self.refine is not None else k
+        keep = min(keep, len(positions))
+        best = np.argpartition(distances, keep - 1)[:keep] if keep < len(positions) else np.arange(len(positions))
+        positions = positions[best]
+        # Unit vectors: ||q - x||^2 = 2 - 2 cos(q, x)
+        sims = 1.0 - distances[best] / 2.0
+
+        if self.refine is not None and rerank > k:
+            order = np.argsort(positions)  # sorted reads from the memory-mapped refine codes
+            positions = positions[order]
+            sims = (np.asarray(self.refine[positions], dtype=np.float32) * self.refine_scale) @ query
+
+        top = np.argsort(-sims, kind="stable")[:k]
+        return np.asarray(self.vector_rows[positions[top]], dtype=np.int64), sims[top].astype(np.float32)
+
+
+def journal_votes(corpus_rows, sims, paper_journals, top_n: int, votes_per_journal: int = 5, journal_mask=None):
+    """
+    Aggregates nearest-paper hits into journal scores.
+
+    Each journal's score is the sum of the similarities of its best
+    `votes_per_journal` hits, so a journal is ranked by how many of its
+    papers are close to the query and how close they are, without a
+    journal that publishes a lot winning on volume alone. Journals excluded
+    by `journal_mask` (bool per journal row) are skipped.
+
+    Returns [(journal_row, score, [corpus_row, ...]), ...], best first.
+    """
+    scores = {}
+    hits = {}
+    for row, sim in zip(corpus_rows, sims):
+        journal = int(paper_journals[row])
+        if journal_mask is not None and not journal_mask[journal]:
+            continue
+        journal_hits = hits.setdefault(journal, [])
+        if len(journal_hits) >= votes_per_journal:
+            continue
+        journal_hits.append(int(row))
+        scores[journal] = scores.get(journal, 0.0) + float(sim)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_n]
+    return [(journal, score, hits[journal]) for journal, score in ranked]
+
+
+def build_index(corpus_dir: str, out_dir: str, nlist: int, m: int, train_size: int = 100_000,
+                refine: str = "none", iterations: int = 20, seed: int = 0, batch_size: int = 65536):
+    """Trains on a sample of the corpus, encodes every vector and writes the index directory."""
+    start = time.perf_counter()
+    corpus = np.load(os.path.join(corpus_dir, "embeddings.npy"), mmap_mode="r")
+    n, dim = corpus.shape
+    rng = np.random.default_rng(seed)
+    sample_rows = np.sort(rng.choice(n, size=min(train_size, n), replace=False))
+    centroids, codebooks = train(normalize_rows(corpus[sample_rows]), min(nlist, len(sample_rows)), m, iterations, seed)
+
+    print(f"[IVF-PQ] Encoding {n} vectors...")
+    labels = np.empty(n, dtype=np.int32)
+    codes = np.empty((n, m), dtype=np.uint8)
+    os.makedirs(out_dir, exist_ok=True)
+    refine_scale = None
+    if refine == "int8":
+        # Per-dimension scale from the sample; values beyond it are clipped
+        refine_scale = np.abs(normalize_rows(corpus[sample_rows])).max(axis=0) / 127.0
+        # Refine codes are as large as the corpus in int8, so they go through a file, not RAM
+        unsorted_path = os.path.join(out_dir, "refine.unsorted.npy")
+        refine_codes = np.lib.format.open_memmap(unsorted_path, mode="w+", dtype=np.int8, shape=(n, dim))
+    for block_start in range(0, n, batch_size):
+        block = normalize_rows(corpus[block_start:block_start + batch_size])
+        block_labels = nearest_centroids(block, centroids)
+        end = block_start + len(block)
+        labels[block_start:end] = block_labels
+        codes[block_start:end] = pq_encode(block - centroids[block_labels], codebooks)
+        if refine == "int8":
+            refine_codes[block_start:end] = np.clip(np.rint(block / refine_scale), -127, 127).astype(np.int8)
+
+    # Group by cell so each probed cell is one contiguous slice
+    order = np.argsort(labels, kind="stable")
+    list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+    list_offsets[1:] = np.cumsum(np.bincount(labels, minlength=len(centroids)))
+
+    np.save(os.path.join(out_dir, "centroids.npy"), centroids)
+    np.save(os.path.join(out_dir, "codebooks.npy"), codebooks)
+    np.save(os.path.join(out_dir, "list_offsets.npy"), list_offsets)
+    np.save(os.path.join(out_dir, "codes.npy"), codes[order])
+    np.save(os.path.join(out_dir, "vector_rows.npy"), order.astype(np.int64))
+    if refine == "int8":
+        sorted_codes = np.lib.format.open_memmap(os.path.join(out_dir, "refine.npy"), mode="w+", dtype=np.int8, shape=(n, dim))
+        for block_start in range(0, n, batch_size):
+            sorted_codes[block_start:block_start + batch_size] = refine_codes[order[block_start:block_start + batch_size]]
+        sorted_codes.flush()
+        del sorted_codes, refine_codes
+        os.remove(unsorted_path)
+        np.save(os.path.join(out_dir, "refine_scale.npy"), refine_scale.astype(np.float32))
+    for name in ("paper_journals.npy", "journals.json", "titles.bin", "title_offsets.npy"):
+        shutil.copyfile(os.path.join(corpus_dir, name), os.path.join(out_dir, name))
+
+    meta = {
+        "dim": dim,
+        "count": n,
+        "nlist": len(centroids),
+        "m": m,
+        "refine": refine,
+        "bytes_per_vector": m + (dim if refine == "int8" else 0),
+        "build_s": round(time.perf_counter() - start, 1),
+    }
+    with open(os.path.join(out_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=4)
+    return meta
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build an IVF-PQ index over the paper corpus.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("--corpus", default="../notebooks/paper_corpus")
+    build.add_argument("--out", default="./paper_index")
+    build.add_argument("--nlist", type=int, default=1024, help="Number of IVF cells (about sqrt(n) to 4*sqrt(n))")
+    build.add_argument("--m", type=int, default=48, help="PQ sub-quantizers = bytes per vector (must divide 768)")
+    build.add_argument("--train-size", type=int, default=100_000)
+    build.add_argument("--refine", choices=["none", "int8"], default="none", help="Also store int8 codes for re-ranking")
+    build.add_argument("--iterations", type=int, default=20)
+    build.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    meta = build_index(args.corpus, args.out, args.nlist, args.m, args.train_size, args.refine, args.iterations, args.seed)
+    print(f"Built IVF-PQ index over {meta['count']} papers in '{args.out}': {json.dumps(meta)}")
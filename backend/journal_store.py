@@ -0,0 +1,381 @@
+"""
+Compact columnar store for journal metadata (built from db/journals_metadata.json).
+
+Instead of a 26k-line nested JSON dict, the store keeps:
+  - numeric columns as typed arrays (works_count, cited_by_count, h_index,
+    i10_index, 2yr_mean_citedness, is_oa, is_in_doaj), one .npy file each;
+  - strings interned once into a UTF-8 blob plus an offsets array, with the
+    per-row string columns holding indexes into it;
+  - open-addressing hash indexes (64-bit key hash -> row) on the OpenAlex ID
+    and on every ISSN, stored as flat arrays.
+
+Everything is memory-mapped on load, so opening the store costs milliseconds
+and lookups are O(1) without building any Python dicts.
+
+For metadata filters the store also precomputes packed bitmaps (one bit per
+journal) for is_oa, is_in_doaj and every concept, plus each numeric column
+sorted with its row order, so "h_index >= x" is one searchsorted. Filters
+combine with bitwise AND over the packed bytes into a row mask.
+
+Build it with:
+    python journal_store.py build --metadata ../db/journals_metadata.json --out ./journal_store
+"""
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+
+MANIFEST_FILE = "store.json"
+NUMERIC_COLUMNS = {
+    "works_count": np.int64,
+    "cited_by_count": np.int64,
+    "h_index": np.int32,
+    "i10_index": np.int32,
+    # float64, like the JSON value: in float32 a journal exactly at a user's
+    # min_2yr_mean_citedness (e.g. 0.7 -> 0.69999999) would fall below it
+    "2yr_mean_citedness": np.float64,
+}
+BOOL_COLUMNS = ("is_oa", "is_in_doaj")
+STRING_COLUMNS = ("openalex_id", "display_name", "publisher", "homepage_url")
+MISSING_INT = -1  # Stored for null integer fields; null floats are NaN
+
+
+def short_id(openalex_id: str) -> str:
+    """'https://openalex.org/S137773608' -> 'S137773608' (short ids pass through)."""
+    return openalex_id.rsplit("/", 1)[-1]
+
+
+def normalize_issn(issn: str) -> str:
+    return issn.strip().upper().replace("-", "")
+
+
+def normalize_concept(concept: str) -> str:
+    return " ".join(concept.lower().split())
+
+
+def concept_names(journal: dict) -> list:
+    """Concept display names; OpenAlex sends dicts (x_concepts), older dumps plain strings."""
+    names = []
+    for concept in journal.get("concepts") or []:
+        name = concept.get("display_name") if isinstance(concept, dict) else concept
+        if name:
+            names.append(name)
+    return names
+
+
+def pack_bits(mask: np.ndarray) -> np.ndarray:
+    return np.packbits(np.asarray(mask, dtype=bool), bitorder="little")
+
+
+def key_hash(key: str) -> int:
+    """64-bit hash of a key; 0 is reserved for empty slots."""
+    value = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+    return value or 1
+
+
+class StringTable:
+    """Interned strings: each distinct string is stored once."""
+
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def intern(self, value) -> int:
+        if value is None:
+            return -1
+        value = str(value)
+        idx = self.index.get(value)
+        if idx is None:
+            idx = len(self.strings)
+            self.index[value] = idx
+            self.strings.append(value)
+        return idx
+
+    def to_arrays(self):
+        encoded = [s.encode("utf-8") for s in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def build_hash_index(keys: list, rows: list, key_strings: list):
+    """
+    Builds an open-addressing (linear probing) table at load factor <= 0.5.
+
+    Returns (slot_hashes uint64, slot_rows int32, slot_key_strings int32); the
+    string index lets lookups verify the exact key, not just its hash.
+    """
+    size = 1
+    while size < 2 * max(1, len(keys)):
+        size *= 2
+    slot_hashes = np.zeros(size, dtype=np.uint64)
+    slot_rows = np.full(size, -1, dtype=np.int32)
+    slot_keys = np.full(size, -1, dtype=np.int32)
+    mask = size - 1
+    for key, row, key_string in zip(keys, rows, key_strings):
+        h = key_hash(key)
+        slot = h & mask
+        while slot_hashes[slot] != 0:
+            slot = (slot + 1) & mask
+        slot_hashes[slot] = h
+        slot_rows[slot] = row
+        slot_keys[slot] = key_string
+    return slot_hashes, slot_rows, slot_keys
+
+
+def build_store(metadata_path: str, out_dir: str):
+    """Converts journals_metadata.json into the columnar on-disk layout."""
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        journals = list(json.load(f).values())
+
+    strings = StringTable()
+    n = len(journals)
+    numeric = {name: np.zeros(n, dtype=dtype) for name, dtype in NUMERIC_COLUMNS.items()}
+    bools = {name: np.zeros(n, dtype=np.uint8) for name in BOOL_COLUMNS}
+    string_cols = {name: np.full(n, -1, dtype=np.int32) for name in STRING_COLUMNS}
+    issn_keys, issn_rows, issn_strings = [], [], []
+    issn_offsets = np.zeros(n + 1, dtype=np.int32)
+    issn_values = []
+    concept_rows = {}  # normalized concept -> (display string index, member rows)
+
+    for row, journal in enumerate(journals):
+        stats = journal.get("summary_stats") or {}
+        values = {
+            "works_count": journal.get("works_count"),
+            "cited_by_count": journal.get("cited_by_count"),
+            "h_index": stats.get("h_index"),
+            "i10_index": stats.get("i10_index"),
+            "2yr_mean_citedness": stats.get("2yr_mean_citedness"),
+        }
+        for name, value in values.items():
+            if value is None:
+                numeric[name][row] = np.nan if numeric[name].dtype.kind == "f" else MISSING_INT
+            else:
+                numeric[name][row] = value
+        for name in BOOL_COLUMNS:
+            bools[name][row] = 1 if journal.get(name) else 0
+
+        string_cols["openalex_id"][row] = strings.intern(journal["id"])
+        string_cols["display_name"][row] = strings.intern(journal.get("display_name"))
+        string_cols["publisher"][row] = strings.intern(journal.get("publisher"))
+        string_cols["homepage_url"][row] = strings.intern(journal.get("homepage_url"))
+
+        for issn in journal.get("issn") or []:
+            issn_idx = strings.intern(issn)
+            issn_values.append(issn_idx)
+            issn_keys.append(normalize_issn(issn))
+            issn_rows.append(row)
+            issn_strings.append(issn_idx)
+        issn_offsets[row + 1] = len(issn_values)
+
+        for name in concept_names(journal):
+            entry = concept_rows.setdefault(normalize_concept(name), (strings.intern(name), []))
+            entry[1].append(row)
+
+    ids = [short_id(strings.strings[i]) for i in string_cols["openalex_id"]]
+    id_index = build_hash_index(ids, range(n), string_cols["openalex_id"])
+    issn_index = build_hash_index(issn_keys, issn_rows, issn_strings)
+
+    # One packed bitmap per concept (rows of a matrix), indexed by normalized name
+    concept_keys = sorted(concept_rows)
+    concept_bits = np.zeros((len(concept_keys), (n + 7) // 8), dtype=np.uint8)
+    for i, key in enumerate(concept_keys):
+        member = np.zeros(n, dtype=bool)
+        member[concept_rows[key][1]] = True
+        concept_bits[i] = pack_bits(member)
+    concept_index = build_hash_index(concept_keys, range(len(concept_keys)), [concept_rows[k][0] for k in concept_keys])
+
+    # Numeric columns sorted ascending (missing values left out) for range filters
+    sorted_columns = {}
+    for name, col in numeric.items():
+        present = ~np.isnan(col) if col.dtype.kind == "f" else col != MISSING_INT
+        rows = np.flatnonzero(present)
+        order = rows[np.argsort(col[rows], kind="stable")]
+        sorted_columns[f"sorted_{name}_values"] = col[order]
+        sorted_columns[f"sorted_{name}_rows"] = order.astype(np.int32)
+
+    blob, offsets = strings.to_arrays()
+
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {
+        **{f"col_{name}": col for name, col in numeric.items()},
+        **{f"col_{name}": col for name, col in bools.items()},
+        **{f"str_{name}": col for name, col in string_cols.items()},
+        **{f"bits_{name}": pack_bits(col) for name, col in bools.items()},
+        **sorted_columns,
+        "bits_concepts": concept_bits,
+        "issn_offsets": issn_offsets,
+        "issn_values": np.asarray(issn_values, dtype=np.int32),
+        "strings_blob": blob,
+        "strings_offsets": offsets,
+        "idx_id_hashes": id_index[0], "idx_id_rows": id_index[1], "idx_id_keys": id_index[2],
+        "idx_issn_hashes": issn_index[0], "idx_issn_rows": issn_index[1], "idx_issn_keys": issn_index[2],
+        "idx_concept_hashes": concept_index[0], "idx_concept_rows": concept_index[1], "idx_concept_keys": concept_index[2],
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), array)
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({"rows": n, "strings": len(strings.strings), "arrays": sorted(arrays)}, f, indent=4)
+    return n
+
+
+class JournalStore:
+    """Read-only, memory-mapped view of a built store."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in self.manifest["arrays"]
+        }
+        self.rows = self.manifest["rows"]
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def has_concepts(self) -> bool:
+        """Whether any journal has concepts; the shipped journals_metadata.json has none (all null)."""
+        return self.arrays["bits_concepts"].shape[0] > 0
+
+    @classmethod
+    def load(cls, path: str):
+        return cls(path)
+
+    # --- Columns ---
+
+    def column(self, name: str) -> np.ndarray:
+        """Typed column array (numeric or bool) for every row, e.g. column('h_index')."""
+        return self.arrays[f"col_{name}"]
+
+    def string(self, idx: int):
+        if idx < 0:
+            return None
+        offsets = self.arrays["strings_offsets"]
+        return bytes(self.arrays["strings_blob"][offsets[idx]:offsets[idx + 1]]).decode("utf-8")
+
+    # --- Lookups ---
+
+    def _probe(self, prefix: str, key: str, expected):
+        hashes = self.arrays[f"idx_{prefix}_hashes"]
+        mask = len(hashes) - 1
+        h = key_hash(key)
+        slot = h & mask
+        while hashes[slot] != 0:
+            if int(hashes[slot]) == h:
+                candidate = self.string(int(self.arrays[f"idx_{prefix}_keys"][slot]))
+                if candidate is not None and expected(candidate):
+                    return int(self.arrays[f"idx_{prefix}_rows"][slot])
+            slot = (slot + 1) & mask
+        return None
+
+    def row_by_id(self, openalex_id: str):
+        """Row for an OpenAlex source ID (full URL or short 'S...' form), or None."""
+        key = short_id(openalex_id)
+        return self._probe("id", key, lambda candidate: short_id(candidate) == key)
+
+    def row_by_issn(self, issn: str):
+        """Row for any of a journal's ISSNs (hyphen and case insensitive), or None."""
+        key = normalize_issn(issn)
+        return self._probe("issn", key, lambda candidate: normalize_issn(candidate) == key)
+
+    def rows_for_ids(self, ids: list) -> np.ndarray:
+        """Store row for each ID (-1 where unknown), e.g. to align the store with an index."""
+        return np.asarray([-1 if (row := self.row_by_id(i)) is None else row for i in ids], dtype=np.int64)
+
+    def ids_where(self, mask: np.ndarray) -> list:
+        """Short OpenAlex IDs ('S123...', the Chroma ids) of the rows selected by a boolean mask."""
+        id_column = self.arrays["str_openalex_id"]
+        return [short_id(self.string(int(id_column[row]))) for row in np.flatnonzero(mask)]
+
+    def issns(self, row: int) -> list:
+        offsets = self.arrays["issn_offsets"]
+        return [self.string(int(i)) for i in self.arrays["issn_values"][offsets[row]:offsets[row + 1]]]
+
+    def record(self, row: int) -> dict:
+        """Materialises one row as a plain dict."""
+        record = {name: self.string(int(self.arrays[f"str_{name}"][row])) for name in STRING_COLUMNS}
+        for name in NUMERIC_COLUMNS:
+            value = self.arrays[f"col_{name}"][row]
+            if np.issubdtype(value.dtype, np.floating):
+                record[name] = None if np.isnan(value) else float(value)
+            else:
+                record[name] = None if value == MISSING_INT else int(value)
+        for name in BOOL_COLUMNS:
+            record[name] = bool(self.arrays[f"col_{name}"][row])
+        record["issn"] = self.issns(row)
+        return record
+
+    # --- Filters ---
+
+    def _bool_bits(self, name: str, wanted: bool) -> np.ndarray:
+        bits = np.asarray(self.arrays[f"bits_{name}"])
+        # Padding bits past the last row are dropped again by unpackbits(count=rows)
+        return bits if wanted else np.invert(bits)
+
+    def _min_bits(self, name: str, threshold: float) -> np.ndarray:
+        values = self.arrays[f"sorted_{name}_values"]
+        if values.dtype.kind == "f":
+            # Stores built with float32 columns hold rounded values; round the threshold the same way
+            threshold = values.dtype.type(threshold)
+        start = np.searchsorted(values, threshold, side="left")
+        member = np.zeros(self.rows, dtype=bool)
+        member[self.arrays[f"sorted_{name}_rows"][start:]] = True
+        return pack_bits(member)
+
+    def _concept_bits(self, concept: str) -> np.ndarray:
+        key = normalize_concept(concept)
+        row = self._probe("concept", key, lambda candidate: normalize_concept(candidate) == key)
+        if row is None:
+            return np.zeros((self.rows + 7) // 8, dtype=np.uint8)
+        return np.asarray(self.arrays["bits_concepts"][row])
+
+    def filter_mask(self, open_access: bool = None, in_doaj: bool = None, min_h_index: int = None,
+                    min_2yr_mean_citedness: float = None, concept: str = None):
+        """
+        Boolean row mask for journals matching every given filter, or None if no filter is set.
+
+        Journals with a missing value never pass a minimum filter, and an
+        unknown concept matches nothing (so does every concept when the store
+        has no concept data; check has_concepts first).
+        """
+        parts = []
+        if open_access is not None:
+            parts.append(self._bool_bits("is_oa", open_access))
+        if in_doaj is not None:
+            parts.append(self._bool_bits("is_in_doaj", in_doaj))
+        if min_h_index is not None:
+            parts.append(self._min_bits("h_index", min_h_index))
+        if min_2yr_mean_citedness is not None:
+            parts.append(self._min_bits("2yr_mean_citedness", min_2yr_mean_citedness))
+        if concept:
+            parts.append(self._concept_bits(concept))
+        if not parts:
+            return None
+
+        bits = parts[0]
+        for part in parts[1:]:
+            bits = np.bitwise_and(bits, part)
+        return np.unpackbits(bits, count=self.rows, bitorder="little").astype(bool)
+
+    def get(self, openalex_id: str):
+        """Record for an OpenAlex ID, or None if the journal is unknown."""
+        row = self.row_by_id(openalex_id)
+        return None if row is None else self.record(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the columnar journal metadata store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("--metadata", default="../db/journals_metadata.json")
+    build.add_argument("--out", default="./journal_store")
+    args = parser.parse_args()
+
+    rows = build_store(args.metadata, args.out)
+    print(f"Built journal store with {rows} journals in '{args.out}'")
+    if not JournalStore.load(args.out).has_concepts:
+        print("Warning: no journal has concepts in the metadata; the concept filter will be rejected")
@@ -0,0 +1,155 @@
+"""
+In-memory BM25 inverted index over journal names, concepts and publishers.
+
+Short keyword queries from the chat flow ("GAN image synthesis journals") are
+answered straight from this index, without a SciBERT forward pass. Longer
+queries can fuse the lexical ranking with the dense one by reciprocal rank
+fusion (RRF), which only needs ranks, so BM25 scores and cosine distances
+never have to be put on a common scale.
+
+Postings hold each (term, journal) pair's BM25 term weight precomputed at
+build time, so a query is one array scatter-add per query term plus a
+partial sort over the touched journals.
+
+Results come back in the nested shape of `chromadb.Collection.query`
+(ids / documents / metadatas), with "scores" (higher is better) in place of
+"distances".
+"""
+import json
+import re
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Words that carry no topical signal in journal-search queries
+STOPWORDS = frozenset(
+    "a an and are as at by for from in into is it of on or the to with "
+    "journal journals paper papers about find suggest recommend best good top".split()
+)
+RRF_K = 60
+
+
+def tokenize(text: str) -> list:
+    return [t for t in TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+def journal_fields(journal: dict):
+    """(name, concepts, publisher) strings for a journals_metadata.json entry."""
+    concepts = []
+    for concept in journal.get("concepts") or []:
+        name = concept.get("display_name") if isinstance(concept, dict) else concept
+        if name:
+            concepts.append(name)
+    return journal.get("display_name") or "", ", ".join(concepts), journal.get("publisher") or ""
+
+
+class LexicalIndex:
+    """BM25 (k1, b) over one text field per journal."""
+
+    def __init__(self, ids: list, texts: list, documents: list = None, metadatas: list = None,
+                 k1: float = 1.5, b: float = 0.75):
+        self.ids = list(ids)
+        self.documents = list(documents) if documents is not None else list(texts)
+        self.metadatas = list(metadatas) if metadatas is not None else [{} for _ in self.ids]
+        self.k1 = k1
+        self.b = b
+
+        term_counts = [{} for _ in self.ids]
+        lengths = np.zeros(len(self.ids), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[row] = len(tokens)
+            for token in tokens:
+                term_counts[row][token] = term_counts[row].get(token, 0) + 1
+        avg_length = float(lengths.mean()) if len(lengths) else 0.0
+
+        postings = {}
+        for row, counts in enumerate(term_counts):
+            for term, tf in counts.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(row)
+                postings[term][1].append(tf)
+
+        n = len(self.ids)
+        self.postings = {}
+        for term, (rows, tfs) in postings.items():
+            rows = np.asarray(rows, dtype=np.int32)
+            tfs = np.asarray(tfs, dtype=np.float32)
+            idf = np.log(1.0 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = k1 * (1.0 - b + b * lengths[rows] / max(avg_length, 1e-9))
+            self.postings[term] = (rows, (idf * tfs * (k1 + 1.0) / (tfs + norm)).astype(np.float32))
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_metadata(cls, path: str, **kwargs):
+        """Builds the index from db/journals_metadata.json."""
+        with open(path, "r", encoding="utf-8") as f:
+            journals = json.load(f)
+        ids, texts, documents, metadatas = [], [], [], []
+        for journal_id, journal in journals.items():
+            name, concepts, publisher = journal_fields(journal)
+            # The metadata is keyed by full OpenAlex URLs; Chroma and NumpyIndex use the short
+            # 'S...' ids, and rank fusion only merges a journal when both rankings agree on it
+            ids.append(journal_id.rsplit("/", 1)[-1])
+            # The name is repeated so title matches outweigh a publisher match
+            texts.append(f"{name} {name} {concepts} {publisher}")
+            # Same document text the ingestion scripts store in Chroma
+            documents.append(f"{name}. Concepts: {concepts}")
+            metadatas.append({"name": name, "publisher": publisher, "concepts": concepts})
+        return cls(ids, texts, documents, metadatas, **kwargs)
+
+    def search(self, query: str, n_results: int, mask: np.ndarray = None):
+        """Returns (rows, scores) best first; only journals matching a query term are returned."""
+        scores = np.zeros(self.count(), dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                np.add.at(scores, posting[0], posting[1])
+        if mask is not None:
+            scores[~mask] = 0.0
+
+        hits = np.flatnonzero(scores > 0)
+        n = min(int(n_results), len(hits))
+        if n <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if n < len(hits):
+            hits = hits[np.argpartition(-scores[hits], n - 1)[:n]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return hits, scores[hits]
+
+    def query(self, query_text: str, n_results: int = 10, mask: np.ndarray = None):
+        """Single-query result in the nested chromadb shape, with "scores" instead of "distances"."""
+        rows, scores = self.search(query_text, n_results, mask=mask)
+        return {
+            "ids": [[self.ids[i] for i in rows]],
+            "documents": [[self.documents[i] for i in rows]],
+            "metadatas": [[self.metadatas[i] for i in rows]],
+            "scores": [[float(s) for s in scores]],
+        }
+
+
+def reciprocal_rank_fusion(rankings: list, top_n: int, k: int = RRF_K):
+    """
+    Fuses single-query results (nested chromadb shape) by reciprocal rank.
+
+    A journal's fused score is the sum of 1 / (k + rank) over the rankings it
+    appears in; documents and metadata come from the first ranking that has
+    the journal. Returns the same shape with "scores" (higher is better).
+    """
+    fused = {}
+    for results in rankings:
+        for rank, journal_id in enumerate(results["ids"][0]):
+            entry = fused.get(journal_id)
+            if entry is None:
+                entry = fused[journal_id] = [0.0, results["documents"][0][rank], results["metadatas"][0][rank]]
+            entry[0] += 1.0 / (k + rank + 1)
+
+    ranked = sorted(fused.items(), key=lambda item: item[1][0], reverse=True)[:top_n]
+    return {
+        "ids": [[journal_id for journal_id, _ in ranked]],
+        "documents": [[entry[1] for _, entry in ranked]],
+        "metadatas": [[entry[2] for _, entry in ranked]],
+        "scores": [[entry[0] for _, entry in ranked]],
+    }
@@ -0,0 +1,185 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Counters and histograms are plain Python objects guarded by one lock each;
+an observation is a bisect into the bucket bounds plus a few additions, a
+few microseconds, so instrumentation can stay on under load. Stats that
+components already keep (caches, batcher, executor, Gemini client) are not
+counted twice: collectors read them when /metrics is scraped.
+
+`span(stage)` times a block into the stage histogram and, when a request
+timing context is active (see `start_request_timing`), also records it for
+that request's Server-Timing header. The context is a contextvar, so it
+follows a request into the inference executor's threads.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans range from sub-millisecond (pooling, lexical search) to multi-second (Gemini)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.bounds = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.bounds) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Holds metrics plus collectors that report existing stats at scrape time."""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS, labelnames: tuple = ()) -> Histogram:
+        metric = Histogram(name, help_text, buckets, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn):
+        """
+        fn() returns [(name, type, help, [(labels_dict, value), ...]), ...].
+
+        Collectors that fail (e.g. a component that is not loaded yet) are skipped.
+        """
+        self.collectors.append(fn)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            try:
+                families = collector()
+            except Exception:
+                continue
+            for name, metric_type, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    label_names = tuple(labels)
+                    lines.append(f"{name}{_format_labels(label_names, tuple(labels[n] for n in label_names))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram(
+    "hackcors_stage_duration_seconds", "Time spent in each stage of the search and generate paths.", labelnames=("stage",)
+)
+
+
+# --- Spans and Server-Timing ---
+
+def start_request_timing():
+    """Starts collecting spans for the current request; returns a token for `end_request_timing`."""
+    return _request_timings.set([])
+
+
+def end_request_timing(token) -> list:
+    """Stops collecting and returns the request's [(stage, seconds), ...]."""
+    timings = _request_timings.get()
+    _request_timings.reset(token)
+    return timings or []
+
+
+def record_span(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str):
+    """Times the enclosed block as `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - start)
+
+
+def server_timing_header(timings: list) -> str:
+    """Server-Timing value; repeated stages (e.g. one forward pass per chunk batch) are summed."""
+    totals = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in totals.items())
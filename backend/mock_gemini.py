@@ -0,0 +1,147 @@
+"""
+Local stand-in for the Gemini generateContent API, for offline testing.
+
+Serves the two endpoints the backend calls:
+    POST /v1beta/models/<model>:generateContent
+    POST /v1beta/models/<model>:streamGenerateContent?alt=sse
+
+The streaming endpoint emits the reply in several SSE chunks with a delay
+between them, so time-to-first-token and incremental relaying can be observed.
+
+With --quota-rps the stand-in enforces a request quota like the real API does:
+requests over it get 429 RESOURCE_EXHAUSTED with a RetryInfo delay, which is
+what the client-side rate limiter and retry logic in gemini_client.py react to.
+
+Usage:
+    python mock_gemini.py --port 8081 --chunks 8 --first-token-ms 300 --chunk-delay-ms 80
+    python mock_gemini.py --port 8081 --quota-rps 2 --quota-burst 2
+    GEMINI_API_BASE=http://localhost:8081/v1beta GEMINI_API_KEY=test python app.py
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+settings = {
+    "chunks": 8,
+    "first_token_ms": 300.0,
+    "chunk_delay_ms": 80.0,
+    "quota_rps": 0.0,  # 0 disables the quota
+    "quota_burst": 1,
+}
+
+quota = {"tokens": 1.0, "updated": time.monotonic(), "accepted": 0, "rejected": 0}
+
+mock_app = FastAPI()
+
+
+def reply_text(prompt: str) -> str:
+    return f"This is a simulated Gemini reply to a prompt of {len(prompt)} characters. " * 3
+
+
+def split_chunks(text: str, n: int) -> list:
+    size = max(1, -(-len(text) // max(1, n)))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def candidate(text: str, finish: bool = False) -> dict:
+    body = {"content": {"parts": [{"text": text}], "role": "model"}}
+    if finish:
+        body["finishReason"] = "STOP"
+    return {"candidates": [body]}
+
+
+def take_quota() -> bool:
+    """Token-bucket quota: True if the request is within quota."""
+    if settings["quota_rps"] <= 0:
+        return True
+    now = time.monotonic()
+    quota["tokens"] = min(settings["quota_burst"], quota["tokens"] + (now - quota["updated"]) * settings["quota_rps"])
+    quota["updated"] = now
+    if quota["tokens"] >= 1.0:
+        quota["tokens"] -= 1.0
+        quota["accepted"] += 1
+        return True
+    quota["rejected"] += 1
+    return False
+
+
+def quota_exceeded() -> JSONResponse:
+    retry_delay = max(1, round(1.0 / settings["quota_rps"]))
+    return JSONResponse(
+        status_code=429,
+        content={
+            "error": {
+                "code": 429,
+                "message": "Resource has been exhausted (e.g. check quota).",
+                "status": "RESOURCE_EXHAUSTED",
+                "details": [
+                    {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{retry_delay}s"}
+                ],
+            }
+        },
+    )
+
+
+@mock_app.get("/quota")
+async def quota_stats():
+    return {"accepted": quota["accepted"], "rejected": quota["rejected"]}
+
+
+async def read_prompt(request: Request) -> str:
+    payload = await request.json()
+    return payload["contents"][0]["parts"][0]["text"]
+
+
+@mock_app.post("/v1beta/models/{model_method}")
+async def generate(model_method: str, request: Request):
+    if not take_quota():
+        return quota_exceeded()
+    prompt = await read_prompt(request)
+    text = reply_text(prompt)
+
+    if model_method.endswith(":generateContent"):
+        # The non-streaming call pays the full generation time before replying
+        total_ms = settings["first_token_ms"] + settings["chunk_delay_ms"] * (settings["chunks"] - 1)
+        await asyncio.sleep(total_ms / 1000.0)
+        return candidate(text, finish=True)
+
+    if model_method.endswith(":streamGenerateContent"):
+        pieces = split_chunks(text, settings["chunks"])
+
+        async def stream():
+            await asyncio.sleep(settings["first_token_ms"] / 1000.0)
+            for i, piece in enumerate(pieces):
+                if i:
+                    await asyncio.sleep(settings["chunk_delay_ms"] / 1000.0)
+                yield f"data: {json.dumps(candidate(piece, finish=i == len(pieces) - 1))}\r\n\r\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return JSONResponse(status_code=404, content={"error": {"code": 404, "message": f"Unknown method {model_method}"}})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Gemini API.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--chunks", type=int, default=settings["chunks"])
+    parser.add_argument("--first-token-ms", type=float, default=settings["first_token_ms"])
+    parser.add_argument("--chunk-delay-ms", type=float, default=settings["chunk_delay_ms"])
+    parser.add_argument("--quota-rps", type=float, default=settings["quota_rps"], help="Requests/s before answering 429 (0 = unlimited)")
+    parser.add_argument("--quota-burst", type=int, default=settings["quota_burst"])
+    args = parser.parse_args()
+
+    settings.update(
+        chunks=args.chunks,
+        first_token_ms=args.first_token_ms,
+        chunk_delay_ms=args.chunk_delay_ms,
+        quota_rps=args.quota_rps,
+        quota_burst=args.quota_burst,
+    )
+    quota["tokens"] = float(args.quota_burst)
+    uvicorn.run(mock_app, host=args.host, port=args.port)
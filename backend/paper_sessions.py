@@ -0,0 +1,209 @@
+"""
+Server-side paper sessions for retrieval-scoped chat.
+
+A paper is uploaded once: it is split into overlapping word windows
+(passages), each passage is embedded, and the passages plus their unit
+vectors are stored under a random session ID. Each chat turn then embeds
+only the question and picks the few passages closest to it, so the prompt
+carries a bounded excerpt drawn from anywhere in the paper instead of the
+whole text (or just its beginning) on every turn.
+
+Sessions live in a SQLite file (WAL mode), so every worker behind the same
+socket sees them and they survive restarts, with a small in-memory LRU in
+front. Sessions expire `ttl_s` after their last use.
+"""
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from chunking import sliding_windows
+
+
+def split_passages(text: str, words_per_passage: int, overlap_words: int) -> list:
+    """Overlapping word windows of the text, in document order."""
+    words = text.split()
+    if not words:
+        return []
+    return [" ".join(window) for window in sliding_windows(words, words_per_passage, overlap_words)]
+
+
+class PassageBuilder:
+    """
+    Incremental split_passages for text that arrives in pieces (e.g. page by page).
+
+    feed() returns the passages completed so far, finish() the last partial
+    one; together they yield exactly what split_passages gives for the whole text.
+    """
+
+    def __init__(self, words_per_passage: int, overlap_words: int):
+        self.window = max(1, int(words_per_passage))
+        self.overlap = max(0, min(int(overlap_words), self.window - 1))
+        self.words = []
+        self.fresh = 0  # buffered words not yet part of any passage
+
+    def feed(self, text: str) -> list:
+        new_words = text.split()
+        self.words.extend(new_words)
+        self.fresh += len(new_words)
+        passages = []
+        while len(self.words) >= self.window:
+            passages.append(" ".join(self.words[:self.window]))
+            self.words = self.words[self.window - self.overlap:]
+            self.fresh = len(self.words) - self.overlap
+        return passages
+
+    def finish(self) -> list:
+        passages = [" ".join(self.words)] if self.fresh > 0 else []
+        self.words, self.fresh = [], 0
+        return passages
+
+
+class PaperSession:
+    def __init__(self, session_id: str, passages: list, vectors: np.ndarray, created: float):
+        self.session_id = session_id
+        self.passages = passages
+        self.vectors = vectors  # (passages, dim) float32, unit rows
+        self.created = created
+
+    def closest(self, query_vector, k: int, always_first: bool = True) -> list:
+        """
+        Indexes of the k passages most similar to the query, in document order.
+
+        With always_first the opening passage (title and abstract, usually)
+        is always one of the k, since most questions about "my paper" need it.
+        """
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = self.vectors @ query
+        if always_first:
+            scores[0] = np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        return sorted(int(i) for i in top)
+
+
+class SessionStore:
+    """Paper sessions in SQLite (shared by workers) behind an in-memory LRU; path=None keeps them in memory."""
+
+    def __init__(self, path: str = None, ttl_s: float = 86400.0, max_memory_sessions: int = 64):
+        self.path = path
+        self.ttl_s = float(ttl_s)
+        self.max_memory_sessions = max(1, int(max_memory_sessions))
+        self._memory = OrderedDict()  # id -> (PaperSession, last_used)
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, created REAL NOT NULL, last_used REAL NOT NULL, "
+                "passages TEXT NOT NULL, dim INTEGER NOT NULL, vectors BLOB NOT NULL)"
+            )
+
+        self.created = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def _remember(self, session: PaperSession, last_used: float):
+        self._memory[session.session_id] = (session, last_used)
+        self._memory.move_to_end(session.session_id)
+        while len(self._memory) > self.max_memory_sessions:
+            self._memory.popitem(last=False)
+
+    def create(self, passages: list, vectors) -> PaperSession:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        now = time.time()
+        session = PaperSession(secrets.token_urlsafe(16), list(passages), vectors, now)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT INTO sessions (id, created, last_used, passages, dim, vectors) VALUES (?, ?, ?, ?, ?, ?)",
+                    (session.session_id, now, now, json.dumps(session.passages), vectors.shape[1], vectors.tobytes()),
+                )
+            self._remember(session, now)
+            self.created += 1
+        return session
+
+    def get(self, session_id: str):
+        """The live session, or None if it does not exist or has expired; refreshes its expiry."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(session_id)
+            if entry is not None and now - entry[1] <= self.ttl_s:
+                session = entry[0]
+            else:
+                session = self._load(session_id, now)
+            if session is not None and self._conn is not None:
+                # Also tells us when another worker has deleted the session
+                if self._conn.execute("UPDATE sessions SET last_used = ? WHERE id = ?", (now, session_id)).rowcount == 0:
+                    self._memory.pop(session_id, None)
+                    session = None
+            if session is None:
+                self.misses += 1
+                return None
+            self._remember(session, now)
+            self.hits += 1
+            return session
+
+    def _load(self, session_id: str, now: float):
+        self._memory.pop(session_id, None)
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT created, last_used, passages, dim, vectors FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        created, last_used, passages, dim, blob = row
+        if now - last_used > self.ttl_s:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self.expired += 1
+            return None
+        return PaperSession(session_id, json.loads(passages), np.frombuffer(blob, dtype=np.float32).reshape(-1, dim), created)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            found = self._memory.pop(session_id, None) is not None
+            if self._conn is not None:
+                found = self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0 or found
+            return found
+
+    def purge_expired(self) -> int:
+        """Deletes every expired session; returns how many were removed."""
+        cutoff = time.time() - self.ttl_s
+        with self._lock:
+            stale = [sid for sid, (_, last_used) in self._memory.items() if last_used < cutoff]
+            for sid in stale:
+                del self._memory[sid]
+            removed = len(stale)
+            if self._conn is not None:
+                removed = self._conn.execute("DELETE FROM sessions WHERE last_used < ?", (cutoff,)).rowcount
+            self.expired += removed
+            return removed
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        return {
+            "created": self.created,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "memory_sessions": len(self._memory),
+            "ttl_s": self.ttl_s,
+            "disk_path": self.path,
+        }
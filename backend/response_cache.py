@@ -0,0 +1,132 @@
+"""
+Prompt-keyed response cache and in-flight request coalescing for /generate.
+
+ResponseCache is a TTL cache bounded by entry count and by total cached
+characters (oldest-used entries are evicted first). SingleFlight makes
+concurrent callers with the same key share one upstream call.
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+
+def prompt_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """LRU + TTL cache of generated text, bounded by entries and total characters."""
+
+    def __init__(self, ttl_s: float = 600.0, max_entries: int = 1000, max_chars: int = 5_000_000):
+        self.ttl_s = float(ttl_s)
+        self.max_entries = max(0, int(max_entries))
+        self.max_chars = max(0, int(max_chars))
+        self.current_chars = 0
+        self._data = OrderedDict()  # key -> (expires_at, text)
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.bypassed = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _drop(self, key):
+        _, text = self._data.pop(key)
+        self.current_chars -= len(text)
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, text = entry
+        if expires_at <= time.monotonic():
+            self._drop(key)
+            self.expired += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return text
+
+    def put(self, key, text: str):
+        if self.ttl_s <= 0 or len(text) > self.max_chars or self.max_entries == 0:
+            return
+        if key in self._data:
+            self._drop(key)
+        self._data[key] = (time.monotonic() + self.ttl_s, text)
+        self.current_chars += len(text)
+        while len(self._data) > self.max_entries or self.current_chars > self.max_chars:
+            self._drop(next(iter(self._data)))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._data),
+            "cached_chars": self.current_chars,
+            "ttl_s": self.ttl_s,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent async calls that share a key into one execution.
+
+    The first caller for a key starts the call as its own task; every caller,
+    the first one included, awaits that task through a shield and receives the
+    same result (or exception). A caller that is cancelled (e.g. its client
+    disconnected) only stops waiting: the call is cancelled only once no
+    caller is left. Must be used from a single event loop.
+    """
+
+    def __init__(self):
+        self._inflight = {}  # key -> [task, number of waiting callers]
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        """Returns (result, shared) where shared is True if another caller started the work."""
+        entry = self._inflight.get(key)
+        shared = entry is not None
+        if entry is None:
+            task = asyncio.ensure_future(fn())
+            entry = self._inflight[key] = [task, 0]
+            task.add_done_callback(lambda t: self._finished(key, entry))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0]), shared
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                # Nobody is waiting any more; later callers start a fresh call
+                self._forget(key, entry)
+                entry[0].cancel()
+
+    def _forget(self, key, entry):
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+
+    def _finished(self, key, entry):
+        self._forget(key, entry)
+        if not entry[0].cancelled():
+            # Mark the exception as retrieved in case nobody was waiting for it
+            entry[0].exception()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "upstream_calls": self.leaders,
+            "coalesced": self.coalesced,
+        }
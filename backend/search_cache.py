@@ -0,0 +1,110 @@
+"""
+Versioned cache of vector search results.
+
+Entries are keyed by the quantised query vector plus top_n and the metadata
+filters, so a repeated query, or one whose embedding differs only in the
+last few bits, is answered without querying the index. Near-identical
+vectors round to the same key; vectors that differ more never do.
+
+Every entry belongs to a collection epoch. The ingestion scripts bump the
+epoch stored in the Chroma collection's metadata whenever they upsert (see
+notebooks/ingest.py), the app polls it, and `set_epoch` drops the whole
+cache as soon as it sees a change. Results computed under an older epoch
+are never stored.
+
+The cache is eventually consistent, not strictly so: between an upsert and
+the next poll (at most SEARCH_CACHE_EPOCH_POLL_S seconds in the app) hits
+still return results computed before the upsert. Checking the epoch on
+every hit would cost a Chroma round trip, about what the cache saves.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Collection metadata key holding the epoch; must match notebooks/ingest.py
+EPOCH_KEY = "hackcors_epoch"
+
+
+def vector_key(embedding, n_results: int, filters: dict = None, levels: int = 256) -> str:
+    """
+    Cache key for one query vector.
+
+    The vector is unit-normalised and every component rounded to 1/levels,
+    so the key ignores float noise and tiny differences between embeddings.
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+    quantised = np.rint(vector * levels).astype(np.int16)
+    h = hashlib.blake2b(quantised.tobytes(), digest_size=16)
+    h.update(f"\0{n_results}\0{sorted((filters or {}).items())}".encode("utf-8"))
+    return h.hexdigest()
+
+
+class SearchResultCache:
+    """Thread-safe LRU of single-query search results, invalidated by collection epoch."""
+
+    def __init__(self, max_entries: int = 10000, levels: int = 256):
+        self.max_entries = max(0, int(max_entries))
+        self.levels = levels
+        self.epoch = None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def key(self, embedding, n_results: int, filters: dict = None) -> str:
+        return vector_key(embedding, n_results, filters, self.levels)
+
+    def set_epoch(self, epoch):
+        """Records the current collection epoch; a change drops every entry."""
+        with self._lock:
+            if epoch == self.epoch:
+                return
+            if self.epoch is not None:
+                self.invalidations += 1
+                print(f"[SearchCache] Collection epoch {self.epoch} -> {epoch}; dropped {len(self._data)} entries")
+            self.epoch = epoch
+            self._data.clear()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, epoch):
+        """Stores a result computed under `epoch`; ignored if the epoch has moved on since."""
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            if epoch != self.epoch:
+                self.stale_puts += 1
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._data),
+            "epoch": self.epoch,
+            "invalidations": self.invalidations,
+            "stale_puts": self.stale_puts,
+        }
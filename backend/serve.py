@@ -0,0 +1,258 @@
+"""
+Pre-fork multi-worker server that shares the SciBERT weights between workers.
+
+`uvicorn --workers N` starts N fresh interpreters, and each loads its own
+~440 MB copy of the model. Here the parent loads the tokenizer and engine
+once (app.preload_inference), then forks the workers. Forked workers share
+those pages copy-on-write, and inference never writes to the weights, so
+each added worker costs only its own heap (caches, index, request state).
+
+All workers accept from one listening socket that the parent opens before
+forking. Each worker pins torch to its share of the cores
+(--threads-per-worker, default cpu_count // workers), so N workers do not
+each start a thread per core and oversubscribe the machine.
+
+Usage (from backend/):
+    python serve.py --workers 4 --port 8000
+    python serve.py memory <serve.py pid>    # RSS / PSS / USS per worker
+
+PSS (proportional set size) splits shared pages evenly among the processes
+that map them, so the sum of PSS is the real footprint, and the growth in
+total PSS per added worker is the marginal cost of that worker.
+
+With CUDA, or with --no-preload, every worker loads its own model (CUDA
+contexts cannot be shared across fork).
+
+A worker that exits is replaced. If it exits within --min-uptime-s of its
+fork, the replacement waits (--restart-backoff-s, doubling, capped at
+--restart-backoff-max-s), and after --max-quick-exits such exits in a row
+the parent stops every worker and exits with status 1 instead of
+re-forking a worker that cannot start.
+"""
+import argparse
+import gc
+import json
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+# Fast tokenizers disable their thread pool after fork anyway; say so up front instead of warning per worker
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+# --- Memory reporting ---
+
+def process_memory(pid: int) -> dict:
+    """RSS, PSS and USS (private pages) of a process in MB, from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup", "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1])
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {
+        "pid": pid,
+        "rss_mb": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+        "uss_mb": round(private / 1024, 1),
+    }
+
+
+def child_pids(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r", encoding="utf-8") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def memory_report(parent_pid: int) -> dict:
+    """Per-process memory for a serve.py parent and its workers, plus the total PSS."""
+    parent = process_memory(parent_pid)
+    workers = [process_memory(pid) for pid in child_pids(parent_pid)]
+    return {
+        "parent": parent,
+        "workers": workers,
+        "total_pss_mb": round(parent["pss_mb"] + sum(w["pss_mb"] for w in workers), 1),
+        "total_rss_mb": round(parent["rss_mb"] + sum(w["rss_mb"] for w in workers), 1),
+    }
+
+
+# --- Workers ---
+
+def pin_threads(threads: int):
+    """Limits this worker's torch (and BLAS/OpenMP) thread pools to `threads`."""
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[name] = str(threads)
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already fixed once inter-op work has run in this process
+
+
+def run_worker(app, sock: socket.socket, threads: int, log_level: str):
+    import uvicorn
+
+    pin_threads(threads)
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def spawn_worker(app, sock: socket.socket, threads: int, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        code = 0
+        try:
+            run_worker(app, sock, threads, log_level)
+        except BaseException:
+            # The parent only sees the exit status, so leave the reason in the log
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+    return pid
+
+
+def restart_delay(quick_exits: int, base_s: float, max_s: float) -> float:
+    """Backoff before re-forking a slot whose worker died `quick_exits` times in a row soon after starting."""
+    if quick_exits == 0:
+        return 0.0
+    return min(max_s, base_s * (2 ** (quick_exits - 1)))
+
+
+def main(args):
+    # Imported in the parent so the forked workers inherit the loaded module
+    import app as app_module
+
+    preload = not args.no_preload and not cuda_available()
+    if preload:
+        start = time.perf_counter()
+        app_module.preload_inference()
+        print(f"[Serve] Preloaded model in {time.perf_counter() - start:.1f}s; forking {args.workers} workers")
+    else:
+        print(f"[Serve] Each of the {args.workers} workers loads its own model")
+    # Objects that exist now are never collected in the workers, so the collector
+    # does not write to (and un-share) the pages they live on
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(args.backlog)
+    sock.set_inheritable(True)
+
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+    workers = {}  # pid -> slot
+    spawned_at = {}  # slot -> monotonic time of its current worker's fork
+    quick_exits = [0] * args.workers  # per slot, consecutive exits within --min-uptime-s of the fork
+    restart_at = {}  # slot -> monotonic time its replacement may be forked
+
+    def start(slot: int):
+        spawned_at[slot] = time.monotonic()
+        workers[spawn_worker(app_module.app, sock, threads, args.log_level)] = slot
+
+    for slot in range(args.workers):
+        start(slot)
+    print(f"[Serve] Listening on http://{args.host}:{args.port} with {args.workers} workers x {threads} threads (parent pid {os.getpid()})")
+
+    stopping = False
+    failed = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        restart_at.clear()
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    report_at = time.monotonic() + args.report_after_s if args.report_after_s > 0 else None
+    while workers or restart_at:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid, status = 0, 0  # every slot is waiting out its backoff
+        now = time.monotonic()
+        if pid:
+            slot = workers.pop(pid, None)
+            if slot is None or stopping:
+                continue
+            uptime = now - spawned_at[slot]
+            quick_exits[slot] = quick_exits[slot] + 1 if uptime < args.min_uptime_s else 0
+            if quick_exits[slot] >= args.max_quick_exits:
+                # A worker that cannot start (bad model path, env, port) would otherwise be re-forked forever
+                print(f"[Serve] Worker slot {slot} exited {quick_exits[slot]} times in a row within "
+                      f"{args.min_uptime_s:g}s of starting; giving up")
+                failed = True
+                stop(None, None)
+                continue
+            delay = restart_delay(quick_exits[slot], args.restart_backoff_s, args.restart_backoff_max_s)
+            print(f"[Serve] Worker {pid} exited ({status}) after {uptime:.1f}s; starting a replacement in {delay:.1f}s")
+            restart_at[slot] = now + delay
+            continue
+        for slot, when in list(restart_at.items()):
+            if now >= when:
+                del restart_at[slot]
+                start(slot)
+        if report_at is not None and now >= report_at:
+            report_at = None
+            print(f"[Serve] Memory: {json.dumps(memory_report(os.getpid()))}")
+        time.sleep(0.5)
+    sock.close()
+    if failed:
+        sys.exit(1)
+
+
+def cuda_available() -> bool:
+    try:
+        import torch
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "memory":
+        parser = argparse.ArgumentParser(description="Report memory of a running serve.py and its workers.")
+        parser.add_argument("command")
+        parser.add_argument("pid", type=int)
+        print(json.dumps(memory_report(parser.parse_args().pid), indent=4))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Serve the app from pre-forked workers sharing one copy of the model.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads-per-worker", type=int, default=0, help="torch intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--no-preload", action="store_true", help="Let every worker load its own model")
+    parser.add_argument("--report-after-s", type=float, default=0.0, help="Print a memory report this long after start (0 = never)")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--restart-backoff-s", type=float, default=1.0,
+                        help="Delay before re-forking a worker that died soon after starting; doubles per repeat")
+    parser.add_argument("--restart-backoff-max-s", type=float, default=30.0)
+    parser.add_argument("--min-uptime-s", type=float, default=10.0,
+                        help="A worker exiting sooner than this after its fork counts as a failed start")
+    parser.add_argument("--max-quick-exits", type=int, default=5,
+                        help="Exit non-zero once a slot's worker fails to start this many times in a row")
+    main(parser.parse_args())
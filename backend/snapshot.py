@@ -0,0 +1,219 @@
+"""
+Portable snapshots of the journal collection, for cold starts without network access.
+
+A snapshot is a directory that NumpyIndex.load opens as-is (VECTOR_BACKEND=numpy,
+VECTOR_INDEX_PATH=<snapshot>), with the embedding matrix memory-mapped:
+
+    embeddings.npy   float32/float16 matrix, shape (n, dim), rows L2-normalised
+    norms.npy        float32, the original length of every row
+    records.jsonl    one {"id", "document", "metadata"} object per row, in matrix order
+    manifest.json    model, dimension, count, dtype, the collection's name,
+                     distance space and metadata (epoch) and the size and
+                     SHA-256 of every file above
+
+`export` pages through the collection and writes each page straight into the
+memory-mapped matrix and the sidecar, so memory does not grow with the
+collection. The manifest is written last: a directory without one is an
+interrupted export. `import` verifies the checksums and bulk-loads the
+snapshot into a local chromadb.PersistentClient (VECTOR_BACKEND=chroma-local),
+restoring the original vectors from the unit rows and their norms.
+
+Usage (from backend/):
+    python snapshot.py export --out ./snapshot [--collection updated_journals] [--dtype float16]
+    python snapshot.py import --snapshot ./snapshot --path ./chroma_data
+    python snapshot.py verify --snapshot ./snapshot
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+from collections import Counter
+
+import numpy as np
+
+from vector_index import EMBEDDINGS_FILE, NORMS_FILE, RECORDS_JSONL_FILE, distance_space
+from vector_index import SNAPSHOT_MANIFEST_FILE as MANIFEST_FILE
+
+FORMAT_VERSION = 1
+DEFAULT_MODEL = "allenai/scibert_scivocab_uncased"
+
+
+def file_digest(path: str, block_bytes: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_bytes):
+            h.update(block)
+    return h.hexdigest()
+
+
+def read_manifest(path: str):
+    """The snapshot manifest, or None if `path` is not a (complete) snapshot."""
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def export_snapshot(collection, out: str, model_name: str = DEFAULT_MODEL, dtype: str = "float32",
+                    page_size: int = 500) -> dict:
+    """Writes the collection to a snapshot directory; returns the manifest."""
+    os.makedirs(out, exist_ok=True)
+    manifest_path = os.path.join(out, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    count = collection.count()
+    first = collection.get(include=["embeddings"], limit=1)
+    if count == 0 or not first["ids"]:
+        raise ValueError(f"Collection '{collection.name}' is empty")
+    dim = len(first["embeddings"][0])
+
+    embeddings = np.lib.format.open_memmap(os.path.join(out, EMBEDDINGS_FILE), mode="w+", dtype=dtype, shape=(count, dim))
+    norms = np.empty(count, dtype=np.float32)
+    models = Counter()
+    written = 0
+    with open(os.path.join(out, RECORDS_JSONL_FILE), "w", encoding="utf-8") as sidecar:
+        while True:
+            page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=written)
+            n = len(page["ids"])
+            if n == 0:
+                break
+            if written + n > count:
+                raise RuntimeError("The collection grew during the export; run it again")
+            vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            page_norms = np.linalg.norm(vectors, axis=1)
+            embeddings[written:written + n] = vectors / np.clip(page_norms[:, None], 1e-12, None)
+            norms[written:written + n] = page_norms
+            for record_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                metadata = metadata or {}
+                models[metadata.get("embed_model")] += 1
+                sidecar.write(json.dumps({"id": record_id, "document": document, "metadata": metadata}, ensure_ascii=False) + "\n")
+            written += n
+            print(f"  exported {written}/{count}")
+    if written != count:
+        raise RuntimeError(f"The collection shrank during the export ({written} of {count} rows); run it again")
+    embeddings.flush()
+    del embeddings
+    np.save(os.path.join(out, NORMS_FILE), norms)
+
+    # Rows stamped by the ingestion scripts (embed_model) name their model; fall back to the given one
+    stamped = [(n, model) for model, n in models.items() if model]
+    files = {}
+    for name in (EMBEDDINGS_FILE, NORMS_FILE, RECORDS_JSONL_FILE):
+        file_path = os.path.join(out, name)
+        files[name] = {"bytes": os.path.getsize(file_path), "sha256": file_digest(file_path)}
+    manifest = {
+        "format": FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "model": max(stamped)[1] if stamped else model_name,
+        "dim": dim,
+        "count": count,
+        "dtype": dtype,
+        "collection": collection.name,
+        "space": distance_space(collection),
+        # hnsw:* keys are creation-time settings; the space is recorded above and passed explicitly on import
+        "collection_metadata": {k: v for k, v in (collection.metadata or {}).items() if not k.startswith("hnsw:")},
+        "files": files,
+    }
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def verify_snapshot(path: str) -> dict:
+    """Checks every file's size and checksum against the manifest; returns the manifest or raises ValueError."""
+    manifest = read_manifest(path)
+    if manifest is None:
+        raise ValueError(f"'{path}' has no {MANIFEST_FILE} (not a snapshot, or the export did not finish)")
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')} (expected {FORMAT_VERSION})")
+    for name, expected in manifest["files"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path) or os.path.getsize(file_path) != expected["bytes"]:
+            raise ValueError(f"{name} is missing or has the wrong size")
+        if file_digest(file_path) != expected["sha256"]:
+            raise ValueError(f"{name} does not match its checksum")
+    shape = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r").shape
+    if shape != (manifest["count"], manifest["dim"]):
+        raise ValueError(f"Embedding matrix shape {shape} does not match the manifest")
+    return manifest
+
+
+def import_snapshot(path: str, client, collection_name: str = None, batch_size: int = 1000):
+    """Verifies a snapshot and upserts it into `client` (e.g. a PersistentClient); returns the collection."""
+    manifest = verify_snapshot(path)
+    embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+    norms = np.load(os.path.join(path, NORMS_FILE), mmap_mode="r")
+    # The distance space is fixed at creation, so it is passed explicitly; the metadata carries the cache epoch
+    collection = client.get_or_create_collection(
+        name=collection_name or manifest["collection"],
+        configuration={"hnsw": {"space": manifest["space"]}},
+        metadata=manifest["collection_metadata"] or None,
+    )
+    if distance_space(collection) != manifest["space"]:
+        raise ValueError(
+            f"Collection '{collection.name}' already exists with space '{distance_space(collection)}', "
+            f"but the snapshot was exported with '{manifest['space']}'"
+        )
+    batch_size = max(1, min(batch_size, client.get_max_batch_size()))
+
+    with open(os.path.join(path, RECORDS_JSONL_FILE), "r", encoding="utf-8") as sidecar:
+        for start in range(0, manifest["count"], batch_size):
+            records = [json.loads(line) for line in itertools.islice(sidecar, batch_size)]
+            end = start + len(records)
+            vectors = embeddings[start:end].astype(np.float32) * norms[start:end, None]
+            collection.upsert(
+                ids=[r["id"] for r in records],
+                embeddings=vectors,
+                documents=[r["document"] for r in records],
+                # Chroma rejects empty metadata dicts
+                metadatas=[r["metadata"] or None for r in records],
+            )
+            print(f"  imported {end}/{manifest['count']}")
+    return collection
+
+
+if __name__ == "__main__":
+    import chromadb
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Export the journal collection to a portable snapshot, or import one.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Page the Chroma Cloud collection into a snapshot directory")
+    export.add_argument("--out", default="./snapshot")
+    export.add_argument("--collection", default="updated_journals")
+    export.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    export.add_argument("--page-size", type=int, default=500)
+    export.add_argument("--model", default=DEFAULT_MODEL, help="Recorded when the rows carry no embed_model")
+    load = sub.add_parser("import", help="Bulk-load a snapshot into a local PersistentClient")
+    load.add_argument("--snapshot", default="./snapshot")
+    load.add_argument("--path", default="./chroma_data", help="PersistentClient directory (CHROMA_PERSIST_PATH in the app)")
+    load.add_argument("--collection", default=None, help="Defaults to the exported collection's name")
+    load.add_argument("--batch-size", type=int, default=1000)
+    verify = sub.add_parser("verify", help="Check a snapshot against its manifest")
+    verify.add_argument("--snapshot", default="./snapshot")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "export":
+        client = chromadb.CloudClient(
+            api_key=os.getenv("CHROMA_API_KEY"),
+            tenant=os.getenv("CHROMA_HOST"),
+            database="hackcora",
+        )
+        manifest = export_snapshot(client.get_collection(args.collection), args.out, args.model, args.dtype, args.page_size)
+        print(f"Exported {manifest['count']} vectors ({manifest['dim']}-d, {args.dtype}) to '{args.out}'")
+    elif args.command == "import":
+        collection = import_snapshot(args.snapshot, chromadb.PersistentClient(path=args.path), args.collection, args.batch_size)
+        print(f"Imported {collection.count()} records into '{collection.name}' at '{args.path}'")
+    else:
+        manifest = verify_snapshot(args.snapshot)
+        print(f"OK: {manifest['count']} vectors ({manifest['dim']}-d, {manifest['dtype']}) of {manifest['model']}")
+    print(f"Done in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,142 @@
+"""
+Incremental multipart/form-data parsing for file uploads.
+
+`StreamingUpload` is fed the request body chunk by chunk as it arrives from
+the socket (`request.stream()`), so nothing waits for the whole body:
+
+  - the file part is written straight to a temp file, and the size limit is
+    enforced on every chunk, so an oversized upload is rejected after
+    max_file_bytes instead of after it has been received in full;
+  - the file's name and type are known as soon as its part headers arrive,
+    so `on_file` can reject an unsupported format before its body is read;
+  - other form fields are small text values, kept in memory up to
+    max_field_bytes each.
+
+Only one copy of the file is ever on disk, and memory holds one chunk.
+"""
+import os
+import tempfile
+
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+
+class UploadError(ValueError):
+    """The body is not a usable multipart upload; `status_code` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StreamingUpload:
+    def __init__(self, content_type: str, max_file_bytes: int, file_field: str = "file",
+                 max_field_bytes: int = 1024, on_file=None):
+        kind, options = parse_options_header(content_type or "")
+        boundary = options.get(b"boundary")
+        if kind != b"multipart/form-data" or not boundary:
+            raise UploadError("Expected a multipart/form-data body with a boundary", 400)
+        self.max_file_bytes = int(max_file_bytes)
+        self.file_field = file_field
+        self.max_field_bytes = int(max_field_bytes)
+        # on_file(filename, content_type) may raise to reject the file before its body is read
+        self.on_file = on_file
+
+        self.path = None
+        self.filename = None
+        self.content_type = None
+        self.file_bytes = 0
+        self.fields = {}
+
+        self._file = None
+        self._field_name = None
+        self._field_value = None
+        self._headers = []
+        self._header_field = b""
+        self._header_value = b""
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field_data,
+            "on_header_value": self._header_value_data,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        })
+
+    def feed(self, chunk: bytes):
+        """Parses the next piece of the body (blocking: it may write to the temp file)."""
+        try:
+            self._parser.write(chunk)
+        except MultipartParseError as e:
+            raise UploadError(f"Malformed multipart body: {e}", 400)
+
+    def finish(self):
+        """Call once the body has ended; checks that a file was sent."""
+        try:
+            self._parser.finalize()
+        except MultipartParseError as e:
+            raise UploadError(f"Malformed multipart body: {e}", 400)
+        if self._file is not None:
+            raise UploadError("The upload ended in the middle of the file", 400)
+        if self.path is None:
+            raise UploadError(f"No '{self.file_field}' file in the upload", 400)
+
+    def discard(self):
+        """Closes and removes the temp file (safe to call more than once)."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _part_begin(self):
+        self._headers = []
+        self._header_field = self._header_value = b""
+
+    def _header_field_data(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _header_value_data(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _header_end(self):
+        self._headers.append((self._header_field.strip().lower(), self._header_value.strip()))
+        self._header_field = self._header_value = b""
+
+    def _headers_finished(self):
+        headers = dict(self._headers)
+        _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+        name = disposition.get(b"name", b"").decode("utf-8", errors="replace")
+        filename = disposition.get(b"filename")
+        if name == self.file_field and filename is not None:
+            if self.path is not None:
+                raise UploadError(f"Only one '{self.file_field}' file is accepted", 400)
+            self.filename = os.path.basename(filename.decode("utf-8", errors="replace"))
+            self.content_type = headers.get(b"content-type", b"").decode("latin-1") or None
+            if self.on_file is not None:
+                self.on_file(self.filename, self.content_type)
+            fd, self.path = tempfile.mkstemp(prefix="hackcors-upload-", suffix=os.path.splitext(self.filename)[1])
+            self._file = os.fdopen(fd, "wb")
+        else:
+            self._field_name = name
+            self._field_value = bytearray()
+
+    def _part_data(self, data, start, end):
+        if self._file is not None:
+            self.file_bytes += end - start
+            if self.file_bytes > self.max_file_bytes:
+                raise UploadError(f"Uploads are limited to {self.max_file_bytes} bytes", 413)
+            self._file.write(data[start:end])
+        elif self._field_value is not None:
+            self._field_value += data[start:end]
+            if len(self._field_value) > self.max_field_bytes:
+                raise UploadError(f"Form field '{self._field_name}' is too long", 413)
+
+    def _part_end(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        elif self._field_value is not None:
+            self.fields[self._field_name] = self._field_value.decode("utf-8", errors="replace")
+            self._field_name = self._field_value = None
@@ -0,0 +1,256 @@
+"""
+In-process vector index for the journal corpus.
+
+The whole corpus is small (~1.2k journals), so a brute-force scan over a
+contiguous, L2-normalised float matrix is faster than a network round trip to
+ChromaDB Cloud. The index answers `query()` in the same shape as
+`chromadb.Collection.query`, so it can be swapped in wherever a collection is
+used.
+
+Distances are reported in the distance space of the collection the index
+was built from ("cosine", "l2" or "ip"), the way Chroma reports them, so
+scores keep their meaning whichever VECTOR_BACKEND serves them.
+
+On-disk layout (one directory):
+    embeddings.npy   float32/float16 matrix, shape (n, dim), rows L2-normalised
+    norms.npy        float32, the original length of every row (needed for l2/ip)
+    records.json     {"ids": [...], "documents": [...], "metadatas": [...]}
+                     (or records.jsonl, one {"id", "document", "metadata"} per row)
+    index.json       {"space": ...} (a snapshot's manifest.json carries it instead);
+                     directories without either are treated as cosine
+
+Build it from the Chroma collection with:
+    python vector_index.py build --out ./vector_index [--dtype float16]
+or load a snapshot directory written by `python snapshot.py export`.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.json"
+RECORDS_JSONL_FILE = "records.jsonl"
+NORMS_FILE = "norms.npy"
+INDEX_INFO_FILE = "index.json"
+SNAPSHOT_MANIFEST_FILE = "manifest.json"
+SPACES = ("cosine", "l2", "ip")
+SCORE_BLOCK_ROWS = 8192  # float16 rows converted to float32 per step of a query
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Returns a float32 copy of `matrix` with every row scaled to unit length."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.clip(norms, 1e-12, None)
+
+
+def distance_space(collection) -> str:
+    """
+    The collection's distance function ("l2", "cosine" or "ip").
+
+    Read from the collection configuration: the hnsw:space metadata key is
+    only set at creation and is gone once the metadata has been modified
+    (e.g. by ingest.bump_collection_epoch), while the configuration keeps it.
+    """
+    configuration = getattr(collection, "configuration", None) or getattr(collection, "configuration_json", None) or {}
+    for index in ("hnsw", "spann"):
+        space = (configuration.get(index) or {}).get("space")
+        if space:
+            return str(getattr(space, "value", space))
+    return (collection.metadata or {}).get("hnsw:space", "l2")
+
+
+class NumpyIndex:
+    """Exact nearest-neighbour index over a memory-mapped matrix of unit rows."""
+
+    def __init__(self, embeddings: np.ndarray, ids: list, documents: list = None, metadatas: list = None,
+                 norms: np.ndarray = None, space: str = "cosine"):
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(ids):
+            raise ValueError(f"Embedding matrix shape {embeddings.shape} does not match {len(ids)} ids")
+        if space not in SPACES:
+            raise ValueError(f"Unknown distance space '{space}'. Expected one of: {', '.join(SPACES)}")
+        if space != "cosine" and norms is None:
+            raise ValueError(f"The '{space}' space needs the original row norms ({NORMS_FILE})")
+        self.embeddings = embeddings
+        self.norms = norms
+        self.space = space
+        self.ids = list(ids)
+        self.documents = list(documents) if documents is not None else [""] * len(self.ids)
+        self.metadatas = list(metadatas) if metadatas is not None else [{} for _ in self.ids]
+
+    @property
+    def dim(self) -> int:
+        return self.embeddings.shape[1]
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        """Loads an index directory, memory-mapping the embedding matrix by default."""
+        embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r" if mmap else None)
+        norms_path = os.path.join(path, NORMS_FILE)
+        norms = np.load(norms_path) if os.path.exists(norms_path) else None
+        space = "cosine"
+        for info_file in (INDEX_INFO_FILE, SNAPSHOT_MANIFEST_FILE):
+            info_path = os.path.join(path, info_file)
+            if os.path.exists(info_path):
+                with open(info_path, "r", encoding="utf-8") as f:
+                    space = json.load(f).get("space", space)
+                break
+        jsonl_path = os.path.join(path, RECORDS_JSONL_FILE)
+        if not os.path.exists(os.path.join(path, RECORDS_FILE)) and os.path.exists(jsonl_path):
+            ids, documents, metadatas = [], [], []
+            with open(jsonl_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    ids.append(record["id"])
+                    documents.append(record["document"])
+                    metadatas.append(record["metadata"])
+            return cls(embeddings, ids, documents, metadatas, norms, space)
+        with open(os.path.join(path, RECORDS_FILE), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        return cls(embeddings, records["ids"], records.get("documents"), records.get("metadatas"), norms, space)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, EMBEDDINGS_FILE), np.ascontiguousarray(self.embeddings))
+        if self.norms is not None:
+            np.save(os.path.join(path, NORMS_FILE), np.asarray(self.norms, dtype=np.float32))
+        with open(os.path.join(path, RECORDS_FILE), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "documents": self.documents, "metadatas": self.metadatas}, f)
+        with open(os.path.join(path, INDEX_INFO_FILE), "w", encoding="utf-8") as f:
+            json.dump({"space": self.space}, f)
+
+    def search(self, query_embeddings, n_results: int, mask: np.ndarray = None):
+        """
+        Returns (row_indices, scores) for each query, best (highest) first.
+
+        One matrix product scores every query against every row; argpartition
+        then picks the top-n without sorting the whole score vector. An optional
+        boolean row `mask` is applied before selection, so filtered searches
+        still return up to n_results matching rows.
+
+        Scores rank rows as the index's space does: the cosine similarity, the
+        inner product of the original vectors (ip), or 2*q.x - |x|^2, which
+        orders rows like the squared L2 distance |q|^2 - score (l2).
+        """
+        raw = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if raw.shape[1] != self.dim:
+            raise ValueError(f"Query dimension {raw.shape[1]} does not match index dimension {self.dim}")
+        queries = normalize_rows(raw)
+
+        scores = self._scores(queries)
+        if self.space != "cosine":
+            norms = np.asarray(self.norms, dtype=np.float32)
+            scores *= np.linalg.norm(raw, axis=1, keepdims=True) * norms[None, :]
+            if self.space == "l2":
+                scores *= 2.0
+                scores -= np.square(norms)[None, :]
+        n = min(int(n_results), self.count())
+        if mask is not None:
+            scores[:, ~mask] = -np.inf
+            n = min(n, int(np.count_nonzero(mask)))
+        if n <= 0:
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+
+        if n < self.count():
+            top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        else:
+            top = np.tile(np.arange(self.count()), (len(queries), 1))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of each query to every row, as float32.
+
+        A float32 matrix is multiplied directly. A float16 one is converted
+        SCORE_BLOCK_ROWS rows at a time (numpy has no fast float16 matmul), so
+        a query allocates one small block instead of a float32 copy of the
+        whole matrix, which would cancel the memory float16 saves.
+        """
+        if self.embeddings.dtype == np.float32:
+            return queries @ self.embeddings.T
+        scores = np.empty((len(queries), self.count()), dtype=np.float32)
+        for start in range(0, self.count(), SCORE_BLOCK_ROWS):
+            block = np.asarray(self.embeddings[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores
+
+    def query(self, query_embeddings, n_results: int = 10, mask: np.ndarray = None, **kwargs):
+        """
+        Mirrors chromadb.Collection.query for embedding queries.
+
+        Distances are in the index's space, as Chroma computes them (lower is
+        better): 1 - cosine similarity (cosine), the squared L2 distance of the
+        original vectors (l2) or 1 - their inner product (ip). The "score"
+        field in /search_journals therefore has the same scale whether this
+        index or the collection it was built from answers.
+        """
+        rows, scores = self.search(query_embeddings, n_results, mask=mask)
+        if self.space == "l2":
+            offsets = np.square(np.linalg.norm(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)), axis=1))
+        else:
+            offsets = np.ones(len(rows), dtype=np.float32)
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for row_ids, row_scores, offset in zip(rows, scores, offsets):
+            results["ids"].append([self.ids[i] for i in row_ids])
+            results["documents"].append([self.documents[i] for i in row_ids])
+            results["metadatas"].append([self.metadatas[i] for i in row_ids])
+            # Rounding can leave a near-exact match a hair below zero
+            results["distances"].append([max(0.0, float(offset - s)) if self.space == "l2" else float(offset - s)
+                                         for s in row_scores])
+        return results
+
+
+def build_from_collection(collection, dtype: str = "float32", page_size: int = 500) -> NumpyIndex:
+    """Pages through a Chroma collection and builds a normalised NumpyIndex in its distance space."""
+    ids, documents, metadatas, vectors = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=page_size,
+            offset=offset,
+        )
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+        vectors.extend(page["embeddings"])
+        offset += len(page["ids"])
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1).astype(np.float32)
+    embeddings = normalize_rows(vectors).astype(dtype)
+    return NumpyIndex(embeddings, ids, documents, metadatas, norms, distance_space(collection))
+
+
+if __name__ == "__main__":
+    import chromadb
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Build the local journal vector index from ChromaDB.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Export the Chroma collection into a local index directory")
+    build.add_argument("--out", default="./vector_index")
+    build.add_argument("--collection", default="updated_journals")
+    build.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    args = parser.parse_args()
+
+    client = chromadb.CloudClient(
+        api_key=os.getenv("CHROMA_API_KEY"),
+        tenant=os.getenv("CHROMA_HOST"),
+        database="hackcora",
+    )
+    index = build_from_collection(client.get_collection(args.collection), dtype=args.dtype)
+    index.save(args.out)
+    print(f"Saved {index.count()} vectors ({index.dim}-d, {args.dtype}, {index.space} space) to '{args.out}'")
@@ -0,0 +1,269 @@
+"""
+Concurrent, cursor-paginated OpenAlex harvester for journal metadata.
+
+Replaces the sequential loop in fetch.py: concepts and sources are fetched
+concurrently (within the polite-pool request budget), every concept's journal
+list is followed through cursor pagination instead of stopping at the first
+page, and every raw API page is cached on disk keyed by its query. Re-runs
+and runs resumed after an interruption replay cached pages and only hit the
+network for pages that were never fetched.
+
+Writes the same journals_metadata.json / journals_list.json as fetch.py.
+
+Usage:
+    python harvest.py --email you@example.com [--concurrency 8] [--max-per-concept 500]
+    python harvest.py --offline        # rebuild outputs from cached pages only
+
+harvest_replay.py checks the harvester offline against recorded pages.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+OPENALEX_BASE = "https://api.openalex.org"
+# The polite pool allows 10 requests/second; stay a little below it
+DEFAULT_RATE_PER_S = 8.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+MAX_RETRY_AFTER_S = 300.0
+
+
+def retry_delay(response, attempt: int) -> float:
+    """Seconds to wait before retrying: the server's Retry-After if it sent one, else jittered backoff."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            seconds = float(retry_after)
+        except ValueError:
+            try:
+                # The HTTP-date form
+                seconds = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                seconds = None
+        if seconds is not None:
+            return min(MAX_RETRY_AFTER_S, max(0.0, seconds))
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(30.0, 2 ** attempt))
+
+
+class RateLimiter:
+    """Spaces request starts evenly so the harvester never exceeds `rate` per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_slot = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Holds back every request start for `seconds`, e.g. after a 429."""
+        self.next_slot = max(self.next_slot, time.monotonic() + seconds)
+
+
+class PageCache:
+    """Raw API pages on disk, one JSON file per (path, params) query."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, path: str, params: dict) -> str:
+        # mailto does not change the response, so it is left out of the key
+        key_params = sorted((k, str(v)) for k, v in params.items() if k != "mailto")
+        key = hashlib.sha256(json.dumps([path, key_params]).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, path: str, params: dict):
+        file_path = self._path(path, params)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def put(self, path: str, params: dict, data: dict):
+        file_path = self._path(path, params)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # Write-then-rename so an interrupted run never leaves a truncated page behind
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, file_path)
+
+
+class OpenAlexHarvester:
+    def __init__(self, client: httpx.AsyncClient, cache: PageCache, email: str, rate: float, concurrency: int,
+                 per_page: int = 200, max_per_concept: int = None, offline: bool = False, max_retries: int = 5):
+        self.client = client
+        self.cache = cache
+        self.email = email
+        self.limiter = RateLimiter(rate)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.per_page = per_page
+        self.max_per_concept = max_per_concept
+        self.offline = offline
+        self.max_retries = max_retries
+
+        self.pages_fetched = 0
+        self.pages_cached = 0
+        self.sources_seen = 0
+        self.retries = 0
+
+    async def get_page(self, path: str, params: dict):
+        """Returns one API page, from the disk cache when possible."""
+        cached = self.cache.get(path, params)
+        if cached is not None:
+            self.pages_cached += 1
+            return cached
+        if self.offline:
+            return None
+
+        query = dict(params)
+        if self.email:
+            query["mailto"] = self.email
+        for attempt in range(self.max_retries + 1):
+            response = None
+            async with self.semaphore:
+                await self.limiter.wait()
+                try:
+                    response = await self.client.get(f"{OPENALEX_BASE}{path}", params=query)
+                except httpx.TransportError:
+                    if attempt >= self.max_retries:
+                        raise
+            if response is not None and (response.status_code not in RETRYABLE_STATUS or attempt >= self.max_retries):
+                response.raise_for_status()
+                break
+            delay = retry_delay(response, attempt)
+            if response is not None and response.status_code == 429:
+                # The budget is shared, so every request backs off, not just this one
+                self.limiter.pause(delay)
+            self.retries += 1
+            # Sleep without holding a concurrency slot, so other pages keep going meanwhile
+            await asyncio.sleep(delay)
+
+        data = response.json()
+        self.cache.put(path, params, data)
+        self.pages_fetched += 1
+        return data
+
+    async def concept_id(self, field: str):
+        page = await self.get_page("/concepts", {"filter": f"display_name.search:{field}", "per-page": 1})
+        results = (page or {}).get("results") or []
+        return results[0]["id"] if results else None
+
+    async def sources_for_concept(self, concept_id: str) -> list:
+        """Follows cursor pagination through every journal tagged with the concept."""
+        short_id = concept_id.rsplit("/", 1)[-1]
+        sources = []
+        cursor = "*"
+        while cursor:
+            params = {
+                "filter": f"concepts.id:{short_id},type:journal",
+                "sort": "works_count:desc",
+                "per-page": self.per_page,
+                "cursor": cursor,
+            }
+            page = await self.get_page("/sources", params)
+            if page is None:
+                break  # offline and never fetched
+            results = page.get("results") or []
+            sources.extend(results)
+            self.sources_seen += len(results)
+            if not results or (self.max_per_concept and len(sources) >= self.max_per_concept):
+                break
+            cursor = page.get("meta", {}).get("next_cursor")
+        return sources[:self.max_per_concept] if self.max_per_concept else sources
+
+    async def harvest_field(self, field: str) -> list:
+        try:
+            concept_id = await self.concept_id(field)
+            if not concept_id:
+                return []
+            return await self.sources_for_concept(concept_id)
+        except Exception as e:
+            print(f"Error processing {field}: {e}")
+            return []
+
+
+def journal_record(venue: dict) -> dict:
+    """Same fields fetch.py stores per journal."""
+    return {
+        "id": venue["id"],
+        "display_name": venue.get("display_name", "Unknown Journal"),
+        "issn": venue.get("issn"),
+        "publisher": venue.get("host_organization_name") or venue.get("publisher"),
+        "works_count": venue.get("works_count"),
+        "cited_by_count": venue.get("cited_by_count"),
+        "homepage_url": venue.get("homepage_url"),
+        "is_oa": venue.get("is_oa"),
+        "is_in_doaj": venue.get("is_in_doaj"),
+        "society": venue.get("society"),
+        "summary_stats": venue.get("summary_stats"),
+        "concepts": venue.get("x_concepts") or venue.get("concepts"),
+    }
+
+
+async def harvest(args):
+    with open(args.fields, "r", encoding="utf-8") as f:
+        fields_of_study = [line.strip() for line in f if line.strip()]
+    print(f"Loaded {len(fields_of_study)} fields of study.")
+
+    cache = PageCache(args.cache_dir)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0), limits=limits) as client:
+        harvester = OpenAlexHarvester(
+            client, cache, args.email, args.rate, args.concurrency,
+            max_per_concept=args.max_per_concept, offline=args.offline,
+        )
+        start = time.perf_counter()
+        per_field = await asyncio.gather(*(harvester.harvest_field(field) for field in fields_of_study))
+        elapsed = time.perf_counter() - start
+
+    all_journals_metadata = {}
+    simple_journals_list = {}
+    for venues in per_field:
+        for venue in venues:
+            journal_id = venue["id"]
+            if journal_id not in all_journals_metadata:
+                all_journals_metadata[journal_id] = journal_record(venue)
+                simple_journals_list[journal_id] = all_journals_metadata[journal_id]["display_name"]
+
+    with open(args.out_metadata, "w", encoding="utf-8") as f:
+        json.dump(all_journals_metadata, f, indent=4)
+    with open(args.out_list, "w", encoding="utf-8") as f:
+        json.dump(simple_journals_list, f, indent=4)
+
+    print(f"\n✅ Saved metadata for {len(all_journals_metadata)} journals to '{args.out_metadata}'")
+    print(f"✅ Saved simple list for {len(simple_journals_list)} journals to '{args.out_list}'")
+    print(
+        f"Harvested {harvester.sources_seen} source records in {elapsed:.1f}s "
+        f"({harvester.sources_seen / max(elapsed, 1e-9):.1f} sources/sec); "
+        f"{harvester.pages_fetched} pages fetched, {harvester.pages_cached} served from cache, "
+        f"{harvester.retries} retries."
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Harvest journal metadata from OpenAlex.")
+    parser.add_argument("--email", default=os.getenv("YOUR_EMAIL", ""), help="Contact email for the OpenAlex polite pool")
+    parser.add_argument("--fields", default="fields.txt")
+    parser.add_argument("--cache-dir", default=".openalex_cache")
+    parser.add_argument("--out-metadata", default="journals_metadata.json")
+    parser.add_argument("--out-list", default="journals_list.json")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE_PER_S, help="Max requests per second")
+    parser.add_argument("--max-per-concept", type=int, default=None, help="Stop paginating a concept after this many journals")
+    parser.add_argument("--offline", action="store_true", help="Only use cached pages; never touch the network")
+    asyncio.run(harvest(parser.parse_args()))
@@ -0,0 +1,125 @@
+"""
+Offline replay check for harvest.py.
+
+Recorded OpenAlex pages (the PageCache directory of an earlier harvest, or a
+small synthetic recording built here) are served by a local stand-in
+transport, and the harvester is run against it into an empty cache. The
+check fails unless:
+
+  - the replayed harvest finds exactly the journals an --offline harvest of
+    the recording finds, i.e. every cursor chain is followed to its end;
+  - each query's first request, answered with 429 and a Retry-After header,
+    is retried no sooner than the header says;
+  - a second run over the new cache is served entirely from disk.
+
+Usage:
+    python harvest_replay.py                                      # synthetic recording
+    python harvest_replay.py --recorded .openalex_cache --fields fields.txt
+"""
+import argparse
+import asyncio
+import shutil
+import tempfile
+import time
+
+import httpx
+
+from harvest import OpenAlexHarvester, PageCache
+
+RETRY_AFTER_S = 0.2
+
+
+def synthetic_recording(directory: str, per_page: int = 200, fields=("Alpha", "Beta", "Gamma"),
+                        pages_per_concept: int = 3, sources_per_page: int = 4) -> list:
+    """Writes a small recording with multi-page cursor chains into `directory`; returns its fields."""
+    cache = PageCache(directory)
+    for c, field in enumerate(fields):
+        concept = f"https://openalex.org/C{c}"
+        cache.put("/concepts", {"filter": f"display_name.search:{field}", "per-page": 1},
+                  {"meta": {}, "results": [{"id": concept, "display_name": field}]})
+        cursor = "*"
+        for page in range(pages_per_concept):
+            next_cursor = f"{field}-{page + 1}" if page + 1 < pages_per_concept else None
+            # Neighbouring concepts share a page's worth of journals, so deduplication is exercised too
+            first = (c * (pages_per_concept - 1) + page) * sources_per_page
+            results = [{"id": f"https://openalex.org/S{first + i}", "display_name": f"Journal {first + i}"}
+                       for i in range(sources_per_page)]
+            params = {"filter": f"concepts.id:C{c},type:journal", "sort": "works_count:desc",
+                      "per-page": per_page, "cursor": cursor}
+            cache.put("/sources", params, {"meta": {"next_cursor": next_cursor}, "results": results})
+            cursor = next_cursor
+    return list(fields)
+
+
+class ReplayStandIn:
+    """httpx transport answering from a PageCache; the first request per query gets a 429."""
+
+    def __init__(self, recorded: PageCache, retry_after_s: float = RETRY_AFTER_S):
+        self.recorded = recorded
+        self.retry_after_s = retry_after_s
+        self.first_seen = {}  # query -> time of the throttled request
+        self.early_retries = 0
+        self.requests = 0
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        params = {k: v for k, v in request.url.params.items() if k != "mailto"}
+        query = (request.url.path, tuple(sorted(params.items())))
+        now = time.monotonic()
+        if query not in self.first_seen:
+            self.first_seen[query] = now
+            return httpx.Response(429, headers={"Retry-After": str(self.retry_after_s)})
+        if now - self.first_seen[query] < self.retry_after_s * 0.95:
+            self.early_retries += 1
+        page = self.recorded.get(request.url.path, params)
+        if page is None:
+            return httpx.Response(404, json={"error": "not recorded"})
+        return httpx.Response(200, json=page)
+
+
+async def harvest_ids(cache: PageCache, fields: list, transport=None, offline: bool = False, concurrency: int = 4):
+    async with httpx.AsyncClient(transport=transport) as client:
+        harvester = OpenAlexHarvester(client, cache, "", rate=0.0, concurrency=concurrency, offline=offline)
+        per_field = await asyncio.gather(*(harvester.harvest_field(field) for field in fields))
+    return {venue["id"] for venues in per_field for venue in venues}, harvester
+
+
+async def run(args) -> bool:
+    recorded_dir = args.recorded or tempfile.mkdtemp(prefix="openalex-recording-")
+    if args.recorded:
+        with open(args.fields, "r", encoding="utf-8") as f:
+            fields = [line.strip() for line in f if line.strip()]
+    else:
+        fields = synthetic_recording(recorded_dir)
+    recorded = PageCache(recorded_dir)
+    fresh_dir = tempfile.mkdtemp(prefix="openalex-replay-")
+    try:
+        expected, _ = await harvest_ids(recorded, fields, offline=True)
+        stand_in = ReplayStandIn(recorded)
+        fresh = PageCache(fresh_dir)
+        start = time.perf_counter()
+        replayed, harvester = await harvest_ids(fresh, fields, transport=httpx.MockTransport(stand_in.handle))
+        elapsed = time.perf_counter() - start
+        rerun, rerun_harvester = await harvest_ids(fresh, fields, transport=httpx.MockTransport(stand_in.handle))
+    finally:
+        shutil.rmtree(fresh_dir, ignore_errors=True)
+        if not args.recorded:
+            shutil.rmtree(recorded_dir, ignore_errors=True)
+
+    checks = {
+        "same journals as the recording": replayed == expected and len(expected) > 0,
+        "Retry-After honoured": stand_in.early_retries == 0 and harvester.retries == len(stand_in.first_seen),
+        "re-run served from cache": rerun == expected and rerun_harvester.pages_fetched == 0,
+    }
+    print(f"{len(fields)} fields, {len(expected)} journals, {harvester.pages_fetched} pages replayed "
+          f"({harvester.retries} throttled) in {elapsed:.2f}s")
+    for name, ok in checks.items():
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+    return all(checks.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check harvest.py offline against recorded OpenAlex pages.")
+    parser.add_argument("--recorded", default=None, help="PageCache directory of an earlier run (default: synthetic)")
+    parser.add_argument("--fields", default="fields.txt", help="Fields of study the recording was made with")
+    raise SystemExit(0 if asyncio.run(run(parser.parse_args())) else 1)
@@ -64,39 +64,90 @@ export default function ChatPage() {
     setIsTyping(true);
 
     try {
-      // Get uploaded paper context if available
-      const paperContext = sessionStorage.getItem('uploadedPaperText') || '';
-      
-      // Create a research-focused prompt with context
-      const systemPrompt = `You are an AI research assistant specialized in academic publishing, journal recommendations, paper formatting, and submission guidelines. You ONLY provide information related to research work, academic publishing, and scholarly communication.
+      const baseUrl = process.env.NEXT_PUBLIC_API_BASE_URL || 'http://localhost:8000';
+      // With an uploaded paper, the backend adds the passages relevant to this question to the prompt
+      const paperSessionId = sessionStorage.getItem('paperSessionId');
+      let response: Response | null = null;
+      if (paperSessionId) {
+        response = await fetch(`${baseUrl}/papers/sessions/${encodeURIComponent(paperSessionId)}/chat`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ question: userQuery }),
+        });
+        if (response.status === 404) {
+          // The session expired; answer without the paper
+          sessionStorage.removeItem('paperSessionId');
+          response = null;
+        }
+      }
 
-${paperContext ? `The user has uploaded a research paper. Here is the content for context:\n\n${paperContext.slice(0, 3000)}\n\n` : ''}
+      if (!response) {
+        const systemPrompt = `You are an AI research assistant specialized in academic publishing, journal recommendations, paper formatting, and submission guidelines. You ONLY provide information related to research work, academic publishing, and scholarly communication.
 
 User question: ${userQuery}
 
 Provide a helpful, accurate response focused on research and academic publishing. If the question is not related to research work, politely redirect the user to ask about journal recommendations, paper formatting, submission guidelines, or other academic publishing topics.`;
 
-      const baseUrl = process.env.NEXT_PUBLIC_API_BASE_URL || 'http://localhost:8000';
-      const response = await fetch(`${baseUrl}/generate`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ prompt: systemPrompt }),
-      });
+        response = await fetch(`${baseUrl}/generate/stream`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ prompt: systemPrompt }),
+        });
+      }
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error(`API error: ${response.status}`);
       }
 
-      const data = await response.json();
-      const aiResponse: Message = {
-        id: Math.random().toString(36).substr(2, 9),
-        role: 'assistant',
-        content: data.generated_text || 'I apologize, but I could not generate a response. Please try again.',
-        timestamp: new Date(),
-        type: 'text'
-      };
+      // Show the reply as it streams in (Server-Sent Events: "data: {...}" blocks separated by blank lines)
+      const aiMessageId = Math.random().toString(36).substr(2, 9);
+      let aiContent = '';
+      let started = false;
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split('\n\n');
+        buffer = events.pop() || '';
+        for (const rawEvent of events) {
+          const lines = rawEvent.split('\n');
+          const eventType = lines.find(l => l.startsWith('event:'))?.slice(6).trim() || 'message';
+          const dataLine = lines.find(l => l.startsWith('data:'));
+          if (!dataLine) continue;
+          const data = JSON.parse(dataLine.slice(5));
 
-      setMessages(prev => [...prev, aiResponse]);
+          if (eventType === 'error') {
+            throw new Error(`API error: ${data.status_code} ${data.detail}`);
+          }
+          if (eventType === 'message' && data.text) {
+            aiContent += data.text;
+            const content = aiContent;
+            if (!started) {
+              started = true;
+              setIsTyping(false);
+              setMessages(prev => [...prev, { id: aiMessageId, role: 'assistant', content, timestamp: new Date(), type: 'text' }]);
+            } else {
+              setMessages(prev => prev.map(m => (m.id === aiMessageId ? { ...m, content } : m)));
+            }
+          }
+        }
+      }
+
+      if (!started) {
+        const aiResponse: Message = {
+          id: aiMessageId,
+          role: 'assistant',
+          content: 'I apologize, but I could not generate a response. Please try again.',
+          timestamp: new Date(),
+          type: 'text'
+        };
+        setMessages(prev => [...prev, aiResponse]);
+      }
     } catch (error) {
       console.error('Error calling Gemini API:', error);
       const errorMessage: Message = {
@@ -1,8 +1,6 @@
 "use client";
 
 import { useState, useRef } from 'react';
-import * as pdfjsLib from 'pdfjs-dist/build/pdf.mjs';
-import mammoth from 'mammoth/mammoth.browser';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card';
 import { Badge } from '@/components/ui/badge';
@@ -22,31 +20,9 @@ export default function UploadPage() {
   const [results, setResults] = useState<JournalResult[] | null>(null);
   const [dragActive, setDragActive] = useState(false);
   const [uploadMethod, setUploadMethod] = useState<'file' | 'text'>('file');
+  const [uploadProgress, setUploadProgress] = useState<string | null>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
 
-  const extractPdfText = async (file: File): Promise<string> => {
-    // Configure pdfjs worker: use CDN with the SAME version as the imported API to avoid version mismatch
-    const pdfjsVersion = (pdfjsLib as any)?.version || '4.10.38';
-    (pdfjsLib as any).GlobalWorkerOptions.workerSrc = `https://unpkg.com/pdfjs-dist@${pdfjsVersion}/build/pdf.worker.min.mjs`;
-    const arrayBuffer = await file.arrayBuffer();
-    const loadingTask = (pdfjsLib as any).getDocument({ data: arrayBuffer });
-    const pdf = await loadingTask.promise;
-    let fullText = '';
-    for (let pageNum = 1; pageNum <= pdf.numPages; pageNum++) {
-      const page = await pdf.getPage(pageNum);
-      const content = await page.getTextContent();
-      const strings = content.items.map((item: any) => item.str);
-      fullText += strings.join(' ') + '\n';
-    }
-    return fullText.trim();
-  };
-
-  const extractDocxText = async (file: File): Promise<string> => {
-    const arrayBuffer = await file.arrayBuffer();
-    const result = await (mammoth as any).extractRawText({ arrayBuffer });
-    return (result.value || '').trim();
-  };
-
   const first2000Words = (text: string): string => {
     const words = text.trim().split(/\s+/);
     if (words.length <= 2000) return text.trim();
@@ -58,30 +34,17 @@ export default function UploadPage() {
     
     setIsAnalyzing(true);
     setResults(null);
+    setUploadProgress(null);
 
     try {
-      let extractedText = '';
-      if (file.type === 'application/pdf' || file.name.toLowerCase().endsWith('.pdf')) {
-        extractedText = await extractPdfText(file);
-      } else if (file.type.includes('word') || file.name.toLowerCase().endsWith('.docx')) {
-        extractedText = await extractDocxText(file);
-      } else {
-        extractedText = await file.text();
-      }
-
-      // Log extracted content
-      console.log('[Upload] Extracted text characters:', extractedText.length);
-      console.log('[Upload] First 1000 chars:', extractedText.slice(0, 1000));
-
-      sessionStorage.setItem('uploadedPaperText', extractedText);
-
-      const trimmed = first2000Words(extractedText);
-      const apiResults = await searchJournals(trimmed);
+      // The backend extracts and embeds the file page by page, streaming progress as it goes
+      const apiResults = await uploadPaper(file);
       setResults(apiResults);
     } catch (err) {
       console.error('Failed to process file:', err);
     } finally {
       setIsAnalyzing(false);
+      setUploadProgress(null);
     }
   };
 
@@ -95,10 +58,9 @@ export default function UploadPage() {
     const abstractEl = (document.getElementById('abstract') as HTMLTextAreaElement);
     const text = `Title: ${titleEl?.value || ''}\n\nAbstract: ${abstractEl?.value || ''}`.trim();
     console.log('[Upload] Text input chars:', text.length);
-    sessionStorage.setItem('uploadedPaperText', text);
     try {
       const trimmed = first2000Words(text);
-      const apiResults = await searchJournals(trimmed);
+      const [apiResults] = await Promise.all([searchJournals(trimmed), createPaperSession(text)]);
       setResults(apiResults);
     } catch (err) {
       console.error('Failed sending text to backend:', err);
@@ -136,6 +98,76 @@ export default function UploadPage() {
     return 'bg-slate-100 text-slate-800 dark:bg-slate-900/30 dark:text-slate-300';
   };
 
+  // The backend keeps the paper (as embedded passages) for the chat page, which then only sends questions
+  const createPaperSession = async (text: string): Promise<void> => {
+    sessionStorage.removeItem('paperSessionId');
+    try {
+      const baseUrl = process.env.NEXT_PUBLIC_API_BASE_URL || 'http://localhost:8000';
+      const res = await fetch(`${baseUrl}/papers/sessions`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ text }),
+      });
+      if (!res.ok) {
+        throw new Error(`Backend error ${res.status}: ${await res.text()}`);
+      }
+      const data = await res.json();
+      sessionStorage.setItem('paperSessionId', data.session_id);
+      console.log('[Upload] Paper session created with', data.passages, 'passages');
+    } catch (err) {
+      // Chat still works without the paper as context
+      console.error('Failed to create paper session:', err);
+    }
+  };
+
+  // Parses the Server-Sent Events of /search_journals/upload; the upload also creates the paper session for chat
+  const uploadPaper = async (file: File): Promise<JournalResult[]> => {
+    sessionStorage.removeItem('paperSessionId');
+    const baseUrl = process.env.NEXT_PUBLIC_API_BASE_URL || 'http://localhost:8000';
+    const form = new FormData();
+    form.append('file', file);
+    form.append('top_n', '5');
+    const res = await fetch(`${baseUrl}/search_journals/upload`, { method: 'POST', body: form });
+    if (!res.ok || !res.body) {
+      throw new Error(`Backend error ${res.status}: ${await res.text()}`);
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      const events = buffer.split('\n\n');
+      buffer = events.pop() || '';
+      for (const rawEvent of events) {
+        const lines = rawEvent.split('\n');
+        const eventType = lines.find(l => l.startsWith('event:'))?.slice(6).trim() || 'message';
+        const dataLine = lines.find(l => l.startsWith('data:'));
+        if (!dataLine) continue;
+        const data = JSON.parse(dataLine.slice(5));
+
+        if (eventType === 'error') {
+          throw new Error(`Backend error ${data.status_code}: ${data.detail}`);
+        }
+        if (eventType === 'progress') {
+          const pages = data.total_pages ? `${data.pages}/${data.total_pages}` : `${data.pages}`;
+          setUploadProgress(data.stage === 'embed'
+            ? `Embedded ${data.passages_embedded} passages (read ${pages} pages)`
+            : `Reading page ${pages}`);
+        }
+        if (eventType === 'results') {
+          sessionStorage.setItem('paperSessionId', data.session_id);
+          console.log('[Upload] Processed', data.pages, 'pages into', data.passages, 'passages');
+          return (data.results || []) as JournalResult[];
+        }
+      }
+    }
+    throw new Error('Upload stream ended without results');
+  };
+
   const searchJournals = async (text: string): Promise<JournalResult[]> => {
     const baseUrl = process.env.NEXT_PUBLIC_API_BASE_URL || 'http://localhost:8000';
     const res = await fetch(`${baseUrl}/search_journals`, {
@@ -294,7 +326,7 @@ export default function UploadPage() {
                   <div className="flex items-center space-x-3">
                     <Loader2 className="h-5 w-5 animate-spin text-purple-600" />
                     <span className="text-slate-900 dark:text-slate-100 font-medium">
-                      Analyzing your research...
+                      {uploadProgress || 'Analyzing your research...'}
                     </span>
                   </div>
                   <div className="space-y-3">
@@ -85,6 +85,11 @@ if __name__ == "__main__":
         metadatas_to_add = []
         ids_to_add = []
         
+        # Optional: Check which journal IDs already exist to avoid duplicates.
+        # One bulk lookup per concept instead of one collection.get per journal.
+        candidate_ids = [j['id'].split('/')[-1] for j in journals if j.get('id')]
+        existing_ids = set(collection.get(ids=candidate_ids, include=[])['ids']) if candidate_ids else set()
+
         # STEP 3: Extract the required fields from each journal
         for journal in journals:
             # The journal ID from OpenAlex will be our unique ID in ChromaDB
@@ -95,8 +100,7 @@ if __name__ == "__main__":
                 print(f"  - Skipping journal due to missing critical data (ID or display_name).")
                 continue
 
-            # Optional: Check if the journal ID already exists to avoid duplicates
-            if collection.get(ids=[journal_id])['ids']:
+            if journal_id in existing_ids:
                 print(f"  - Skipping journal '{journal.get('display_name')}'. Already in collection.")
                 continue
 
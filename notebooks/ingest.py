@@ -0,0 +1,379 @@
+"""
+Batched producer/consumer ingestion pipeline: read -> embed -> upsert.
+
+The three stages run in their own threads, connected by bounded queues, so
+fetching the next records (network), embedding the current batch (CPU/GPU)
+and upserting the previous chunk (network) all overlap:
+
+    source iterator --records--> embedder --embedded--> upserter --> collection
+
+The embedder groups records into length buckets before batching: it buffers a
+window of records, sorts them by text length and cuts batches from that order,
+so each padded forward pass wastes little compute on padding.
+
+Each record is a dict with "id", "text" (what gets embedded), "document" and
+"metadata".
+
+Incremental runs: every upserted record carries "embed_hash" (a hash of the
+embedded text plus the model name) and "embed_model" in its metadata.
+`changed_records` diffs a record stream against the collection in bulk and
+keeps only new or changed rows, and a Checkpoint file lets an interrupted run
+resume without redoing chunks that were already upserted.
+
+Cache invalidation: with bump_epoch, every upsert also sets a new epoch in
+the collection's metadata (EPOCH_KEY). The app's search-result cache is
+tagged with that epoch and drops its entries when it notices the change
+(within SEARCH_CACHE_EPOCH_POLL_S seconds).
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+import torch
+from transformers import AutoTokenizer, AutoModel
+
+MODEL_NAME = 'allenai/scibert_scivocab_uncased'
+# Collection metadata key holding the collection epoch; must match backend/search_cache.py
+EPOCH_KEY = "hackcors_epoch"
+_DONE = object()
+
+
+class ScibertEmbedder:
+    """Batched SciBERT mean-pooled embeddings."""
+
+    def __init__(self, model_name: str = MODEL_NAME, device: str = None, max_length: int = 512):
+        self.model_name = model_name
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.max_length = max_length
+        print(f"Loading tokenizer and model: '{model_name}' on {self.device}...")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name).to(self.device)
+        self.model.eval()
+
+    def embed(self, texts: list) -> list:
+        inputs = self.tokenizer(texts, return_tensors='pt', truncation=True, padding=True, max_length=self.max_length).to(self.device)
+        with torch.no_grad():
+            outputs = self.model(**inputs)
+
+        # Mean pooling per row
+        last_hidden_states = outputs.last_hidden_state
+        mask_expanded = inputs['attention_mask'].unsqueeze(-1).expand(last_hidden_states.size()).float()
+        sum_embeddings = torch.sum(last_hidden_states * mask_expanded, 1)
+        sum_mask = torch.clamp(mask_expanded.sum(1), min=1e-9)
+        return (sum_embeddings / sum_mask).cpu().numpy().tolist()
+
+
+def content_hash(text: str, model_name: str) -> str:
+    """Identifies an embedding: same text + same model => same vector."""
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+def stamp_record(record: dict, model_name: str) -> dict:
+    """Adds embed_hash / embed_model to a record's metadata (in place) and returns it."""
+    metadata = dict(record.get("metadata") or {})
+    metadata["embed_hash"] = content_hash(record["text"], model_name)
+    metadata["embed_model"] = model_name
+    record["metadata"] = metadata
+    return record
+
+
+def changed_records(collection, records, model_name: str, chunk_size: int = 200, stats: dict = None):
+    """
+    Yields only records that are new, or whose text or model changed since they were stored.
+
+    Existing metadata is fetched with one collection.get(ids=[...]) per chunk
+    of records instead of one call per record. Records repeated within the
+    stream (e.g. a journal listed under several concepts) are yielded once.
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("unchanged", 0)
+    stats.setdefault("changed", 0)
+    seen = set()
+
+    def flush(chunk):
+        existing = collection.get(ids=[r["id"] for r in chunk], include=["metadatas"])
+        stored = {
+            record_id: (metadata or {}).get("embed_hash")
+            for record_id, metadata in zip(existing["ids"], existing["metadatas"])
+        }
+        for record in chunk:
+            if stored.get(record["id"]) == record["metadata"]["embed_hash"]:
+                stats["unchanged"] += 1
+            else:
+                stats["changed"] += 1
+                yield record
+
+    chunk = []
+    for record in records:
+        if record["id"] in seen:
+            continue
+        seen.add(record["id"])
+        chunk.append(stamp_record(record, model_name))
+        if len(chunk) >= chunk_size:
+            yield from flush(chunk)
+            chunk = []
+    if chunk:
+        yield from flush(chunk)
+
+
+def bump_collection_epoch(collection) -> int:
+    """
+    Sets a new epoch on the collection so caches of earlier query results are dropped; returns it.
+
+    The epoch is a nanosecond timestamp (kept above the previous value), not
+    a counter: modify() is not atomic, so two ingest runs bumping at once
+    would both write current + 1 and one bump would be lost. Distinct
+    timestamps always differ from the epoch the app has cached.
+
+    modify() replaces the whole metadata dict, so the new epoch is merged into
+    the existing keys. The exception is hnsw:* (creation-time index settings,
+    which modify() rejects): after the first bump they are no longer in the
+    metadata, but the collection configuration keeps them, and that is where
+    the distance space must be read from (see distance_space in
+    backend/vector_index.py). The merge is still a read-modify-write, so
+    other metadata keys should only be changed while no ingest run is
+    writing.
+    """
+    current = dict(collection.metadata or {})
+    epoch = max(int(current.get(EPOCH_KEY, 0)) + 1, time.time_ns())
+    merged = {k: v for k, v in current.items() if not k.startswith("hnsw:")}
+    merged[EPOCH_KEY] = epoch
+    collection.modify(metadata=merged)
+    return epoch
+
+
+class Checkpoint:
+    """
+    Append-only log of (id, embed_hash) pairs that have been upserted.
+
+    Written after every successful upsert, so a run that is interrupted can be
+    restarted and will skip exactly the records that already made it in.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a torn final line from an interrupted write
+                    self.done.add((entry["id"], entry["hash"]))
+            print(f"Resuming from checkpoint '{path}' ({len(self.done)} records already done).")
+
+    def is_done(self, record: dict) -> bool:
+        return (record["id"], record["metadata"].get("embed_hash")) in self.done
+
+    def mark(self, records: list):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in records:
+                key = (record["id"], record["metadata"].get("embed_hash"))
+                self.done.add(key)
+                f.write(json.dumps({"id": key[0], "hash": key[1]}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear(self):
+        """Removes the checkpoint once a run has completed."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.done = set()
+
+
+class StageStats:
+    def __init__(self):
+        self.items = 0
+        self.calls = 0
+        self.busy_s = 0.0
+
+
+class IngestionPipeline:
+    """Runs records through embedding and upserting with overlapping stages."""
+
+    def __init__(self, embedder, collection, embed_batch_size: int = 32, upsert_batch_size: int = 500,
+                 bucket_batches: int = 8, queue_size: int = 4, report_every_s: float = 10.0, bump_epoch: bool = False):
+        self.embedder = embedder
+        self.collection = collection
+        # Bump the collection epoch after every upsert (Chroma collections only)
+        self.bump_epoch = bump_epoch
+        self.embed_batch_size = embed_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        # How many batches' worth of records are sorted together for length bucketing
+        self.bucket_size = embed_batch_size * bucket_batches
+        self.queue_size = queue_size
+        self.report_every_s = report_every_s
+
+        self.read = StageStats()
+        self.skipped = 0
+        self.embedded = StageStats()
+        self.upserted = StageStats()
+        self.checkpoint = None
+        self._errors = []
+
+    # --- Stages ---
+
+    def _reader(self, records, out_q):
+        try:
+            batch = []
+            for record in records:
+                self.read.items += 1
+                if self.checkpoint is not None and self.checkpoint.is_done(record):
+                    self.skipped += 1
+                    continue
+                batch.append(record)
+                if len(batch) >= self.bucket_size:
+                    out_q.put(batch)
+                    batch = []
+            if batch:
+                out_q.put(batch)
+        except Exception as e:
+            self._errors.append(e)
+        finally:
+            out_q.put(_DONE)
+
+    def _embedder(self, in_q, out_q):
+        try:
+            while True:
+                bucket = in_q.get()
+                if bucket is _DONE:
+                    break
+                bucket.sort(key=lambda r: len(r["text"]))
+                for start in range(0, len(bucket), self.embed_batch_size):
+                    batch = bucket[start:start + self.embed_batch_size]
+                    t0 = time.perf_counter()
+                    embeddings = self.embedder.embed([r["text"] for r in batch])
+                    self.embedded.busy_s += time.perf_counter() - t0
+                    self.embedded.calls += 1
+                    self.embedded.items += len(batch)
+                    for record, embedding in zip(batch, embeddings):
+                        record["embedding"] = embedding
+                    out_q.put(batch)
+        except Exception as e:
+            self._errors.append(e)
+            # Keep draining so the reader never blocks on a full queue
+            while in_q.get() is not _DONE:
+                pass
+        finally:
+            out_q.put(_DONE)
+
+    def _flush(self, pending):
+        t0 = time.perf_counter()
+        self.collection.upsert(
+            ids=[r["id"] for r in pending],
+            embeddings=[r["embedding"] for r in pending],
+            documents=[r["document"] for r in pending],
+            metadatas=[r["metadata"] for r in pending],
+        )
+        if self.bump_epoch:
+            bump_collection_epoch(self.collection)
+        self.upserted.busy_s += time.perf_counter() - t0
+        self.upserted.calls += 1
+        self.upserted.items += len(pending)
+        if self.checkpoint is not None:
+            self.checkpoint.mark(pending)
+
+    def _upserter(self, in_q):
+        pending = []
+        try:
+            while True:
+                batch = in_q.get()
+                if batch is _DONE:
+                    break
+                pending.extend(batch)
+                while len(pending) >= self.upsert_batch_size:
+                    self._flush(pending[:self.upsert_batch_size])
+                    pending = pending[self.upsert_batch_size:]
+            if pending:
+                self._flush(pending)
+        except Exception as e:
+            self._errors.append(e)
+            # Keep draining so the embedder never blocks on a full queue
+            while in_q.get() is not _DONE:
+                pass
+
+    # --- Driver ---
+
+    def report(self, elapsed: float, final: bool = False) -> str:
+        rate = self.upserted.items / elapsed if elapsed > 0 else 0.0
+        line = (
+            f"read {self.read.items} ({self.skipped} done in checkpoint) | embedded {self.embedded.items} in {self.embedded.calls} batches "
+            f"({self.embedded.busy_s:.1f}s busy) | upserted {self.upserted.items} in {self.upserted.calls} calls "
+            f"({self.upserted.busy_s:.1f}s busy) | {rate:.1f} records/s"
+        )
+        print(("Done: " if final else "Progress: ") + line)
+        return line
+
+    def run(self, records, checkpoint: Checkpoint = None) -> dict:
+        """
+        Consumes an iterable of records; returns throughput figures.
+
+        With a checkpoint, records it already lists are skipped and every
+        upserted chunk is recorded; the checkpoint is cleared on success.
+        """
+        self.checkpoint = checkpoint
+        embed_q = queue.Queue(maxsize=self.queue_size)
+        upsert_q = queue.Queue(maxsize=self.queue_size)
+        threads = [
+            threading.Thread(target=self._reader, args=(records, embed_q), name="ingest-reader", daemon=True),
+            threading.Thread(target=self._embedder, args=(embed_q, upsert_q), name="ingest-embedder", daemon=True),
+            threading.Thread(target=self._upserter, args=(upsert_q,), name="ingest-upserter", daemon=True),
+        ]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        while threads[-1].is_alive():
+            threads[-1].join(timeout=self.report_every_s)
+            if threads[-1].is_alive():
+                self.report(time.perf_counter() - start)
+        for t in threads:
+            t.join()
+
+        elapsed = time.perf_counter() - start
+        self.report(elapsed, final=True)
+        if self._errors:
+            raise self._errors[0]
+        if checkpoint is not None:
+            checkpoint.clear()
+        return {
+            "records": self.upserted.items,
+            "elapsed_s": elapsed,
+            "records_per_s": self.upserted.items / elapsed if elapsed > 0 else 0.0,
+            "embed_batches": self.embedded.calls,
+            "upsert_calls": self.upserted.calls,
+        }
+
+
+def collection_ids(collection, page_size: int = 1000) -> list:
+    """Every record id in the collection, read up front (ids only, so it is cheap)."""
+    ids = []
+    while True:
+        page = collection.get(include=[], limit=page_size, offset=len(ids))
+        if not page["ids"]:
+            return ids
+        ids.extend(page["ids"])
+
+
+def iter_collection(collection, page_size: int = 500, include=("metadatas", "documents"), ids: list = None):
+    """
+    Yields (id, metadata, document) for every record, fetching the collection in pages.
+
+    Pages are fetched by id from a snapshot of the id list (`ids`, or taken
+    before the first record is yielded), not by offset: a pipeline upserting
+    into the same collection while it reads would otherwise shift the offsets
+    between pages and skip or repeat records.
+    """
+    if ids is None:
+        ids = collection_ids(collection)
+    for start in range(0, len(ids), page_size):
+        page = collection.get(ids=ids[start:start + page_size], include=list(include))
+        # Read the ids back from the page: get(ids=...) does not promise the requested order
+        for i, record_id in enumerate(page["ids"]):
+            yield record_id, page["metadatas"][i], page["documents"][i]
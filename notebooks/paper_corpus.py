@@ -0,0 +1,187 @@
+"""
+Paper-level corpus: embeddings of recent papers from every journal.
+
+Journal vectors built from "title. Concepts: ..." strings are a coarse proxy
+for what a journal publishes. This script fetches each journal's most recent
+works from OpenAlex (title + abstract), embeds them with the same SciBERT
+mean pooling as the journal vectors, and writes a flat corpus that
+backend/ivfpq.py builds its approximate index from.
+
+Two steps:
+
+    python paper_corpus.py fetch --per-journal 200      # OpenAlex -> shards/
+    python paper_corpus.py consolidate                  # shards/ -> flat arrays
+
+`fetch` runs through the same IngestionPipeline as updated_fetch.py, with a
+ShardWriter in place of the Chroma collection: every upsert chunk becomes one
+float16 .npy shard plus a .jsonl sidecar. The shards double as the
+checkpoint: a re-run (or a run resumed after an interruption) skips every
+paper that is already in one.
+
+`consolidate` writes, into the corpus directory:
+    embeddings.npy       (n, 768) float16
+    paper_journals.npy   (n,) int32 journal row of each paper
+    journals.json        {"ids": [short ids], "names": [...]}
+    titles.bin / title_offsets.npy   titles as a UTF-8 blob + int64 offsets
+"""
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+import pyalex
+
+from ingest import IngestionPipeline, ScibertEmbedder, stamp_record, MODEL_NAME
+
+CORPUS_DIR = "paper_corpus"
+# SciBERT sees at most 512 tokens; longer abstracts are truncated by the tokenizer anyway
+MAX_TEXT_CHARS = 3000
+
+
+class ShardWriter:
+    """Collection stand-in for IngestionPipeline: each upsert is written as one shard."""
+
+    def __init__(self, directory: str):
+        self.directory = os.path.join(directory, "shards")
+        os.makedirs(self.directory, exist_ok=True)
+        self.next_shard = len(glob.glob(os.path.join(self.directory, "*.npy")))
+
+    def existing_ids(self) -> set:
+        ids = set()
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.jsonl"))):
+            with open(path, "r", encoding="utf-8") as f:
+                ids.update(json.loads(line)["id"] for line in f if line.strip())
+        return ids
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        name = os.path.join(self.directory, f"{self.next_shard:06d}")
+        self.next_shard += 1
+        # Vectors first: a shard only counts once its sidecar exists (see shard_paths)
+        np.save(name + ".npy", np.asarray(embeddings, dtype=np.float16))
+        with open(name + ".jsonl.tmp", "w", encoding="utf-8") as f:
+            for paper_id, document, metadata in zip(ids, documents, metadatas):
+                f.write(json.dumps({"id": paper_id, "title": document, "journal": metadata["journal"]}) + "\n")
+        os.replace(name + ".jsonl.tmp", name + ".jsonl")
+
+    def shard_paths(self) -> list:
+        return [path[:-len(".jsonl")] for path in sorted(glob.glob(os.path.join(self.directory, "*.jsonl")))]
+
+
+def load_journals(metadata_path: str) -> list:
+    """(short id, display name) of every journal in journals_metadata.json."""
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        journals = json.load(f)
+    return [(journal_id.rsplit("/", 1)[-1], record.get("display_name") or "") for journal_id, record in journals.items()]
+
+
+def paper_records(journals: list, per_journal: int, skip_ids: set, stats: dict):
+    """
+    Yields one record per recent paper with a title, newest first per journal.
+
+    Runs on the pipeline's reader thread, so the next journal's works are
+    fetched while earlier papers are embedded.
+    """
+    for position, (journal_id, name) in enumerate(journals, 1):
+        print(f"[{position}/{len(journals)}] Fetching up to {per_journal} works of '{name}'...")
+        try:
+            pages = pyalex.Works().filter(primary_location={"source": {"id": journal_id}}) \
+                .sort(publication_date="desc").paginate(per_page=200, n_max=per_journal)
+            for page in pages:
+                for work in page:
+                    paper_id = (work.get("id") or "").rsplit("/", 1)[-1]
+                    title = work.get("title") or work.get("display_name")
+                    if not paper_id or not title:
+                        continue
+                    if paper_id in skip_ids:
+                        stats["already_sharded"] += 1
+                        continue
+                    abstract = work["abstract"] or ""
+                    text = f"{title}. {abstract}".strip()[:MAX_TEXT_CHARS]
+                    stats["papers"] += 1
+                    yield stamp_record({"id": paper_id, "text": text, "document": title, "metadata": {"journal": journal_id}},
+                                       MODEL_NAME)
+        except Exception as e:
+            stats["failed_journals"] += 1
+            print(f"  -> Error fetching works of '{name}': {e}")
+
+
+def fetch(args):
+    if args.email:
+        pyalex.config.email = args.email
+    journals = load_journals(args.metadata)
+    writer = ShardWriter(args.corpus)
+    skip_ids = writer.existing_ids()
+    print(f"{len(journals)} journals; {len(skip_ids)} papers already in shards.")
+
+    embedder = ScibertEmbedder(MODEL_NAME)
+    pipeline = IngestionPipeline(embedder, writer, embed_batch_size=args.embed_batch_size, upsert_batch_size=args.shard_size)
+    stats = {"papers": 0, "already_sharded": 0, "failed_journals": 0}
+    summary = pipeline.run(paper_records(journals, args.per_journal, skip_ids, stats))
+    print(f"Embedded {summary['records']} papers ({summary['records_per_s']:.1f} papers/s); {stats}")
+
+
+def consolidate(args):
+    """Concatenates the shards into the flat corpus arrays; papers seen twice keep their first copy."""
+    writer = ShardWriter(args.corpus)
+    journals = load_journals(args.metadata)
+    journal_rows = {journal_id: row for row, (journal_id, _) in enumerate(journals)}
+
+    seen = set()
+    paths = writer.shard_paths()
+    keep_per_shard, journal_column, titles = [], [], []
+    for path in paths:
+        with open(path + ".jsonl", "r", encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        keep = []
+        for i, entry in enumerate(entries):
+            if entry["id"] in seen or entry["journal"] not in journal_rows:
+                continue
+            seen.add(entry["id"])
+            keep.append(i)
+            journal_column.append(journal_rows[entry["journal"]])
+            titles.append(entry["title"].encode("utf-8"))
+        keep_per_shard.append(keep)
+
+    n = len(journal_column)
+    if not n:
+        raise SystemExit(f"No papers in '{writer.directory}'; run `python paper_corpus.py fetch` first.")
+    dim = np.load(paths[0] + ".npy", mmap_mode="r").shape[1]
+    # Written through a memmap so millions of vectors never have to fit in RAM at once
+    embeddings = np.lib.format.open_memmap(os.path.join(args.corpus, "embeddings.npy"), mode="w+", dtype=np.float16, shape=(n, dim))
+    row = 0
+    for path, keep in zip(paths, keep_per_shard):
+        if keep:
+            embeddings[row:row + len(keep)] = np.load(path + ".npy")[keep]
+            row += len(keep)
+    embeddings.flush()
+    del embeddings
+
+    np.save(os.path.join(args.corpus, "paper_journals.npy"), np.asarray(journal_column, dtype=np.int32))
+    with open(os.path.join(args.corpus, "journals.json"), "w", encoding="utf-8") as f:
+        json.dump({"ids": [j for j, _ in journals], "names": [name for _, name in journals]}, f)
+    with open(os.path.join(args.corpus, "titles.bin"), "wb") as f:
+        f.write(b"".join(titles))
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(t) for t in titles])
+    np.save(os.path.join(args.corpus, "title_offsets.npy"), offsets)
+    print(f"Consolidated {n} papers of {len(set(journal_column))} journals from {len(paths)} shards into '{args.corpus}'")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the paper-level corpus for the IVF-PQ index.")
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    parser.add_argument("--metadata", default="../db/journals_metadata.json")
+    sub = parser.add_subparsers(dest="command", required=True)
+    fetch_parser = sub.add_parser("fetch")
+    fetch_parser.add_argument("--per-journal", type=int, default=200, help="Most recent works fetched per journal")
+    fetch_parser.add_argument("--email", default=os.getenv("YOUR_EMAIL", ""), help="Contact email for the OpenAlex polite pool")
+    fetch_parser.add_argument("--embed-batch-size", type=int, default=32)
+    fetch_parser.add_argument("--shard-size", type=int, default=5000, help="Papers per shard file")
+    sub.add_parser("consolidate")
+    args = parser.parse_args()
+
+    if args.command == "fetch":
+        fetch(args)
+    else:
+        consolidate(args)
@@ -1,9 +1,8 @@
-import torch
 import chromadb
 import os
-import tqdm
 from dotenv import load_dotenv
-from transformers import AutoTokenizer, AutoModel
+
+from ingest import Checkpoint, IngestionPipeline, ScibertEmbedder, collection_ids, content_hash, iter_collection, stamp_record
 
 abstract = """
 Generative Adversarial Networks (GANs) are a class of machine learning frameworks
@@ -20,9 +19,13 @@ CHROMA_API_KEY = os.getenv('CHROMA_API_KEY')
 CHROMA_HOST = os.getenv("CHROMA_HOST")
 print(CHROMA_API_KEY)
 
-tokenizer = AutoTokenizer.from_pretrained('allenai/scibert_scivocab_uncased')
-model = AutoModel.from_pretrained('allenai/scibert_scivocab_uncased')
-device = "cuda" if torch.cuda.is_available() else "cpu"
+# --- Batching Configuration ---
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))    # Texts per forward pass
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "500"))  # Records per collection.upsert call
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "pipeline.checkpoint.jsonl")  # Lets an interrupted run resume
+MODEL_NAME = 'allenai/scibert_scivocab_uncased'
+
+embedder = ScibertEmbedder(MODEL_NAME)
 
 
 # chromadb connection
@@ -35,47 +38,49 @@ client = chromadb.CloudClient(
 
 collection = client.get_collection('journal_db')
 
-def get_scibert_embedding(text):
-    inputs = tokenizer(text, return_tensors='pt', truncation=True, padding=True, max_length=512).to(device)
-    with torch.no_grad():
-        outputs = model(**inputs)
-        
-    last_hidden_states = outputs.last_hidden_state
-    attention_mask = inputs['attention_mask']
-    mask_expanded = attention_mask.unsqueeze(-1).expand(last_hidden_states.size()).float()
-    sum_embeddings = torch.sum(last_hidden_states * mask_expanded, 1)
-    sum_mask = torch.clamp(mask_expanded.sum(1), min=1e-9)
-    mean_pooled_embedding = sum_embeddings / sum_mask
-    return mean_pooled_embedding[0].cpu().numpy().tolist()
-
-results = collection.get(include=["metadatas", "documents"])
-print(f"Found {len(results['ids'])} journals to process.")
-
-for i in tqdm.tqdm(range(len(results['ids'])), desc="Processing Journals..."):
-    journal_id = results['ids'][i]
-    journal_metadata = results['metadatas'][i]
-    journal_document = results['documents'][i]
-
-    # You can reconstruct the text from the document or metadata
-    # Assuming the document is already in the format: "title: description"
-    text_to_embed = journal_document
-
-    # 3. Generate the new embedding
-    embedding = get_scibert_embedding(text_to_embed)
-
-    # 4. Upsert the data with the new embedding
-    # This updates the entry with the matching ID, adding the embedding.
-    # It will not erase other data or the database.
-    collection.upsert(
-        ids=[journal_id],
-        embeddings=[embedding],
-        documents=[journal_document], # Keep the original document
-        metadatas=[journal_metadata]  # Keep the original metadata
-    )
-
-print("\nEnrichment complete! All journals now have a vector embedding in the database.")
+skip_stats = {"unchanged": 0}
+
+def journal_records():
+    """
+    Streams journals that need (re-)embedding, paging through the collection
+    by the ids snapshotted before the pipeline starts upserting into it.
+
+    A journal is skipped when its stored embed_hash already matches its document
+    and the current model, so only new/edited rows or a model switch cost inference.
+    """
+    for journal_id, journal_metadata, journal_document in iter_collection(collection, ids=journal_ids):
+        if (journal_metadata or {}).get("embed_hash") == content_hash(journal_document, MODEL_NAME):
+            skip_stats["unchanged"] += 1
+            continue
+        # You can reconstruct the text from the document or metadata
+        # Assuming the document is already in the format: "title: description"
+        yield stamp_record({
+            "id": journal_id,
+            "text": journal_document,
+            "document": journal_document,   # Keep the original document
+            "metadata": journal_metadata,   # Keep the original metadata
+        }, MODEL_NAME)
+
+# Taken before any upsert, so the pages read below can't shift under the writes
+journal_ids = collection_ids(collection)
+print(f"Found {len(journal_ids)} journals to process.")
+
+# Read, embed (in length-sorted batches) and upsert (in large chunks) concurrently.
+# Upsert updates the entries with matching IDs, adding the embedding.
+# It will not erase other data or the database.
+pipeline = IngestionPipeline(
+    embedder,
+    collection,
+    embed_batch_size=EMBED_BATCH_SIZE,
+    upsert_batch_size=UPSERT_BATCH_SIZE,
+    # Invalidates the app's search-result cache after every upsert
+    bump_epoch=True,
+)
+summary = pipeline.run(journal_records(), checkpoint=Checkpoint(CHECKPOINT_PATH))
+
+print(f"\nEnrichment complete! {summary['records']} journals embedded at {summary['records_per_s']:.1f} journals/s "
+      f"({skip_stats['unchanged']} already up to date).")
 
 print("\n--- Verifying the data ---")
 count = collection.count()
 print(f"The collection now contains {count} items.")
-
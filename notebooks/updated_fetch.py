@@ -3,9 +3,8 @@ import chromadb
 import time
 import os
 from dotenv import load_dotenv
-from transformers import AutoTokenizer, AutoModel
-import tqdm
-import torch
+
+from ingest import Checkpoint, IngestionPipeline, ScibertEmbedder, changed_records
 
 load_dotenv()
 
@@ -27,7 +26,9 @@ COLLECTION_NAME = "journal_db"
 MODEL_NAME = 'allenai/scibert_scivocab_uncased'
 
 # --- Script Configuration ---
-BATCH_SIZE = 50  # Number of journals to process before upserting to ChromaDB
+EMBED_BATCH_SIZE = 32  # Number of journals embedded per forward pass
+BATCH_SIZE = 500  # Number of journals per upsert to ChromaDB
+CHECKPOINT_PATH = "updated_fetch.checkpoint.jsonl"  # Lets an interrupted run resume
 
 # ==============================================================================
 # --- 2. SETUP (MODELS, DATABASE CONNECTION) ---
@@ -36,49 +37,20 @@ BATCH_SIZE = 50  # Number of journals to process before upserting to ChromaDB
 print("Setting up models and database connection...")
 
 # --- Load SciBERT Model and Tokenizer ---
-print(f"Loading tokenizer and model: '{MODEL_NAME}'...")
-device = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"Using device: {device}")
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-model = AutoModel.from_pretrained(MODEL_NAME).to(device)
+embedder = ScibertEmbedder(MODEL_NAME)
 
 
 # ==============================================================================
-# --- 3. EMBEDDING FUNCTION ---
+# --- 3. JOURNAL SOURCE ---
 # ==============================================================================
 
-def get_scibert_embedding(text):
-    """Generates a SciBERT embedding for a single piece of text."""
-    inputs = tokenizer(text, return_tensors='pt', truncation=True, padding=True, max_length=512).to(device)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    
-    # Mean pooling
-    last_hidden_states = outputs.last_hidden_state
-    attention_mask = inputs['attention_mask']
-    mask_expanded = attention_mask.unsqueeze(-1).expand(last_hidden_states.size()).float()
-    sum_embeddings = torch.sum(last_hidden_states * mask_expanded, 1)
-    sum_mask = torch.clamp(mask_expanded.sum(1), min=1e-9)
-    mean_pooled_embedding = sum_embeddings / sum_mask
-    
-    # Return a flat list of floats
-    return mean_pooled_embedding[0].cpu().numpy().tolist()
-
-# ==============================================================================
-# --- 4. MAIN POPULATION LOGIC ---
-# ==============================================================================
-
-if __name__ == "__main__":
-    print("\n🚀 Starting the data population process...")
-
-    # Lists to hold data for batch upserting
-    ids_to_upsert = []
-    embeddings_to_upsert = []
-    documents_to_upsert = []
-    metadatas_to_upsert = []
-    
-    total_journals_processed = 0
+def journal_records():
+    """
+    Yields one record per journal, fetching from OpenAlex as it goes.
 
+    Runs on the pipeline's reader thread, so the next concept's journals are
+    being fetched while earlier ones are embedded and upserted.
+    """
     # --- Fetch Concepts from OpenAlex ---
     print("Fetching concepts from OpenAlex...")
     concepts = pyalex.Concepts().get(per_page=25) # Adjust as needed
@@ -97,7 +69,7 @@ if __name__ == "__main__":
             print("  -> No journals found for this concept. Skipping.")
             continue
 
-        for journal in tqdm.tqdm(journals, desc="  Processing Journals"):
+        for journal in journals:
             # --- a. Validate and Extract Data ---
             journal_id = journal.get('id', '').split('/')[-1]
             title = journal.get('display_name')
@@ -121,38 +93,32 @@ if __name__ == "__main__":
                 "2yr_mean_citedness": journal.get('summary_stats', {}).get('2yr_mean_citedness', 0.0),
             }
 
-            # --- c. Generate Embedding ---
-            embedding = get_scibert_embedding(text_to_embed)
-
-            # --- d. Add to Batch ---
-            ids_to_upsert.append(journal_id)
-            embeddings_to_upsert.append(embedding)
-            documents_to_upsert.append(text_to_embed)
-            metadatas_to_upsert.append(metadata)
-            total_journals_processed += 1
-
-            # --- e. Upsert Batch to ChromaDB when it's full ---
-            if len(ids_to_upsert) >= BATCH_SIZE:
-                print(f"\n  Upserting batch of {len(ids_to_upsert)} journals...")
-                collection.upsert(
-                    ids=ids_to_upsert,
-                    embeddings=embeddings_to_upsert,
-                    documents=documents_to_upsert,
-                    metadatas=metadatas_to_upsert
-                )
-                # Clear the batch lists
-                ids_to_upsert, embeddings_to_upsert, documents_to_upsert, metadatas_to_upsert = [], [], [], []
-    
-    # --- Upsert any remaining items in the final batch ---
-    if ids_to_upsert:
-        print(f"\n  Upserting final batch of {len(ids_to_upsert)} journals...")
-        collection.upsert(
-            ids=ids_to_upsert,
-            embeddings=embeddings_to_upsert,
-            documents=documents_to_upsert,
-            metadatas=metadatas_to_upsert
-        )
+            yield {"id": journal_id, "text": text_to_embed, "document": text_to_embed, "metadata": metadata}
+
+# ==============================================================================
+# --- 4. MAIN POPULATION LOGIC ---
+# ==============================================================================
+
+if __name__ == "__main__":
+    print("\n🚀 Starting the data population process...")
+
+    # Fetching, batched embedding and bulk upserts run as overlapping pipeline stages
+    pipeline = IngestionPipeline(
+        embedder,
+        collection,
+        embed_batch_size=EMBED_BATCH_SIZE,
+        upsert_batch_size=BATCH_SIZE,
+        # Invalidates the app's search-result cache after every upsert
+        bump_epoch=True,
+    )
+    # Only journals that are new, or whose text or model changed, are embedded again
+    diff_stats = {}
+    summary = pipeline.run(
+        changed_records(collection, journal_records(), MODEL_NAME, stats=diff_stats),
+        checkpoint=Checkpoint(CHECKPOINT_PATH),
+    )
 
     print("\n🏁 Population complete!")
-    print(f"  Total journals processed: {total_journals_processed}")
-    print(f"  The collection now contains {collection.count()} items.")
\ No newline at end of file
+    print(f"  Total journals processed: {summary['records']} ({summary['records_per_s']:.1f} journals/s)")
+    print(f"  Journals already up to date: {diff_stats.get('unchanged', 0)}")
+    print(f"  The collection now contains {collection.count()} items.")